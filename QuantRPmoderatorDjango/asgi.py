@@ -7,10 +7,65 @@ For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
 
+import asyncio
 import os
 
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'QuantRPmoderatorDjango.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from channels.auth import AuthMiddlewareStack  # noqa: E402  (після налаштування Django)
+from channels.routing import ProtocolTypeRouter, URLRouter  # noqa: E402
+from channels.security.websocket import AllowedHostsOriginValidator  # noqa: E402
+from django.conf import settings  # noqa: E402
+
+from moderator.async_runtime import runtime  # noqa: E402
+from moderator.cache import invalidation_bus  # noqa: E402
+from moderator.feed import DashboardFeed  # noqa: E402
+from moderator.routing import websocket_urlpatterns  # noqa: E402
+from startup import init_database, shutdown_database  # noqa: E402
+
+router = ProtocolTypeRouter({
+    'http': django_application,
+    'websocket': AllowedHostsOriginValidator(AuthMiddlewareStack(URLRouter(websocket_urlpatterns))),
+})
+
+
+async def lifespan(scope, receive, send):
+    # Django не обробляє lifespan: реєструємо loop сервера для async view,
+    # підписуємось на шину інвалідації кешів, запускаємо стрічку dashboard і закриваємо пули asyncpg/Redis цього loop при зупинці воркера
+    feed = feed_task = None
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            try:
+                runtime.server_loop = asyncio.get_running_loop()
+                invalidation_bus.ensure_started()
+                await init_database()
+                if getattr(settings, 'DASHBOARD_FEED_ENABLED', True):
+                    feed = DashboardFeed()
+                    feed_task = asyncio.create_task(feed.run())
+            except Exception as e:
+                await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                return
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            try:
+                if feed_task:
+                    feed.stop()
+                    await feed_task
+                await shutdown_database()
+            finally:
+                invalidation_bus.stop()
+                runtime.server_loop = None
+                await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(scope, receive, send)
+        return
+    await router(scope, receive, send)
@@ -1,5 +1,6 @@
 import os
 from pathlib import Path
+from urllib.parse import quote
 
 import redis
 from django.conf import settings
@@ -28,6 +29,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'corsheaders',
     'channels',
@@ -107,5 +109,90 @@ REDIS_HOST = config('REDIS_HOST', default='modern-molly-9075.upstash.io')
 REDIS_PORT = config('REDIS_PORT', default=6379, cast=int)
 REDIS_DB = config('REDIS_DB', default=0, cast=int)
 REDIS_PASSWORD = config('REDIS_PASSWORD', default='ASNzAAImcDE1MjBjNjY4OWEwNTc0M2NmOWFjYzc3OTM5ZGQ5NzZiZXAxOTA3NQ')
+REDIS_SSL = config('REDIS_SSL', default=True, cast=bool)
+# Розмір спільного пулу redis.asyncio (один пул на event loop / процес)
+REDIS_MAX_CONNECTIONS = config('REDIS_MAX_CONNECTIONS', default=20, cast=int)
+REDIS_HEALTH_CHECK_INTERVAL = config('REDIS_HEALTH_CHECK_INTERVAL', default=30, cast=int)
+
+# Черга модерації (Redis Streams)
+REDIS_QUEUE_STREAM = config('REDIS_QUEUE_STREAM', default='moderation_stream')
+REDIS_QUEUE_GROUP = config('REDIS_QUEUE_GROUP', default='moderation_workers')
+REDIS_QUEUE_MAXLEN = config('REDIS_QUEUE_MAXLEN', default=100000, cast=int)
+# Після стількох видач без XACK завдання переноситься в <REDIS_QUEUE_STREAM>:dead
+REDIS_QUEUE_MAX_DELIVERIES = config('REDIS_QUEUE_MAX_DELIVERIES', default=5, cast=int)
+# Вікно дедуплікації завдань (секунди): повтор тієї ж дії над тим же користувачем у чаті відкидається
+TASK_DEDUP_WINDOW = config('TASK_DEDUP_WINDOW', default=60, cast=int)
+
+# Обробники завдань для manage.py run_worker: {'ban': 'dotted.path.to.async_handler', ...}
+MODERATION_TASK_HANDLERS = {}
+
+# Token bucket перед викликами Telegram у run_worker (спільний для всіх воркерів, у Redis).
+# Швидкість — токенів за секунду; за замовчуванням ліміти Bot API: 30/с глобально, 20/хв на групу
+RATE_LIMIT_ENABLED = config('RATE_LIMIT_ENABLED', default=True, cast=bool)
+RATE_LIMIT_GLOBAL_RATE = config('RATE_LIMIT_GLOBAL_RATE', default=30.0, cast=float)
+RATE_LIMIT_GLOBAL_BURST = config('RATE_LIMIT_GLOBAL_BURST', default=30, cast=int)
+RATE_LIMIT_CHAT_RATE = config('RATE_LIMIT_CHAT_RATE', default=20 / 60, cast=float)
+RATE_LIMIT_CHAT_BURST = config('RATE_LIMIT_CHAT_BURST', default=20, cast=int)
+
+# Скільки днів зберігати HyperLogLog-лічильники унікальних порушників
+OFFENDERS_HLL_TTL_DAYS = config('OFFENDERS_HLL_TTL_DAYS', default=400, cast=int)
+
+# TTL лічильників dashboard у Redis; після нього вони перераховуються з БД
+COUNTERS_TTL = config('COUNTERS_TTL', default=3600, cast=int)
+
+# Жива стрічка dashboard (WebSocket ws/dashboard/): період розсилки кадрів (с),
+# максимум покарань у кадрі і розмір буфера подій у Redis
+DASHBOARD_FEED_ENABLED = config('DASHBOARD_FEED_ENABLED', default=True, cast=bool)
+DASHBOARD_FEED_TICK = config('DASHBOARD_FEED_TICK', default=1.0, cast=float)
+DASHBOARD_FEED_MAX_EVENTS = config('DASHBOARD_FEED_MAX_EVENTS', default=200, cast=int)
+DASHBOARD_FEED_BUFFER = config('DASHBOARD_FEED_BUFFER', default=1000, cast=int)
+
+# Channels: шар каналів у тому ж Redis, що й черга
+ASGI_APPLICATION = 'QuantRPmoderatorDjango.asgi.application'
+CHANNEL_LAYERS = {
+    'default': {
+        'BACKEND': 'channels_redis.core.RedisChannelLayer',
+        'CONFIG': {
+            'hosts': [config('CHANNEL_LAYER_URL', default='{scheme}://:{password}@{host}:{port}/{db}'.format(
+                scheme='rediss' if REDIS_SSL else 'redis',
+                password=quote(REDIS_PASSWORD or '', safe=''),
+                host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB,
+            ))],
+            'prefix': 'channels',
+            'capacity': 200,
+            'expiry': 30,
+        },
+    },
+}
+
+# Пакетний статус користувачів (get_status_bulk): TTL кешу в Redis і ліміт користувачів на запит
+STATUS_CACHE_TTL = config('STATUS_CACHE_TTL', default=30, cast=int)
+STATUS_BULK_MAX_USERS = config('STATUS_BULK_MAX_USERS', default=500, cast=int)
+
+# TTL in-process кешу мап модераторів і назв чатів (секунди)
+LOOKUP_CACHE_TTL = config('LOOKUP_CACHE_TTL', default=60, cast=int)
+# Шина інвалідації кешів між процесами (Redis pub/sub). Поки процес підписаний,
+# записи живуть LOOKUP_CACHE_SUBSCRIBED_TTL, бо зміни приходять повідомленням
+CACHE_INVALIDATION_BUS = config('CACHE_INVALIDATION_BUS', default=True, cast=bool)
+CACHE_INVALIDATION_CHANNEL = config('CACHE_INVALIDATION_CHANNEL', default='cache:invalidate')
+CACHE_VERSIONS_KEY = config('CACHE_VERSIONS_KEY', default='cache:versions')
+LOOKUP_CACHE_SUBSCRIBED_TTL = config('LOOKUP_CACHE_SUBSCRIBED_TTL', default=3600, cast=int)
+
+# Бюджет часу запиту автодоповнення користувачів (statement_timeout, мс)
+AUTOCOMPLETE_BUDGET_MS = config('AUTOCOMPLETE_BUDGET_MS', default=100, cast=int)
+
+# Максимальна кількість дій в одному запиті api/moderation/bulk/
+BULK_MODERATION_MAX_ACTIONS = config('BULK_MODERATION_MAX_ACTIONS', default=1000, cast=int)
+
+# Створювати індекси на таблицях бота (punishments тощо) міграцією 0007.
+# Вимкнено за замовчуванням: таблиці належать боту; можна також manage.py bot_indexes
+MANAGE_BOT_TABLE_INDEXES = config('MANAGE_BOT_TABLE_INDEXES', default=False, cast=bool)
+
+# Помісячні партиції punishments (manage.py partition_punishments, запускати щодня з cron)
+PUNISHMENTS_PARTITION_MONTHS_AHEAD = config('PUNISHMENTS_PARTITION_MONTHS_AHEAD', default=3, cast=int)
+# Скільки місяців тримати партиції приєднаними; 0 — без обмеження
+PUNISHMENTS_RETENTION_MONTHS = config('PUNISHMENTS_RETENTION_MONTHS', default=0, cast=int)
+# Куди переносити від'єднані партиції; порожнє значення — видаляти їх
+PUNISHMENTS_ARCHIVE_SCHEMA = config('PUNISHMENTS_ARCHIVE_SCHEMA', default='archive')
 
 asyncio.get_event_loop().run_until_complete(init_database())
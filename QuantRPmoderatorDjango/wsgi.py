@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'QuantRPmoderatorDjango.settings')
 
 application = get_wsgi_application()
+
+# Веб-воркер слухає шину інвалідації кешів; команди й міграції її не запускають
+from moderator.cache import invalidation_bus  # noqa: E402  (після налаштування Django)
+
+invalidation_bus.ensure_started()
@@ -3,6 +3,9 @@ from django.contrib import messages
 from django.contrib.auth.models import User
 from django.contrib.auth.decorators import user_passes_test
 from .models import Moderator
+from .database import db_manager
+from .async_runtime import run_async
+from .cache import invalidate_moderators
 import random
 import string
 
@@ -55,6 +58,9 @@ def create_moderator(request):
         # Створення модератора в таблиці модераторів
         moderator = Moderator(user_id=user_id, username=username)
         moderator.save()
+        run_async(db_manager.adjust_counters(total_moderators=1))
+        invalidate_moderators()
+        run_async(db_manager.invalidate_status(moderators=[int(user_id)]))
 
         # Створення облікового запису Django для модератора, якщо потрібно
         if create_django_user:
@@ -91,6 +97,9 @@ def delete_moderator(request, user_id):
 
         # Видалення модератора з таблиці модераторів
         moderator.delete()
+        run_async(db_manager.adjust_counters(total_moderators=-1))
+        invalidate_moderators()
+        run_async(db_manager.invalidate_status(moderators=[moderator.user_id]))
 
         # Спроба видалити відповідний обліковий запис Django
         try:
@@ -0,0 +1,151 @@
+import asyncio
+import atexit
+import os
+import threading
+from typing import Any, AsyncIterator, Awaitable, Iterator, Optional, Union
+import logging
+logger = logging.getLogger(__name__)
+
+
+class AsyncRuntime:
+    """Довгоживучий event loop у фоновому потоці (один на процес воркера).
+
+    Синхронні view відправляють корутини сюди замість створення нового loop
+    на кожен запит, тому пули asyncpg (ключовані по loop) створюються один раз.
+    Під ASGI lifespan реєструє loop сервера (server_loop): async view там
+    чекають db_manager напряму, без переходу між потоками.
+    """
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.server_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _start(self) -> asyncio.AbstractEventLoop:
+        loop = asyncio.new_event_loop()
+        ready = threading.Event()
+
+        def _run():
+            asyncio.set_event_loop(loop)
+            loop.call_soon(ready.set)
+            loop.run_forever()
+
+        thread = threading.Thread(target=_run, name='moderator-async-runtime', daemon=True)
+        thread.start()
+        ready.wait()
+
+        self._loop = loop
+        self._thread = thread
+        self._pid = os.getpid()
+        logger.info("Async runtime started in pid %s", self._pid)
+        return loop
+
+    def get_loop(self) -> asyncio.AbstractEventLoop:
+        # Після fork (gunicorn preload) потік батьківського процесу не існує —
+        # тоді піднімаємо новий loop у дочірньому процесі.
+        loop = self._loop
+        if loop is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return loop
+        with self._lock:
+            if self._loop is None or self._pid != os.getpid() or not self._thread.is_alive():
+                return self._start()
+            return self._loop
+
+    def run(self, coro: Awaitable[Any], timeout: Optional[float] = None) -> Any:
+        """Виконує корутину у фоновому loop і блокує поточний потік до результату"""
+        loop = self.get_loop()
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            raise RuntimeError("AsyncRuntime.run() cannot be called from the runtime loop itself")
+        future = asyncio.run_coroutine_threadsafe(coro, loop)
+        return future.result(timeout)
+
+    async def call(self, coro: Awaitable[Any]) -> Any:
+        """await корутини з async view у loop, де пули живуть довго.
+
+        На loop сервера (uvicorn) або самого runtime — напряму. Під WSGI Django
+        виконує async view у тимчасовому loop на кожен запит: там пул створювався б
+        заново, тому корутина передається у фоновий loop runtime.
+        """
+        running = asyncio.get_running_loop()
+        if running is self.server_loop or running is self._loop:
+            return await coro
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, self.get_loop()))
+
+    def shutdown(self, timeout: float = 5.0):
+        """Закриває пули і зупиняє фоновий loop"""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            if loop is None or self._pid != os.getpid() or not thread.is_alive():
+                self._loop = None
+                return
+            from startup import shutdown_database
+            try:
+                asyncio.run_coroutine_threadsafe(shutdown_database(), loop).result(timeout)
+            except Exception as e:
+                logger.warning(f"Error while closing pools: {e}")
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join(timeout)
+            loop.close()
+            self._loop = None
+            self._thread = None
+
+
+# Глобальний екземпляр
+runtime = AsyncRuntime()
+
+
+def run_async(coro: Awaitable[Any], timeout: Optional[float] = None) -> Any:
+    """Синхронний міст: run_async(db_manager.add_ban(...))"""
+    return runtime.run(coro, timeout)
+
+
+async def call_async(coro: Awaitable[Any]) -> Any:
+    """Асинхронний міст для async view: await call_async(db_manager.apply_ban(...))"""
+    return await runtime.call(coro)
+
+
+_EXHAUSTED = object()
+
+
+async def _anext(agen):
+    try:
+        return await agen.__anext__()
+    except StopAsyncIteration:
+        return _EXHAUSTED
+
+
+def iterate_async(agen: AsyncIterator[Any], timeout: Optional[float] = None) -> Iterator[Any]:
+    """Синхронний ітератор над async-генератором, що виконується у фоновому loop.
+
+    Потрібен для StreamingHttpResponse у sync view. Якщо споживач зупиняється раніше
+    (клієнт відключився), генератор закривається і звільняє з'єднання.
+    """
+    try:
+        while True:
+            item = runtime.run(_anext(agen), timeout)
+            if item is _EXHAUSTED:
+                return
+            yield item
+    finally:
+        runtime.run(agen.aclose(), timeout)
+
+
+def stream_async(agen: AsyncIterator[Any]) -> Union[AsyncIterator[Any], Iterator[Any]]:
+    """Ітератор для StreamingHttpResponse, повернутої з async view.
+
+    Під ASGI (loop сервера) — сам async-генератор: Django віддає його частинами.
+    Під WSGI Django збирав би async-ітератор у список, тому генератор
+    виконується у фоновому loop і читається синхронно через iterate_async.
+    """
+    if asyncio.get_running_loop() is runtime.server_loop:
+        return agen
+    return iterate_async(agen)
+
+
+atexit.register(runtime.shutdown)
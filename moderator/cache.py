@@ -0,0 +1,281 @@
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+import logging
+logger = logging.getLogger(__name__)
+
+
+class LookupCache:
+    """Версіонований in-process кеш невеликих мап (модератори, назви чатів) з TTL.
+
+    invalidate() збільшує версію ключа; результат завантаження, що почалося
+    до інвалідації, не потрапляє в кеш, тож застарілі дані не "воскресають".
+    Поки процес підписаний на шину інвалідації (subscribed), діє довгий
+    subscribed_ttl, інакше — звичайний ttl.
+    """
+
+    def __init__(self, ttl: float, subscribed_ttl: Optional[float] = None):
+        self.ttl = ttl
+        self.subscribed_ttl = subscribed_ttl or ttl
+        self.subscribed = False
+        self._loaders: Dict[str, Callable[[], Any]] = {}
+        self._entries: Dict[str, tuple] = {}
+        self._versions: Dict[str, int] = {}
+        self._hits: Dict[str, int] = {}
+        self._misses: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, loader: Callable[[], Any]):
+        self._loaders[name] = loader
+        self._versions.setdefault(name, 0)
+        self._hits.setdefault(name, 0)
+        self._misses.setdefault(name, 0)
+
+    def get(self, name: str) -> Any:
+        # TTL рахується від часу завантаження: після втрати підписки записи,
+        # збережені з довгим TTL, одразу старіють за коротким
+        ttl = self.subscribed_ttl if self.subscribed else self.ttl
+        with self._lock:
+            entry = self._entries.get(name)
+            version = self._versions[name]
+            if entry is not None and entry[0] == version and entry[1] + ttl > time.monotonic():
+                self._hits[name] += 1
+                return entry[2]
+            self._misses[name] += 1
+
+        # Завантаження поза lock: запит у БД не блокує інші ключі
+        value = self._loaders[name]()
+        with self._lock:
+            if self._versions[name] == version:
+                self._entries[name] = (version, time.monotonic(), value)
+        return value
+
+    def invalidate(self, *names: str):
+        with self._lock:
+            for name in names:
+                if name not in self._loaders:
+                    # Ключі інших процесів (напр. chat_settings:{id} бота) тут не кешуються
+                    continue
+                self._versions[name] += 1
+                self._entries.pop(name, None)
+
+    def invalidate_all(self):
+        self.invalidate(*self._loaders)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {
+                name: {
+                    'hits': self._hits[name],
+                    'misses': self._misses[name],
+                    'version': self._versions[name],
+                }
+                for name in self._loaders
+            }
+
+
+def _load_moderator_map() -> Dict[int, str]:
+    from .models import Moderator
+    return {
+        user_id: (username if username else str(user_id))
+        for user_id, username in Moderator.objects.values_list('user_id', 'username')
+    }
+
+
+def _load_moderator_ids() -> FrozenSet[int]:
+    from .models import Moderator
+    return frozenset(Moderator.objects.values_list('user_id', flat=True))
+
+
+def _load_chat_titles() -> Dict[str, str]:
+    from .models import ChatSetting
+    return {str(chat_id): title for chat_id, title in ChatSetting.objects.values_list('chat_id', 'chat_title')}
+
+
+# Lua: атомарно збільшує версії ключів у хеші і публікує їх одним повідомленням.
+# KEYS: [хеш версій, канал]; ARGV: [origin, ім'я ключа...]
+PUBLISH_INVALIDATION = """
+local versions = {}
+for i = 2, #ARGV do
+    versions[ARGV[i]] = redis.call('HINCRBY', KEYS[1], ARGV[i], 1)
+end
+redis.call('PUBLISH', KEYS[2], cjson.encode({origin = ARGV[1], versions = versions}))
+return #ARGV - 1
+"""
+
+MODERATOR_CACHES = ('moderator_map', 'moderator_ids')
+CHAT_CACHES = ('chat_titles',)
+
+
+def chat_settings_key(chat_id: int) -> str:
+    """Ключ налаштувань одного чату (filter_enabled), на який підписується кеш бота"""
+    return f"chat_settings:{chat_id}"
+
+
+class InvalidationBus:
+    """Шина інвалідації локальних кешів між процесами через Redis pub/sub.
+
+    Кожен запис налаштувань чи модераторів публікує в CACHE_INVALIDATION_CHANNEL
+    повідомлення {"origin": ..., "versions": {ключ: версія}}; версії зберігаються
+    в хеші CACHE_VERSIONS_KEY. Веб-процеси (wsgi.py, lifespan в asgi.py) явно
+    запускають ensure_started() і слухають канал у фоновому потоці, викидаючи ці
+    ключі зі свого кешу; решта процесів (команди, міграції, тести) не підписуються
+    і живуть з коротким TTL. Pub/sub не гарантує
+    доставку, тож після (пере)підключення процес звіряє хеш версій і викидає
+    все, що змінилося, поки він не слухав.
+    """
+
+    def __init__(self, cache: LookupCache, channel: str, versions_key: str):
+        self.cache = cache
+        self.channel = channel
+        self.versions_key = versions_key
+        self._seen: Dict[str, int] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._publisher = None
+        self._fork_hook = False
+        self.received = 0
+        self.published = 0
+
+    @property
+    def origin(self) -> str:
+        # pid, а не значення з __init__: gunicorn з --preload форкає вже імпортований модуль
+        return f"{os.uname().nodename}:{os.getpid()}"
+
+    def script_args(self, names: Iterable[str]) -> Tuple[List[str], List[str]]:
+        return [self.versions_key, self.channel], [self.origin, *names]
+
+    def publish(self, *names: str):
+        """Інвалідує ключі локально й у всіх підписаних процесах. Помилки Redis не ламають запис"""
+        self.cache.invalidate(*names)
+        try:
+            if self._publisher is None or self._publisher[0] != os.getpid():
+                self._publisher = (os.getpid(), self._client())
+            keys, args = self.script_args(names)
+            self._publisher[1].eval(PUBLISH_INVALIDATION, len(keys), *keys, *args)
+            self.published += 1
+        except Exception as e:
+            logger.warning(f"Failed to publish cache invalidation {names}: {e}")
+
+    def _client(self):
+        from .database import db_manager
+        return db_manager.create_sync_redis(max_connections=2, health_check_interval=0,
+                                            socket_connect_timeout=5)
+
+    def ensure_started(self):
+        """Запускає потік-підписник у поточному процесі (ідемпотентно)"""
+        if not getattr(settings, 'CACHE_INVALIDATION_BUS', True):
+            return
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid == pid:
+                return
+            if not self._fork_hook:
+                # gunicorn --preload: wsgi.py імпортується в master, а потік батька
+                # після fork не існує — дочірній процес стартує власний
+                os.register_at_fork(after_in_child=self._restart_after_fork)
+                self._fork_hook = True
+            self._pid = pid
+            self._stop.clear()
+            self.cache.subscribed = False
+            self._thread = threading.Thread(target=self._run, name='cache-invalidation', daemon=True)
+            self._thread.start()
+
+    def _restart_after_fork(self):
+        self._lock = threading.Lock()
+        if self._pid is not None and not self._stop.is_set():
+            self.ensure_started()
+
+    def stop(self):
+        self._stop.set()
+
+    def _apply(self, versions: Dict[str, int], origin: Optional[str] = None):
+        stale = []
+        for name, version in versions.items():
+            version = int(version)
+            if version > self._seen.get(name, 0):
+                self._seen[name] = version
+                stale.append(name)
+        if stale and origin != self.origin:
+            self.cache.invalidate(*stale)
+
+    def _run(self):
+        delay = 1.0
+        while not self._stop.is_set():
+            client = pubsub = None
+            try:
+                client = self._client()
+                pubsub = client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                # Підписка вже діє, тож зміни між HGETALL і першим повідомленням не загубляться
+                self._apply(client.hgetall(self.versions_key))
+                if not self.cache.subscribed:
+                    self.cache.invalidate_all()
+                self.cache.subscribed = True
+                delay = 1.0
+                while not self._stop.is_set():
+                    message = pubsub.get_message(timeout=1.0)
+                    if message and message['type'] == 'message':
+                        payload = json.loads(message['data'])
+                        self.received += 1
+                        self._apply(payload.get('versions') or {}, payload.get('origin'))
+            except Exception as e:
+                self.cache.subscribed = False
+                logger.warning(f"Cache invalidation bus disconnected: {e}; retrying in {delay:.0f}s")
+                self._stop.wait(delay)
+                delay = min(delay * 2, 60.0)
+            finally:
+                for resource in (pubsub, client):
+                    try:
+                        if resource is not None:
+                            resource.close()
+                    except Exception:
+                        pass
+        self.cache.subscribed = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'subscribed': self.cache.subscribed,
+            'received': self.received,
+            'published': self.published,
+            'versions': dict(self._seen),
+        }
+
+
+# Глобальний екземпляр
+lookup_cache = LookupCache(ttl=getattr(settings, 'LOOKUP_CACHE_TTL', 60),
+                           subscribed_ttl=getattr(settings, 'LOOKUP_CACHE_SUBSCRIBED_TTL', 3600))
+lookup_cache.register('moderator_map', _load_moderator_map)
+lookup_cache.register('moderator_ids', _load_moderator_ids)
+lookup_cache.register('chat_titles', _load_chat_titles)
+invalidation_bus = InvalidationBus(lookup_cache,
+                                   channel=getattr(settings, 'CACHE_INVALIDATION_CHANNEL', 'cache:invalidate'),
+                                   versions_key=getattr(settings, 'CACHE_VERSIONS_KEY', 'cache:versions'))
+
+
+def get_moderator_map() -> Dict[int, str]:
+    return lookup_cache.get('moderator_map')
+
+
+def get_moderator_ids() -> FrozenSet[int]:
+    return lookup_cache.get('moderator_ids')
+
+
+def get_chat_titles() -> Dict[str, str]:
+    return lookup_cache.get('chat_titles')
+
+
+def invalidate_moderators():
+    invalidation_bus.publish(*MODERATOR_CACHES)
+
+
+def invalidate_chats(chat_ids: Iterable[int] = ()):
+    invalidation_bus.publish(*CHAT_CACHES, *(chat_settings_key(chat_id) for chat_id in chat_ids))
@@ -0,0 +1,36 @@
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+
+from .feed import DASHBOARD_GROUP, DashboardFeed
+import logging
+logger = logging.getLogger(__name__)
+
+
+class DashboardConsumer(AsyncJsonWebsocketConsumer):
+    """WebSocket живої стрічки dashboard.
+
+    Клієнт лише отримує кадри: {"punishments": [...], "counters": {...}, "queue_depth": N}
+    (кожне поле — лише якщо змінилося). Кадри формує DashboardFeed, тож з'єднання
+    не робить запитів у БД, крім початкового знімка лічильників з Redis.
+    """
+
+    async def connect(self):
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated:
+            await self.close()
+            return
+        await self.channel_layer.group_add(DASHBOARD_GROUP, self.channel_name)
+        await self.accept()
+        try:
+            await self.send_json(await DashboardFeed.snapshot())
+        except Exception as e:
+            logger.warning(f"Dashboard snapshot failed: {e}")
+
+    async def disconnect(self, code):
+        await self.channel_layer.group_discard(DASHBOARD_GROUP, self.channel_name)
+
+    async def receive_json(self, content, **kwargs):
+        # Канал односпрямований: повідомлення від клієнта ігноруються
+        pass
+
+    async def dashboard_frame(self, event):
+        await self.send_json(event['frame'])
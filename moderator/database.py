@@ -1,16 +1,53 @@
 import asyncio
 import asyncpg
+import os
 import ssl
 import certifi
 import weakref
 import redis
+import redis.asyncio as aioredis
 import json
+import time
 from django.conf import settings
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple, Callable
 from dataclasses import dataclass
+from datetime import date, timedelta
+from django.utils import timezone
+from .async_runtime import run_async
+from .cache import (CHAT_CACHES, MODERATOR_CACHES, PUBLISH_INVALIDATION, chat_settings_key,
+                    invalidation_bus, lookup_cache)
 import logging
 logger = logging.getLogger(__name__)
 
+# Старий Redis-список, з якого migrate_legacy_queue переносить завдання у стрім
+LEGACY_QUEUE_KEY = 'moderation_queue'
+
+# Добовий підсумок оновлюється в тому ж SQL-операторі, що й вставка в punishments.
+# Очікує CTE "p" з RETURNING timestamp, chat_id, punishment_type, moderator_id.
+DAILY_STATS_CTE = """, stat AS (
+    INSERT INTO punishment_daily_stats (date, chat_id, punishment_type, moderator_id, count)
+    SELECT DATE(p.timestamp), p.chat_id, p.punishment_type, COALESCE(p.moderator_id, 0), 1 FROM p
+    ON CONFLICT (date, chat_id, punishment_type, moderator_id)
+    DO UPDATE SET count = punishment_daily_stats.count + 1
+)"""
+PUNISHMENT_RETURNING = "RETURNING id, timestamp, chat_id, punishment_type, moderator_id"
+
+# Upsert стану мута: повторний мут переписує строк і посилання на новий запис punishments
+ACTIVE_MUTE_UPSERT = """INSERT INTO active_sanctions (user_id, chat_id, sanction_type, expires_at,
+                                                 punishment_id, moderator_id, created_at)"""
+ACTIVE_MUTE_CONFLICT = """ON CONFLICT (user_id, chat_id, sanction_type) DO UPDATE
+                       SET expires_at = EXCLUDED.expires_at, punishment_id = EXCLUDED.punishment_id,
+                           moderator_id = EXCLUDED.moderator_id, created_at = EXCLUDED.created_at"""
+
+# Redis ZSET з часом закінчення строкових санкцій: member "{type}:{chat_id}:{user_id}", score — unix time
+SANCTIONS_EXPIRY_KEY = 'sanctions:expiry'
+
+# Буфер нових покарань для живої стрічки dashboard (читає moderator.feed.DashboardFeed)
+DASHBOARD_EVENTS_KEY = 'dashboard:events'
+
+# Має точно збігатися з виразом GIN-індексу punishments_reason_fts (міграція 0006)
+REASON_TSVECTOR = "to_tsvector('simple', coalesce(p.reason, ''))"
+
 @dataclass
 class ModerationTask:
     task_type: str  # 'ban', 'kick', 'mute', 'warn'
@@ -22,18 +59,20 @@ class ModerationTask:
     duration_minutes: Optional[int] = None
 
 class DatabaseManager:
-    def __init__(self):
+    def __init__(self, redis_url: Optional[str] = None):
         self._pools = weakref.WeakKeyDictionary()
-        self._lock = asyncio.Lock()
-        self.redis_client = redis.Redis(
-            host=getattr(settings, 'REDIS_HOST', 'modern-molly-9075.upstash.io'),
-            port=getattr(settings, 'REDIS_PORT', 6379),
-            db=getattr(settings, 'REDIS_DB', 0),
-            password=getattr(settings, 'REDIS_PASSWORD',
-                             'ASNzAAImcDE1MjBjNjY4OWEwNTc0M2NmOWFjYzc3OTM5ZGQ5NzZiZXAxOTA3NQ'),
-            decode_responses=True,
-            ssl=True
-        )
+        self._locks = weakref.WeakKeyDictionary()
+        self._redis_clients = weakref.WeakKeyDictionary()
+        self._sync_redis: Optional[redis.Redis] = None
+        self._sync_redis_pid: Optional[int] = None
+        self.redis_url = redis_url
+        self.queue_stream = getattr(settings, 'REDIS_QUEUE_STREAM', 'moderation_stream')
+        self.queue_group = getattr(settings, 'REDIS_QUEUE_GROUP', 'moderation_workers')
+        self.queue_maxlen = getattr(settings, 'REDIS_QUEUE_MAXLEN', 100000)
+        self._group_ready = weakref.WeakKeyDictionary()
+        # Колбеки asyncpg query logger (напр. перевірка планів у тестах); підключаються
+        # до нових з'єднань пулу, тож реєструйте їх до першого запиту або після close_all()
+        self.query_observers: List[Callable[[Any], None]] = []
 
     async def _create_pool(self) -> asyncpg.Pool:
         ssl_context = None
@@ -54,65 +93,590 @@ class DatabaseManager:
             ssl=ssl_context if settings.DATABASES['default']['OPTIONS'].get('sslmode') == 'require' else None,
             min_size=1,
             max_size=10,
+            init=self._init_connection,
         )
 
+    async def _init_connection(self, conn: asyncpg.Connection):
+        for observer in self.query_observers:
+            conn.add_query_logger(observer)
+
     async def get_pool(self) -> asyncpg.Pool:
         loop = asyncio.get_running_loop()
         pool = self._pools.get(loop)
         if pool is None:
-            async with self._lock:
+            # asyncio.Lock прив'язується до loop, тому lock теж окремий на кожен loop
+            lock = self._locks.setdefault(loop, asyncio.Lock())
+            async with lock:
                 pool = self._pools.get(loop)
                 if pool is None:
                     pool = await self._create_pool()
                     self._pools[loop] = pool
         return pool
 
+    def _create_redis(self, client_class=aioredis.Redis, **overrides):
+        # Один клієнт (і один пул з'єднань) на event loop, як і для asyncpg
+        options = dict(
+            decode_responses=True,
+            max_connections=getattr(settings, 'REDIS_MAX_CONNECTIONS', 20),
+            socket_keepalive=True,
+            health_check_interval=getattr(settings, 'REDIS_HEALTH_CHECK_INTERVAL', 30),
+        )
+        options.update(overrides)
+        if self.redis_url:
+            return client_class.from_url(self.redis_url, **options)
+        return client_class(
+            host=getattr(settings, 'REDIS_HOST', 'modern-molly-9075.upstash.io'),
+            port=getattr(settings, 'REDIS_PORT', 6379),
+            db=getattr(settings, 'REDIS_DB', 0),
+            password=getattr(settings, 'REDIS_PASSWORD',
+                             'ASNzAAImcDE1MjBjNjY4OWEwNTc0M2NmOWFjYzc3OTM5ZGQ5NzZiZXAxOTA3NQ'),
+            ssl=getattr(settings, 'REDIS_SSL', True),
+            **options
+        )
+
+    def create_sync_redis(self, **overrides) -> redis.Redis:
+        """Синхронний клієнт з тими ж налаштуваннями (для потоків поза event loop)"""
+        return self._create_redis(redis.Redis, **overrides)
+
+    @property
+    def redis_client(self) -> redis.Redis:
+        """Синхронний клієнт Redis (як у попередньому API), один на процес"""
+        if self._sync_redis is None or self._sync_redis_pid != os.getpid():
+            self._sync_redis = self.create_sync_redis()
+            self._sync_redis_pid = os.getpid()
+        return self._sync_redis
+
+    def get_redis(self) -> aioredis.Redis:
+        # Клієнт створюється синхронно і з'єднується ліниво, тому lock не потрібен
+        loop = asyncio.get_running_loop()
+        client = self._redis_clients.get(loop)
+        if client is None:
+            client = self._create_redis()
+            self._redis_clients[loop] = client
+        return client
+
     async def close_all(self):
-        for pool in list(self._pools.values()):
+        """Закриває пул і Redis-клієнт поточного event loop.
+
+        Ресурси інших loop (напр. фонового AsyncRuntime поруч із loop сервера ASGI)
+        закриваються з їхніх власних loop: asyncpg не дозволяє закрити пул з чужого.
+        """
+        loop = asyncio.get_running_loop()
+        pool = self._pools.pop(loop, None)
+        if pool is not None:
             try:
                 await pool.close()
             except Exception:
                 pass
-        self._pools.clear()
+        client = self._redis_clients.pop(loop, None)
+        if client is not None:
+            try:
+                await client.connection_pool.disconnect()
+            except Exception:
+                pass
+
+    # --- Redis QUEUE methods (Redis Streams + consumer group) ---
+    # Продюсер робить XADD, воркери читають пакетами через XREADGROUP.
+    # Запис лишається в PEL до XACK, тож якщо воркер впав після читання,
+    # інший воркер забере завдання через claim_stale_tasks (XAUTOCLAIM).
+    #
+    # Пріоритетні смуги: окремий стрім на кожну смугу (QUEUE_LANES), read_tasks
+    # спершу вичерпує high, потім normal, потім low — бан не чекає за тисячами варнів.
+    # Смуга normal — це сам queue_stream, тож записи, додані до появи смуг, не губляться.
+    # ID записів, які повертає read_tasks, мають вигляд "<смуга>:<ID стріму>".
+    QUEUE_LANES = ('high', 'normal', 'low')
+    TASK_LANES = {
+        'ban': 'high', 'kick': 'high', 'unban': 'high',
+        'mute': 'normal', 'unmute': 'normal',
+        'warn': 'low', 'unwarn': 'low',
+    }
+
+    def lane_stream(self, lane: str) -> str:
+        return self.queue_stream if lane == 'normal' else f"{self.queue_stream}:{lane}"
+
+    def _lane_of(self, task: ModerationTask) -> str:
+        return self.TASK_LANES.get(task.task_type, 'normal')
+
+    @staticmethod
+    def _split_entry_id(entry_id: str) -> Tuple[str, str]:
+        lane, _, stream_id = entry_id.rpartition(':')
+        return lane or 'normal', stream_id
+
+    def _group_by_lane(self, entry_ids: List[str]) -> Dict[str, List[str]]:
+        by_lane: Dict[str, List[str]] = {}
+        for entry_id in entry_ids:
+            lane, stream_id = self._split_entry_id(entry_id)
+            by_lane.setdefault(lane, []).append(stream_id)
+        return by_lane
+
+    def _encode_task(self, task: ModerationTask) -> Dict[str, str]:
+        return {'task': json.dumps(task.__dict__)}
+
+    async def _decode_entries(self, entries, lane: str = 'normal') -> List[Tuple[str, ModerationTask]]:
+        tasks = []
+        malformed = []
+        for entry_id, fields in entries:
+            entry_id = f"{lane}:{entry_id}"
+            # XAUTOCLAIM повертає None для записів, які вже видалені зі стріму
+            if not fields:
+                continue
+            try:
+                tasks.append((entry_id, ModerationTask(**json.loads(fields['task']))))
+            except (KeyError, TypeError, ValueError) as e:
+                logger.error(f"Dropping malformed queue entry {entry_id}: {e}")
+                malformed.append(entry_id)
+        await self.ack_tasks(malformed)
+        return tasks
+
+    async def _ensure_group(self, client: aioredis.Redis):
+        loop = asyncio.get_running_loop()
+        if self._group_ready.get(loop):
+            return
+        for lane in self.QUEUE_LANES:
+            try:
+                await client.xgroup_create(self.lane_stream(lane), self.queue_group, id='0', mkstream=True)
+            except redis.ResponseError as e:
+                if 'BUSYGROUP' not in str(e):
+                    raise
+        self._group_ready[loop] = True
+
+    # --- Ідемпотентність: SET NX з TTL вікна дедуплікації ---
+    # Ключ ідемпотентності — (дія, чат, користувач); вікно — це TTL ключа, а не номер
+    # інтервалу в ключі, тож дубль, що потрапив на межу інтервалів, теж відсікається.
+    # Зворотна дія (unban після ban) знімає ключ прямої, щоб повторний бан після
+    # розбану пройшов. Якщо Redis недоступний, завдання пропускаються: дубль краще
+    # за втрачену дію.
+    INVERSE_TASKS = {
+        'ban': 'unban', 'unban': 'ban',
+        'mute': 'unmute', 'unmute': 'mute',
+        'warn': 'unwarn', 'unwarn': 'warn',
+    }
+
+    # KEYS: [dedup, inverse dedup]; ARGV: [window]
+    _CLAIM_TASK = """
+        if redis.call('SET', KEYS[1], 1, 'NX', 'EX', ARGV[1]) then
+            redis.call('DEL', KEYS[2])
+            return 1
+        end
+        return 0
+    """
+
+    @staticmethod
+    def _dedup_key(task_type: str, chat_id: int, user_id: int) -> str:
+        return f"dedup:{task_type}:{chat_id}:{user_id}"
+
+    async def claim_tasks(self, tasks: List[ModerationTask], window: Optional[int] = None) -> List[bool]:
+        """Для кожного завдання: True — перше у вікні, False — дубль"""
+        if not tasks:
+            return []
+        window = window or getattr(settings, 'TASK_DEDUP_WINDOW', 60)
+        try:
+            async with self.get_redis().pipeline(transaction=False) as pipe:
+                for task in tasks:
+                    inverse = self.INVERSE_TASKS.get(task.task_type, task.task_type)
+                    pipe.eval(self._CLAIM_TASK, 2,
+                              self._dedup_key(task.task_type, task.chat_id, task.user_id),
+                              self._dedup_key(inverse, task.chat_id, task.user_id), window)
+                return [bool(claimed) for claimed in await pipe.execute()]
+        except Exception as e:
+            logger.warning(f"Dedup unavailable, accepting {len(tasks)} tasks: {e}")
+            return [True] * len(tasks)
+
+    async def release_tasks(self, tasks: List[ModerationTask]):
+        """Знімає ключі дедуплікації, якщо дію так і не виконано (щоб повтор пройшов)"""
+        if not tasks:
+            return
+        try:
+            await self.get_redis().delete(
+                *{self._dedup_key(task.task_type, task.chat_id, task.user_id) for task in tasks}
+            )
+        except Exception as e:
+            logger.warning(f"Failed to release dedup keys: {e}")
 
-    # --- Redis QUEUE methods ---
-    def add_to_queue(self, task: ModerationTask):
+    async def add_to_queue(self, task: ModerationTask, dedup: bool = True) -> bool:
+        """Ставить завдання у смугу його типу; False — дубль у вікні дедуплікації"""
+        if dedup and not (await self.claim_tasks([task]))[0]:
+            logger.info(f"Skip duplicate task: {json.dumps(task.__dict__)}")
+            return False
         logger.info(f"Push to Redis: {json.dumps(task.__dict__)}")
-        self.redis_client.rpush('moderation_queue', json.dumps(task.__dict__))
-
-    def get_next_task(self) -> Optional[ModerationTask]:
-        """Витягує наступне завдання з черги (і видаляє його)"""
-        raw = self.redis_client.lpop('moderation_queue')
-        if raw:
-            data = json.loads(raw)
-            return ModerationTask(**data)
+        await self.get_redis().xadd(self.lane_stream(self._lane_of(task)), self._encode_task(task),
+                                    maxlen=self.queue_maxlen, approximate=True)
+        return True
+
+    async def add_to_queue_bulk(self, tasks: List[ModerationTask], dedup: bool = True) -> List[bool]:
+        """Усі XADD одним pipeline (один round trip); повертає прапорець "поставлено" для кожного"""
+        if not tasks:
+            return []
+        queued = await self.claim_tasks(tasks) if dedup else [True] * len(tasks)
+        if not any(queued):
+            return queued
+        logger.info(f"Push {sum(queued)} tasks to Redis ({len(tasks) - sum(queued)} duplicates skipped)")
+        async with self.get_redis().pipeline(transaction=False) as pipe:
+            for task, ok in zip(tasks, queued):
+                if ok:
+                    pipe.xadd(self.lane_stream(self._lane_of(task)), self._encode_task(task),
+                              maxlen=self.queue_maxlen, approximate=True)
+            await pipe.execute()
+        return queued
+
+    async def read_tasks(self, consumer: str, count: int = 10,
+                         block_ms: Optional[int] = None) -> List[Tuple[str, ModerationTask]]:
+        """Читає до count нових завдань для consumer у порядку пріоритету смуг.
+
+        Після обробки викличте ack_tasks(). Якщо всі смуги порожні, блокується
+        до block_ms на всіх одразу і повертає те, що прийде першим.
+        """
+        client = self.get_redis()
+        await self._ensure_group(client)
+        tasks: List[Tuple[str, ModerationTask]] = []
+        for lane in self.QUEUE_LANES:
+            response = await client.xreadgroup(
+                self.queue_group, consumer, {self.lane_stream(lane): '>'}, count=count - len(tasks)
+            )
+            if response:
+                tasks.extend(await self._decode_entries(response[0][1], lane))
+            if len(tasks) >= count:
+                return tasks
+        if tasks or not block_ms:
+            return tasks
+        lanes = {self.lane_stream(lane): lane for lane in self.QUEUE_LANES}
+        response = await client.xreadgroup(
+            self.queue_group, consumer, {stream: '>' for stream in lanes}, count=count, block=block_ms
+        )
+        for stream, entries in response or []:
+            tasks.extend(await self._decode_entries(entries, lanes[stream]))
+        return tasks
+
+    async def ack_tasks(self, entry_ids: List[str]) -> int:
+        """Підтверджує обробку і видаляє записи зі стріму"""
+        if not entry_ids:
+            return 0
+        by_lane = self._group_by_lane(entry_ids)
+        async with self.get_redis().pipeline(transaction=True) as pipe:
+            for lane, stream_ids in by_lane.items():
+                pipe.xack(self.lane_stream(lane), self.queue_group, *stream_ids)
+                pipe.xdel(self.lane_stream(lane), *stream_ids)
+            results = await pipe.execute()
+        return sum(results[::2])
+
+    async def claim_stale_tasks(self, consumer: str, min_idle_ms: int = 60000,
+                                count: int = 100) -> List[Tuple[str, ModerationTask]]:
+        """Забирає завдання, які інші (мертві) воркери прочитали, але не підтвердили"""
+        client = self.get_redis()
+        await self._ensure_group(client)
+        claimed = []
+        for lane in self.QUEUE_LANES:
+            start_id = '0-0'
+            while len(claimed) < count:
+                response = await client.xautoclaim(
+                    self.lane_stream(lane), self.queue_group, consumer,
+                    min_idle_time=min_idle_ms, start_id=start_id, count=count - len(claimed)
+                )
+                start_id, entries = response[0], response[1]
+                claimed.extend(await self._decode_entries(entries, lane))
+                if start_id == '0-0':
+                    break
+        return claimed
+
+    def dead_letter_stream(self) -> str:
+        return f"{self.queue_stream}:dead"
+
+    async def delivery_counts(self, entry_ids: List[str]) -> Dict[str, int]:
+        """Скільки разів кожен запис видавався воркерам (times_delivered з XPENDING)"""
+        if not entry_ids:
+            return {}
+        async with self.get_redis().pipeline(transaction=False) as pipe:
+            for entry_id in entry_ids:
+                lane, stream_id = self._split_entry_id(entry_id)
+                pipe.xpending_range(self.lane_stream(lane), self.queue_group,
+                                    min=stream_id, max=stream_id, count=1)
+            results = await pipe.execute()
+        return {entry_id: pending[0]['times_delivered']
+                for entry_id, pending in zip(entry_ids, results) if pending}
+
+    async def dead_letter_tasks(self, entries: List[Tuple[str, ModerationTask]], reason: str) -> int:
+        """Переносить завдання, що не вдається обробити, у стрім dead-letter і підтверджує їх.
+
+        Записи в dead-letter не читає жоден воркер: їх розбирають вручну.
+        """
+        if not entries:
+            return 0
+        async with self.get_redis().pipeline(transaction=False) as pipe:
+            for entry_id, task in entries:
+                pipe.xadd(self.dead_letter_stream(),
+                          {**self._encode_task(task), 'entry_id': entry_id, 'reason': reason},
+                          maxlen=self.queue_maxlen, approximate=True)
+            await pipe.execute()
+        logger.error(f"Moved {len(entries)} tasks to {self.dead_letter_stream()}: {reason}")
+        return await self.ack_tasks([entry_id for entry_id, _ in entries])
+
+    async def touch_tasks(self, consumer: str, entry_ids: List[str]) -> int:
+        """Скидає idle-час власних непідтверджених записів (XCLAIM JUSTID).
+
+        Воркер, що притримує завдання через rate limit, викликає це періодично,
+        щоб claim_stale_tasks інших воркерів не вважав їх завислими.
+        """
+        touched = 0
+        for lane, stream_ids in self._group_by_lane(entry_ids).items():
+            claimed = await self.get_redis().xclaim(self.lane_stream(lane), self.queue_group, consumer,
+                                                    0, stream_ids, justid=True)
+            touched += len(claimed)
+        return touched
+
+    async def trim_queue(self, maxlen: Optional[int] = None) -> int:
+        """Обрізає стріми смуг до maxlen записів кожен (за замовчуванням REDIS_QUEUE_MAXLEN)"""
+        async with self.get_redis().pipeline(transaction=False) as pipe:
+            for lane in self.QUEUE_LANES:
+                pipe.xtrim(self.lane_stream(lane), maxlen=maxlen or self.queue_maxlen, approximate=True)
+            return sum(await pipe.execute())
+
+    async def get_next_task(self) -> Optional[ModerationTask]:
+        """Витягує наступне завдання з черги (і видаляє його).
+
+        Сумісність зі старим API: завдання підтверджується одразу, тобто
+        гарантії доставки як у LPOP. Нові воркери мають використовувати read_tasks/ack_tasks.
+        """
+        tasks = await self.read_tasks('default', count=1)
+        if tasks:
+            entry_id, task = tasks[0]
+            await self.ack_tasks([entry_id])
+            return task
         return None
 
-    def get_queue_length(self) -> int:
-        """Кількість завдань у черзі"""
-        return self.redis_client.llen('moderation_queue')
+    async def get_lane_lengths(self) -> Dict[str, int]:
+        """Кількість завдань у кожній смузі (непрочитані + непідтверджені)"""
+        # Підтверджені записи видаляються в ack_tasks, тож XLEN = реальний backlog
+        async with self.get_redis().pipeline(transaction=False) as pipe:
+            for lane in self.QUEUE_LANES:
+                pipe.xlen(self.lane_stream(lane))
+            return dict(zip(self.QUEUE_LANES, await pipe.execute()))
+
+    async def get_queue_length(self) -> int:
+        """Кількість завдань у черзі (усі смуги)"""
+        return sum((await self.get_lane_lengths()).values())
+
+    async def migrate_legacy_queue(self) -> int:
+        """Переносить завдання зі старого списку moderation_queue у стріми смуг"""
+        client = self.get_redis()
+        moved = 0
+        while True:
+            raw = await client.lpop(LEGACY_QUEUE_KEY)
+            if raw is None:
+                return moved
+            try:
+                lane = self.TASK_LANES.get(json.loads(raw).get('task_type'), 'normal')
+            except (AttributeError, ValueError):
+                lane = 'normal'
+            await client.xadd(self.lane_stream(lane), {'task': raw},
+                              maxlen=self.queue_maxlen, approximate=True)
+            moved += 1
 
-    def clear_queue(self):
+    async def clear_queue(self):
         """Очистити чергу (тільки для тестування)"""
-        self.redis_client.delete('moderation_queue')
+        await self.get_redis().delete(*(self.lane_stream(lane) for lane in self.QUEUE_LANES))
+        self._group_ready.pop(asyncio.get_running_loop(), None)
+
+    # --- Синхронні обгортки для коду поза event loop (бот, скрипти) ---
+    # Методи черги стали корутинами разом із переходом на Redis Streams; раніше
+    # синхронні виклики add_to_queue(task) тощо тепер мають йти через ці обгортки.
+    def add_to_queue_sync(self, task: ModerationTask, dedup: bool = True) -> bool:
+        return run_async(self.add_to_queue(task, dedup=dedup))
+
+    def add_to_queue_bulk_sync(self, tasks: List[ModerationTask], dedup: bool = True) -> List[bool]:
+        return run_async(self.add_to_queue_bulk(tasks, dedup=dedup))
+
+    def get_next_task_sync(self) -> Optional[ModerationTask]:
+        return run_async(self.get_next_task())
+
+    def get_queue_length_sync(self) -> int:
+        return run_async(self.get_queue_length())
+
+    def clear_queue_sync(self):
+        run_async(self.clear_queue())
+
+    # --- Redis лічильники для заголовка dashboard ---
+    # counters:total_bans / total_moderators / total_chats змінюються методами запису вище.
+    # Ключі мають TTL: коли він спливає, get_dashboard_counters перераховує їх з БД,
+    # тож розбіжність через прямі записи бота живе не довше COUNTERS_TTL.
+    COUNTER_NAMES = ('total_bans', 'total_moderators', 'total_chats')
+
+    # INCRBY тільки для наявного ключа: відсутній лічильник не можна "створити" з дельти
+    _INCR_IF_EXISTS = """
+        if redis.call('EXISTS', KEYS[1]) == 1 then
+            return redis.call('INCRBY', KEYS[1], ARGV[1])
+        end
+        return nil
+    """
+
+    async def adjust_counters(self, **deltas: int):
+        """adjust_counters(total_bans=1). Помилки Redis не ламають запис у БД"""
+        deltas = {name: delta for name, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        try:
+            async with self.get_redis().pipeline(transaction=False) as pipe:
+                for name, delta in deltas.items():
+                    pipe.eval(self._INCR_IF_EXISTS, 1, f'counters:{name}', delta)
+                await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Failed to update counters {deltas}: {e}")
+
+    async def reconcile_counters(self) -> Dict[str, int]:
+        """Перераховує лічильники з БД одним запитом і записує їх у Redis"""
+        pool = await self.get_pool()
+        async with pool.acquire() as conn:
+            row = await conn.fetchrow(
+                """SELECT (SELECT COUNT(*) FROM bans) AS total_bans,
+                          (SELECT COUNT(*) FROM moderators) AS total_moderators,
+                          (SELECT COUNT(*) FROM chat_settings) AS total_chats"""
+            )
+        counters = {name: row[name] for name in self.COUNTER_NAMES}
+        ttl = getattr(settings, 'COUNTERS_TTL', 3600)
+        async with self.get_redis().pipeline(transaction=True) as pipe:
+            for name, value in counters.items():
+                pipe.set(f'counters:{name}', value, ex=ttl)
+            await pipe.execute()
+        return counters
+
+    async def get_dashboard_counters(self) -> Dict[str, int]:
+        """Усі лічильники одним MGET; якщо якогось немає — перерахунок з БД"""
+        values = await self.get_redis().mget([f'counters:{name}' for name in self.COUNTER_NAMES])
+        if any(value is None for value in values):
+            return await self.reconcile_counters()
+        return {name: int(value) for name, value in zip(self.COUNTER_NAMES, values)}
+
+    # --- Жива стрічка dashboard ---
+    # Методи запису кладуть нові покарання в Redis-список; DashboardFeed раз на тік
+    # забирає їх пакетом і розсилає одним кадром у групу Channels. Список обрізається
+    # до DASHBOARD_FEED_BUFFER, тож без запущеної стрічки він не росте.
+    @staticmethod
+    def _feed_event(punishment_id: Optional[int], timestamp, user_id: int, chat_id: int,
+                    punishment_type: str, reason: Optional[str], moderator_id: Optional[int],
+                    duration_minutes: Optional[int] = None) -> Dict[str, Any]:
+        return {
+            'id': punishment_id,
+            'timestamp': timestamp.isoformat() if timestamp else None,
+            'user_id': user_id,
+            'chat_id': chat_id,
+            'punishment_type': punishment_type,
+            'reason': reason,
+            'moderator_id': moderator_id,
+            'duration_minutes': duration_minutes,
+        }
+
+    async def push_dashboard_events(self, events: List[Dict[str, Any]]):
+        """Помилки Redis не ламають запис у БД"""
+        if not events or not getattr(settings, 'DASHBOARD_FEED_ENABLED', True):
+            return
+        buffer = getattr(settings, 'DASHBOARD_FEED_BUFFER', 1000)
+        try:
+            async with self.get_redis().pipeline(transaction=False) as pipe:
+                pipe.rpush(DASHBOARD_EVENTS_KEY, *(json.dumps(event) for event in events))
+                pipe.ltrim(DASHBOARD_EVENTS_KEY, -buffer, -1)
+                await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Failed to push {len(events)} dashboard events: {e}")
+
+    async def drain_dashboard_events(self, limit: int) -> Tuple[List[Dict[str, Any]], int]:
+        """Забирає до limit найстаріших подій; повертає (події, скільки лишилося)"""
+        async with self.get_redis().pipeline(transaction=True) as pipe:
+            pipe.lrange(DASHBOARD_EVENTS_KEY, 0, limit - 1)
+            pipe.ltrim(DASHBOARD_EVENTS_KEY, limit, -1)
+            pipe.llen(DASHBOARD_EVENTS_KEY)
+            raw, _, remaining = await pipe.execute()
+        return [json.loads(item) for item in raw], remaining
+
+    # --- Redis HyperLogLog: унікальні порушники по чату і дню ---
+    # Ключ offenders:{chat_id}:{YYYY-MM-DD} плюс offenders:all:{YYYY-MM-DD} для всіх чатів.
+    # PFCOUNT з кількома ключами об'єднує їх на сервері (як PFMERGE без тимчасового ключа),
+    # тож будь-яке вікно/набір чатів рахується без сканування punishments.
+    # Стандартна похибка HyperLogLog у Redis — 0.81%.
+    HLL_STANDARD_ERROR = 0.0081
+
+    def _offenders_key(self, chat_id: Optional[int], day: date) -> str:
+        return f"offenders:{'all' if chat_id is None else chat_id}:{day.isoformat()}"
+
+    async def _track_offenders(self, offenders: List[Tuple[int, int]], day: Optional[date] = None):
+        """PFADD для пар (chat_id, user_id). Помилки Redis не ламають запис у БД"""
+        if not offenders:
+            return
+        day = day or timezone.now().date()
+        by_key: Dict[str, set] = {}
+        for chat_id, user_id in offenders:
+            by_key.setdefault(self._offenders_key(chat_id, day), set()).add(user_id)
+            by_key.setdefault(self._offenders_key(None, day), set()).add(user_id)
+        ttl = getattr(settings, 'OFFENDERS_HLL_TTL_DAYS', 400) * 86400
+        try:
+            async with self.get_redis().pipeline(transaction=False) as pipe:
+                for key, user_ids in by_key.items():
+                    pipe.pfadd(key, *user_ids)
+                    pipe.expire(key, ttl)
+                await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Failed to update offender counters: {e}")
+
+    async def count_unique_offenders(self, chat_ids: Optional[List[int]] = None,
+                                     days: int = 7) -> int:
+        """Приблизна кількість унікальних покараних користувачів за останні days днів"""
+        today = timezone.now().date()
+        window = [today - timedelta(days=offset) for offset in range(max(days, 1))]
+        keys = [
+            self._offenders_key(chat_id, day)
+            for chat_id in (chat_ids or [None])
+            for day in window
+        ]
+        return await self.get_redis().pfcount(*keys)
+
+    async def rebuild_offender_counters(self, days: int = 30, batch_size: int = 5000) -> int:
+        """Заповнює HLL-лічильники з історії punishments (серверний курсор, пакетами)"""
+        pool = await self.get_pool()
+        total = 0
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                batch: Dict[date, List[Tuple[int, int]]] = {}
+                pending = 0
+                async for row in conn.cursor(
+                    """SELECT DISTINCT DATE(timestamp) AS day, chat_id, user_id
+                       FROM punishments
+                       WHERE timestamp >= (CURRENT_DATE - $1::int)::timestamp""",
+                    days - 1, prefetch=batch_size
+                ):
+                    batch.setdefault(row['day'], []).append((row['chat_id'], row['user_id']))
+                    pending += 1
+                    if pending >= batch_size:
+                        for day, offenders in batch.items():
+                            await self._track_offenders(offenders, day)
+                        total += pending
+                        batch, pending = {}, 0
+                for day, offenders in batch.items():
+                    await self._track_offenders(offenders, day)
+                total += pending
+        return total
 
     # Далі всі методи працюють через pool = await self.get_pool()
     async def add_ban(self, user_id: int, chat_id: int, reason: str):
         pool = await self.get_pool()
         async with pool.acquire() as conn:
-            await conn.execute(
+            # xmax = 0 лише для щойно вставленого рядка, не для оновленого через ON CONFLICT
+            inserted = await conn.fetchval(
                 "INSERT INTO bans (user_id, chat_id, reason) VALUES ($1, $2, $3) "
-                "ON CONFLICT (user_id, chat_id) DO UPDATE SET reason = $3",
+                "ON CONFLICT (user_id, chat_id) DO UPDATE SET reason = $3 "
+                "RETURNING (xmax = 0)",
                 user_id, chat_id, reason
             )
+        await self.invalidate_status(pairs=[(chat_id, user_id)])
+        if inserted:
+            await self.adjust_counters(total_bans=1)
 
     async def remove_ban(self, user_id: int, chat_id: int):
         pool = await self.get_pool()
         async with pool.acquire() as conn:
-            await conn.execute(
+            status = await conn.execute(
                 "DELETE FROM bans WHERE user_id = $1 AND chat_id = $2",
                 user_id, chat_id
             )
+        await self.invalidate_status(pairs=[(chat_id, user_id)])
+        await self.adjust_counters(total_bans=-int(status.split()[-1]))
 
     async def add_warning(self, user_id: int, chat_id: int) -> int:
         pool = await self.get_pool()
@@ -124,7 +688,8 @@ class DatabaseManager:
                    RETURNING warn_count""",
                 user_id, chat_id
             )
-            return result['warn_count']
+        await self.invalidate_status(pairs=[(chat_id, user_id)])
+        return result['warn_count']
 
     async def remove_warning(self, user_id: int, chat_id: int) -> int:
         pool = await self.get_pool()
@@ -135,27 +700,11 @@ class DatabaseManager:
                    WHERE user_id = $1 AND chat_id = $2 RETURNING warn_count""",
                 user_id, chat_id
             )
-            return result['warn_count'] if result else 0
+        await self.invalidate_status(pairs=[(chat_id, user_id)])
+        return result['warn_count'] if result else 0
 
     async def remove_mute(self, user_id: int, chat_id: int):
-        pool = await self.get_pool()
-        async with pool.acquire() as conn:
-            # Знайти ID останнього муту
-            result = await conn.fetchrow(
-                """
-                SELECT id FROM punishments
-                WHERE user_id = $1 AND chat_id = $2 AND punishment_type = 'mute'
-                ORDER BY timestamp DESC
-                LIMIT 1
-                """,
-                user_id, chat_id
-            )
-            if result:
-                mute_id = result['id']
-                await conn.execute(
-                    "DELETE FROM punishments WHERE id = $1",
-                    mute_id
-                )
+        await self.lift_mute(user_id, chat_id)
 
     async def get_warning_count(self, user_id: int, chat_id: int) -> int:
         pool = await self.get_pool()
@@ -178,19 +727,27 @@ class DatabaseManager:
     async def add_moderator_to_db(self, user_id: int, username: str = None):
         pool = await self.get_pool()
         async with pool.acquire() as conn:
-            await conn.execute(
+            inserted = await conn.fetchval(
                 "INSERT INTO moderators (user_id, username) VALUES ($1, $2) "
-                "ON CONFLICT (user_id) DO UPDATE SET username = $2",
+                "ON CONFLICT (user_id) DO UPDATE SET username = $2 "
+                "RETURNING (xmax = 0)",
                 user_id, username
             )
+        await self.publish_invalidation(*MODERATOR_CACHES)
+        await self.invalidate_status(moderators=[user_id])
+        if inserted:
+            await self.adjust_counters(total_moderators=1)
 
     async def remove_moderator_from_db(self, user_id: int):
         pool = await self.get_pool()
         async with pool.acquire() as conn:
-            await conn.execute(
+            status = await conn.execute(
                 "DELETE FROM moderators WHERE user_id = $1",
                 user_id
             )
+        await self.publish_invalidation(*MODERATOR_CACHES)
+        await self.invalidate_status(moderators=[user_id])
+        await self.adjust_counters(total_moderators=-int(status.split()[-1]))
 
     async def get_filter_status(self, chat_id: int) -> bool:
         pool = await self.get_pool()
@@ -204,21 +761,554 @@ class DatabaseManager:
     async def set_filter_status(self, chat_id: int, enabled: bool):
         pool = await self.get_pool()
         async with pool.acquire() as conn:
-            await conn.execute(
+            inserted = await conn.fetchval(
                 "INSERT INTO chat_settings (chat_id, filter_enabled) VALUES ($1, $2) "
-                "ON CONFLICT (chat_id) DO UPDATE SET filter_enabled = $2",
+                "ON CONFLICT (chat_id) DO UPDATE SET filter_enabled = $2 "
+                "RETURNING (xmax = 0)",
                 chat_id, enabled
             )
+        await self.publish_invalidation(*CHAT_CACHES, chat_settings_key(chat_id))
+        await self.invalidate_status(chats=[chat_id])
+        if inserted:
+            await self.adjust_counters(total_chats=1)
 
     async def add_punishment(self, user_id: int, chat_id: int, punishment_type: str,
-                             reason: str, moderator_id: int, duration_minutes: int = None):
+                             reason: str, moderator_id: int, duration_minutes: int = None) -> int:
         pool = await self.get_pool()
         async with pool.acquire() as conn:
-            await conn.execute(
-                """INSERT INTO punishments (user_id, chat_id, punishment_type, reason, moderator_id, duration_minutes)
-                   VALUES ($1, $2, $3, $4, $5, $6)""",
+            row = await conn.fetchrow(
+                f"""WITH p AS (
+                       INSERT INTO punishments (user_id, chat_id, punishment_type, reason, moderator_id, duration_minutes)
+                       VALUES ($1, $2, $3, $4, $5, $6)
+                       {PUNISHMENT_RETURNING}
+                   ){DAILY_STATS_CTE}
+                   SELECT id, timestamp FROM p""",
                 user_id, chat_id, punishment_type, reason, moderator_id, duration_minutes
             )
+        await self._track_offenders([(chat_id, user_id)])
+        await self.push_dashboard_events([self._feed_event(
+            row['id'], row['timestamp'], user_id, chat_id, punishment_type, reason, moderator_id, duration_minutes
+        )])
+        return row['id']
+
+    # --- Композитні операції: одне з'єднання, один запит, одна транзакція ---
+    # Один SQL-оператор з data-modifying CTE в Postgres атомарний сам по собі,
+    # тому BEGIN/COMMIT не потрібні і весь бан/варн коштує один round trip.
+    async def apply_ban(self, user_id: int, chat_id: int, reason: str,
+                        moderator_id: int) -> Dict[str, Any]:
+        """Бан + запис у punishments"""
+        pool = await self.get_pool()
+        async with pool.acquire() as conn:
+            result = await conn.fetchrow(
+                f"""WITH ban AS (
+                       INSERT INTO bans (user_id, chat_id, reason) VALUES ($1, $2, $3)
+                       ON CONFLICT (user_id, chat_id) DO UPDATE SET reason = $3
+                       RETURNING user_id, (xmax = 0) AS inserted
+                   ), p AS (
+                       INSERT INTO punishments (user_id, chat_id, punishment_type, reason, moderator_id)
+                       SELECT $1, $2, 'ban', $3, $4 FROM ban
+                       {PUNISHMENT_RETURNING}
+                   ){DAILY_STATS_CTE}
+                   SELECT p.id, p.timestamp, ban.inserted FROM p, ban""",
+                user_id, chat_id, reason, moderator_id
+            )
+        await self.invalidate_status(pairs=[(chat_id, user_id)])
+        if result['inserted']:
+            await self.adjust_counters(total_bans=1)
+        await self._track_offenders([(chat_id, user_id)])
+        await self.push_dashboard_events([self._feed_event(
+            result['id'], result['timestamp'], user_id, chat_id, 'ban', reason, moderator_id
+        )])
+        return {'punishment_id': result['id'], 'timestamp': result['timestamp']}
+
+    async def apply_warn(self, user_id: int, chat_id: int, reason: str,
+                         moderator_id: int) -> Dict[str, Any]:
+        """Попередження + запис у punishments, повертає новий warn_count"""
+        pool = await self.get_pool()
+        async with pool.acquire() as conn:
+            result = await conn.fetchrow(
+                f"""WITH warn AS (
+                       INSERT INTO warnings (user_id, chat_id, warn_count)
+                       VALUES ($1, $2, 1) ON CONFLICT (user_id, chat_id) DO
+                       UPDATE SET warn_count = warnings.warn_count + 1
+                       RETURNING warn_count
+                   ), p AS (
+                       INSERT INTO punishments (user_id, chat_id, punishment_type, reason, moderator_id)
+                       SELECT $1, $2, 'warn', $3, $4 FROM warn
+                       {PUNISHMENT_RETURNING}
+                   ){DAILY_STATS_CTE}
+                   SELECT warn.warn_count, p.id, p.timestamp FROM warn, p""",
+                user_id, chat_id, reason, moderator_id
+            )
+        await self.invalidate_status(pairs=[(chat_id, user_id)])
+        await self._track_offenders([(chat_id, user_id)])
+        await self.push_dashboard_events([self._feed_event(
+            result['id'], result['timestamp'], user_id, chat_id, 'warn', reason, moderator_id
+        )])
+        return {
+            'punishment_id': result['id'],
+            'timestamp': result['timestamp'],
+            'warn_count': result['warn_count'],
+        }
+
+    async def apply_mute(self, user_id: int, chat_id: int, reason: str, moderator_id: int,
+                         duration_minutes: Optional[int] = None) -> Dict[str, Any]:
+        """Мут + запис у punishments + стан в active_sanctions одним запитом"""
+        pool = await self.get_pool()
+        async with pool.acquire() as conn:
+            result = await conn.fetchrow(
+                f"""WITH p AS (
+                       INSERT INTO punishments (user_id, chat_id, punishment_type, reason, moderator_id, duration_minutes)
+                       VALUES ($1, $2, 'mute', $3, $4, $5)
+                       {PUNISHMENT_RETURNING}
+                   ){DAILY_STATS_CTE}, sanction AS (
+                       {ACTIVE_MUTE_UPSERT}
+                       SELECT $1, $2, 'mute', now() + make_interval(mins => $5::int), p.id, $4, now() FROM p
+                       {ACTIVE_MUTE_CONFLICT}
+                       RETURNING expires_at
+                   )
+                   SELECT p.id, p.timestamp, sanction.expires_at FROM p, sanction""",
+                user_id, chat_id, reason, moderator_id, duration_minutes
+            )
+        await self.invalidate_status(pairs=[(chat_id, user_id)])
+        if result['expires_at'] is not None:
+            await self.schedule_expiries([('mute', chat_id, user_id, result['expires_at'])])
+        await self._track_offenders([(chat_id, user_id)])
+        await self.push_dashboard_events([self._feed_event(
+            result['id'], result['timestamp'], user_id, chat_id, 'mute', reason, moderator_id, duration_minutes
+        )])
+        return {'punishment_id': result['id'], 'timestamp': result['timestamp'],
+                'expires_at': result['expires_at']}
+
+    async def lift_mute(self, user_id: int, chat_id: int) -> Optional[int]:
+        """Знімає мут одним запитом: стан з active_sanctions і запис мута з punishments.
+
+        Запис у punishments знаходиться за punishment_id з active_sanctions; пошук
+        останнього мута в історії лишився лише для мутів без такого зв'язку
+        (записаних ботом напряму до sync_sanctions або пакетом через COPY).
+        Повертає id видаленого запису punishments.
+        """
+        pool = await self.get_pool()
+        async with pool.acquire() as conn:
+            punishment_id = await conn.fetchval(
+                """WITH sanction AS (
+                       DELETE FROM active_sanctions
+                       WHERE user_id = $1 AND chat_id = $2 AND sanction_type = 'mute'
+                       RETURNING punishment_id
+                   ), target AS (
+                       SELECT id, timestamp FROM punishments
+                       WHERE id = (SELECT punishment_id FROM sanction) AND user_id = $1 AND chat_id = $2
+                       UNION ALL
+                       (SELECT id, timestamp FROM punishments
+                        WHERE user_id = $1 AND chat_id = $2 AND punishment_type = 'mute'
+                          AND NOT EXISTS (SELECT 1 FROM sanction WHERE punishment_id IS NOT NULL)
+                        ORDER BY timestamp DESC
+                        LIMIT 1)
+                   ), p AS (
+                       -- timestamp разом з id: видалення йде лише в партицію цього рядка
+                       DELETE FROM punishments
+                       USING target
+                       WHERE punishments.id = target.id AND punishments.timestamp = target.timestamp
+                       RETURNING punishments.id, punishments.timestamp, punishments.chat_id,
+                                 punishments.punishment_type, punishments.moderator_id
+                   ), stat AS (
+                       UPDATE punishment_daily_stats s SET count = GREATEST(0, s.count - 1)
+                       FROM p
+                       WHERE s.date = DATE(p.timestamp) AND s.chat_id = p.chat_id
+                         AND s.punishment_type = p.punishment_type
+                         AND s.moderator_id = COALESCE(p.moderator_id, 0)
+                   )
+                   SELECT id FROM p""",
+                user_id, chat_id
+            )
+        await self.invalidate_status(pairs=[(chat_id, user_id)])
+        await self.unschedule_expiries([('mute', chat_id, user_id)])
+        return punishment_id
+
+    async def apply_bulk(self, tasks: List[ModerationTask]) -> List[Dict[str, Any]]:
+        """Масове застосування ban/warn/mute/kick в одній транзакції.
+
+        bans і warnings пишуться одним INSERT ... unnest кожен,
+        punishments через COPY, добові підсумки одним INSERT ... unnest.
+        Повертає результат для кожного завдання в тому ж порядку.
+        """
+        if not tasks:
+            return []
+
+        # Дублікати (user_id, chat_id) в одному INSERT ... ON CONFLICT заборонені,
+        # тому бани дедуплікуються (перемагає остання причина), а варни сумуються.
+        bans: Dict[tuple, tuple] = {}
+        warns: Dict[tuple, int] = {}
+        mutes: Dict[tuple, tuple] = {}
+        stat_counts: Dict[tuple, int] = {}
+        for task in tasks:
+            key = (task.user_id, task.chat_id)
+            if task.task_type == 'ban':
+                bans[key] = (task.user_id, task.chat_id, task.reason)
+            elif task.task_type == 'warn':
+                warns[key] = warns.get(key, 0) + 1
+            elif task.task_type == 'mute':
+                mutes[key] = (task.user_id, task.chat_id, task.duration_minutes, task.moderator_id)
+            stat_key = (task.chat_id, task.task_type, task.moderator_id or 0)
+            stat_counts[stat_key] = stat_counts.get(stat_key, 0) + 1
+
+        punishment_records = [
+            (task.user_id, task.chat_id, task.task_type, task.reason,
+             task.moderator_id, task.duration_minutes)
+            for task in tasks
+        ]
+
+        pool = await self.get_pool()
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                new_bans = 0
+                if bans:
+                    rows = list(bans.values())
+                    new_bans = await conn.fetchval(
+                        """WITH b AS (
+                               INSERT INTO bans (user_id, chat_id, reason)
+                               SELECT * FROM unnest($1::bigint[], $2::bigint[], $3::text[])
+                               ON CONFLICT (user_id, chat_id) DO UPDATE SET reason = EXCLUDED.reason
+                               RETURNING (xmax = 0) AS inserted
+                           )
+                           SELECT COUNT(*) FILTER (WHERE inserted) FROM b""",
+                        [r[0] for r in rows], [r[1] for r in rows], [r[2] for r in rows]
+                    )
+
+                warn_counts: Dict[tuple, int] = {}
+                if warns:
+                    keys = list(warns)
+                    rows = await conn.fetch(
+                        """INSERT INTO warnings (user_id, chat_id, warn_count)
+                           SELECT * FROM unnest($1::bigint[], $2::bigint[], $3::int[])
+                           ON CONFLICT (user_id, chat_id) DO
+                           UPDATE SET warn_count = warnings.warn_count + EXCLUDED.warn_count
+                           RETURNING user_id, chat_id, warn_count""",
+                        [k[0] for k in keys], [k[1] for k in keys], [warns[k] for k in keys]
+                    )
+                    warn_counts = {(row['user_id'], row['chat_id']): row['warn_count'] for row in rows}
+
+                await conn.copy_records_to_table(
+                    'punishments',
+                    records=punishment_records,
+                    columns=['user_id', 'chat_id', 'punishment_type', 'reason',
+                             'moderator_id', 'duration_minutes'],
+                )
+
+                # timestamp береться з DEFAULT now(), а now() однаковий у межах транзакції,
+                # тому всі рядки пакета потрапляють в один день
+                batch_timestamp = await conn.fetchval("SELECT now()")
+                keys = list(stat_counts)
+                await conn.execute(
+                    """INSERT INTO punishment_daily_stats (date, chat_id, punishment_type, moderator_id, count)
+                       SELECT DATE(now()), * FROM unnest($1::bigint[], $2::text[], $3::bigint[], $4::int[])
+                       ON CONFLICT (date, chat_id, punishment_type, moderator_id)
+                       DO UPDATE SET count = punishment_daily_stats.count + EXCLUDED.count""",
+                    [k[0] for k in keys], [k[1] for k in keys], [k[2] for k in keys],
+                    [stat_counts[k] for k in keys]
+                )
+
+                # COPY не повертає id, тож punishment_id лишається NULL (lift_mute знайде мут в історії)
+                expiries = []
+                if mutes:
+                    rows = list(mutes.values())
+                    expiries = await conn.fetch(
+                        f"""{ACTIVE_MUTE_UPSERT}
+                            SELECT u, c, 'mute', now() + make_interval(mins => d), NULL, m, now()
+                            FROM unnest($1::bigint[], $2::bigint[], $3::int[], $4::bigint[]) AS t(u, c, d, m)
+                            {ACTIVE_MUTE_CONFLICT}
+                            RETURNING user_id, chat_id, expires_at""",
+                        [r[0] for r in rows], [r[1] for r in rows], [r[2] for r in rows], [r[3] for r in rows]
+                    )
+
+        await self.invalidate_status(pairs=[(task.chat_id, task.user_id) for task in tasks])
+        if new_bans:
+            await self.adjust_counters(total_bans=new_bans)
+        await self.schedule_expiries([('mute', row['chat_id'], row['user_id'], row['expires_at'])
+                                      for row in expiries if row['expires_at'] is not None])
+        await self._track_offenders([(task.chat_id, task.user_id) for task in tasks])
+        await self.push_dashboard_events([
+            self._feed_event(None, batch_timestamp, task.user_id, task.chat_id, task.task_type,
+                             task.reason, task.moderator_id, task.duration_minutes)
+            for task in tasks
+        ])
+
+        results = []
+        # warn_count кожного варну = підсумок мінус варни, що йдуть після нього в пакеті
+        remaining = dict(warns)
+        for task in tasks:
+            result = {'success': True}
+            if task.task_type == 'warn':
+                key = (task.user_id, task.chat_id)
+                remaining[key] -= 1
+                result['warn_count'] = warn_counts.get(key, 0) - remaining[key]
+            results.append(result)
+        return results
+
+    # --- Активні санкції і планувальник їх закінчення ---
+    # active_sanctions у БД — джерело істини; ZSET у Redis лише розклад для планувальника,
+    # тож після втрати Redis він відновлюється з БД (sync_sanctions / rebuild_expiry_schedule).
+    # Завдання на зняття санкції: mute -> unmute.
+    EXPIRY_TASK_TYPES = {'mute': 'unmute'}
+
+    # ZREM лише якщо score досі не пізніший за now: повторний мут, що переніс строк,
+    # не можна викреслити з розкладу
+    _ZREM_IF_DUE = """
+        local removed = 0
+        for i = 2, #ARGV do
+            local score = redis.call('ZSCORE', KEYS[1], ARGV[i])
+            if score and tonumber(score) <= tonumber(ARGV[1]) then
+                removed = removed + redis.call('ZREM', KEYS[1], ARGV[i])
+            end
+        end
+        return removed
+    """
+
+    @staticmethod
+    def _sanction_member(sanction_type: str, chat_id: int, user_id: int) -> str:
+        return f"{sanction_type}:{chat_id}:{user_id}"
+
+    async def schedule_expiries(self, entries: List[Tuple[str, int, int, Any]]):
+        """ZADD (sanction_type, chat_id, user_id, expires_at). Помилки Redis не ламають запис у БД"""
+        if not entries:
+            return
+        mapping = {self._sanction_member(t, chat_id, user_id): expires_at.timestamp()
+                   for t, chat_id, user_id, expires_at in entries}
+        try:
+            await self.get_redis().zadd(SANCTIONS_EXPIRY_KEY, mapping)
+        except Exception as e:
+            logger.warning(f"Failed to schedule {len(mapping)} sanction expiries: {e}")
+
+    async def unschedule_expiries(self, entries: List[Tuple[str, int, int]]):
+        if not entries:
+            return
+        try:
+            await self.get_redis().zrem(SANCTIONS_EXPIRY_KEY,
+                                        *[self._sanction_member(*entry) for entry in entries])
+        except Exception as e:
+            logger.warning(f"Failed to unschedule sanction expiries: {e}")
+
+    async def expire_due_sanctions(self, limit: int = 500) -> List[ModerationTask]:
+        """Знімає санкції, строк яких минув, і ставить у чергу завдання unmute.
+
+        Видалення з active_sanctions і XADD завдань в одній транзакції: якщо черга
+        недоступна, стан не змінюється і спроба повториться. Кілька планувальників
+        можуть працювати одночасно — рядок видалить (і завдання створить) лише один.
+        """
+        client = self.get_redis()
+        # Один і той самий момент для вибірки з ZSET, DELETE і ZREM: інакше, якщо годинник
+        # застосунку випереджає годинник БД, ZREM прибрав би з розкладу невидалені санкції
+        now = time.time()
+        members = await client.zrangebyscore(SANCTIONS_EXPIRY_KEY, '-inf', now, start=0, num=limit)
+        if not members:
+            return []
+
+        keys = []
+        for member in members:
+            sanction_type, chat_id, user_id = member.split(':')
+            keys.append((sanction_type, int(chat_id), int(user_id)))
+
+        tasks: List[ModerationTask] = []
+        pool = await self.get_pool()
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                rows = await conn.fetch(
+                    """DELETE FROM active_sanctions s
+                       USING unnest($1::text[], $2::bigint[], $3::bigint[]) AS d(sanction_type, chat_id, user_id)
+                       WHERE s.sanction_type = d.sanction_type AND s.chat_id = d.chat_id
+                         AND s.user_id = d.user_id AND s.expires_at <= to_timestamp($4)
+                       RETURNING s.sanction_type, s.chat_id, s.user_id, s.moderator_id""",
+                    [k[0] for k in keys], [k[1] for k in keys], [k[2] for k in keys], now
+                )
+                tasks = [
+                    ModerationTask(task_type=self.EXPIRY_TASK_TYPES[row['sanction_type']],
+                                   user_id=row['user_id'], username=None, reason='Sanction expired',
+                                   chat_id=row['chat_id'], moderator_id=row['moderator_id'])
+                    for row in rows
+                ]
+                if tasks:
+                    # Системні завдання: ZREM вище вже гарантує, що вони одноразові
+                    await self.add_to_queue_bulk(tasks, dedup=False)
+
+        await client.eval(self._ZREM_IF_DUE, 1, SANCTIONS_EXPIRY_KEY, now, *members)
+        await self.invalidate_status(pairs=[(task.chat_id, task.user_id) for task in tasks])
+        return tasks
+
+    async def rebuild_expiry_schedule(self, batch_size: int = 5000) -> int:
+        """Заповнює ZSET з active_sanctions (після втрати Redis або при старті планувальника)"""
+        pool = await self.get_pool()
+        total = 0
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                batch = []
+                async for row in conn.cursor(
+                    """SELECT sanction_type, chat_id, user_id, expires_at
+                       FROM active_sanctions WHERE expires_at IS NOT NULL""",
+                    prefetch=batch_size
+                ):
+                    batch.append(tuple(row))
+                    if len(batch) >= batch_size:
+                        await self.schedule_expiries(batch)
+                        total += len(batch)
+                        batch = []
+                await self.schedule_expiries(batch)
+                total += len(batch)
+        return total
+
+    async def sync_sanctions(self, days: int = 30) -> int:
+        """Переносить в active_sanctions дійсні мути, записані в punishments в обхід DatabaseManager.
+
+        Читає лише мути за останні days днів (індекс по timestamp), тож запускати можна часто.
+        Повертає кількість доданих або оновлених станів.
+        """
+        pool = await self.get_pool()
+        async with pool.acquire() as conn:
+            rows = await conn.fetch(
+                f"""WITH latest AS (
+                       SELECT DISTINCT ON (user_id, chat_id)
+                              user_id, chat_id, id, moderator_id,
+                              timestamp + make_interval(mins => duration_minutes) AS expires_at
+                       FROM punishments
+                       WHERE punishment_type = 'mute'
+                         AND timestamp >= (CURRENT_DATE - $1::int)::timestamp
+                       ORDER BY user_id, chat_id, timestamp DESC
+                   )
+                   {ACTIVE_MUTE_UPSERT}
+                   SELECT user_id, chat_id, 'mute', expires_at, id, moderator_id, now()
+                   FROM latest
+                   WHERE expires_at IS NULL OR expires_at > now()
+                   {ACTIVE_MUTE_CONFLICT}
+                   WHERE active_sanctions.punishment_id IS DISTINCT FROM EXCLUDED.punishment_id
+                     AND COALESCE(active_sanctions.punishment_id, 0) < EXCLUDED.punishment_id
+                   RETURNING sanction_type, chat_id, user_id, expires_at""",
+                days
+            )
+        await self.schedule_expiries([tuple(row) for row in rows if row['expires_at'] is not None])
+        return len(rows)
+
+    async def publish_invalidation(self, *names: str):
+        """Асинхронний варіант cache.publish_invalidation для коду в event loop"""
+        lookup_cache.invalidate(*names)
+        try:
+            keys, args = invalidation_bus.script_args(names)
+            await self.get_redis().eval(PUBLISH_INVALIDATION, len(keys), *keys, *args)
+        except Exception as e:
+            logger.warning(f"Failed to publish cache invalidation {names}: {e}")
+
+    # --- Пакетний статус користувачів для бота (read-through кеш у Redis) ---
+    # status:u:{chat_id}:{user_id} -> {"w": warn_count, "b": забанений, "m": замучений}
+    # status:mod:{user_id}          -> "1"/"0" (модератор глобально, тож окремий ключ на користувача)
+    # status:chat:{chat_id}         -> "1"/"0" (filter_enabled)
+    # Усі ключі пакета читаються одним MGET; промахи добираються одним SQL-запитом.
+    # Методи запису вище викликають invalidate_status; прямі записи бота живуть не довше TTL.
+    @staticmethod
+    def _status_user_key(chat_id: int, user_id: int) -> str:
+        return f"status:u:{chat_id}:{user_id}"
+
+    async def invalidate_status(self, pairs: List[Tuple[int, int]] = (), moderators: List[int] = (),
+                                chats: List[int] = ()):
+        """pairs — (chat_id, user_id). Помилки Redis не ламають запис у БД"""
+        keys = ([self._status_user_key(chat_id, user_id) for chat_id, user_id in pairs]
+                + [f"status:mod:{user_id}" for user_id in moderators]
+                + [f"status:chat:{chat_id}" for chat_id in chats])
+        if not keys:
+            return
+        try:
+            await self.get_redis().delete(*set(keys))
+        except Exception as e:
+            logger.warning(f"Failed to invalidate {len(keys)} status keys: {e}")
+
+    async def _load_status(self, chat_id: int, user_ids: List[int]) -> Tuple[Optional[bool], Dict[int, Dict]]:
+        pool = await self.get_pool()
+        async with pool.acquire() as conn:
+            if not user_ids:
+                filter_enabled = await conn.fetchval(
+                    "SELECT filter_enabled FROM chat_settings WHERE chat_id = $1", chat_id
+                )
+                return (True if filter_enabled is None else filter_enabled), {}
+            rows = await conn.fetch(
+                """SELECT u.user_id,
+                          m.user_id IS NOT NULL AS is_moderator,
+                          COALESCE(w.warn_count, 0) AS warn_count,
+                          b.user_id IS NOT NULL AS is_banned,
+                          s.user_id IS NOT NULL AS is_muted,
+                          (SELECT filter_enabled FROM chat_settings WHERE chat_id = $1) AS filter_enabled
+                   FROM unnest($2::bigint[]) AS u(user_id)
+                   LEFT JOIN moderators m ON m.user_id = u.user_id
+                   LEFT JOIN warnings w ON w.user_id = u.user_id AND w.chat_id = $1
+                   LEFT JOIN bans b ON b.user_id = u.user_id AND b.chat_id = $1
+                   LEFT JOIN active_sanctions s ON s.user_id = u.user_id AND s.chat_id = $1
+                        AND s.sanction_type = 'mute' AND (s.expires_at IS NULL OR s.expires_at > now())""",
+                chat_id, user_ids
+            )
+        filter_enabled = rows[0]['filter_enabled'] if rows else None
+        statuses = {
+            row['user_id']: {
+                'is_moderator': row['is_moderator'],
+                'warn_count': row['warn_count'],
+                'is_banned': row['is_banned'],
+                'is_muted': row['is_muted'],
+            }
+            for row in rows
+        }
+        # Чату немає в chat_settings — фільтр увімкнений, як і в get_filter_status
+        return (True if filter_enabled is None else filter_enabled), statuses
+
+    async def get_status_bulk(self, chat_id: int, user_ids: List[int]) -> Dict[str, Any]:
+        """Статус модератора, кількість варнів, бан/мут для багатьох користувачів і фільтр чату.
+
+        Повертає {'chat_id', 'filter_enabled', 'users': {user_id: {...}}, 'cache_misses'}.
+        З теплим кешем — один MGET; інакше ще один SQL-запит і один pipeline запису.
+        """
+        user_ids = list(dict.fromkeys(user_ids))
+        ttl = getattr(settings, 'STATUS_CACHE_TTL', 30)
+        keys = ([self._status_user_key(chat_id, user_id) for user_id in user_ids]
+                + [f"status:mod:{user_id}" for user_id in user_ids]
+                + [f"status:chat:{chat_id}"])
+        try:
+            client = self.get_redis()
+            values = await client.mget(keys)
+        except Exception as e:
+            logger.warning(f"Status cache unavailable: {e}")
+            client, values = None, [None] * len(keys)
+
+        count = len(user_ids)
+        users: Dict[int, Dict] = {}
+        missing = []
+        for index, user_id in enumerate(user_ids):
+            cached, moderator = values[index], values[count + index]
+            if cached is None or moderator is None:
+                missing.append(user_id)
+                continue
+            data = json.loads(cached)
+            users[user_id] = {'is_moderator': moderator == '1', 'warn_count': data['w'],
+                              'is_banned': bool(data['b']), 'is_muted': bool(data['m'])}
+        filter_enabled = None if values[-1] is None else values[-1] == '1'
+
+        if missing or filter_enabled is None:
+            loaded_filter, loaded = await self._load_status(chat_id, missing)
+            users.update(loaded)
+            if filter_enabled is None:
+                filter_enabled = loaded_filter
+            if client is not None:
+                try:
+                    async with client.pipeline(transaction=False) as pipe:
+                        for user_id, status in loaded.items():
+                            pipe.set(self._status_user_key(chat_id, user_id),
+                                     json.dumps({'w': status['warn_count'], 'b': int(status['is_banned']),
+                                                 'm': int(status['is_muted'])}), ex=ttl)
+                            pipe.set(f"status:mod:{user_id}", '1' if status['is_moderator'] else '0', ex=ttl)
+                        pipe.set(f"status:chat:{chat_id}", '1' if filter_enabled else '0', ex=ttl)
+                        await pipe.execute()
+                except Exception as e:
+                    logger.warning(f"Failed to fill status cache: {e}")
+
+        return {
+            'chat_id': chat_id,
+            'filter_enabled': filter_enabled,
+            'users': {user_id: users[user_id] for user_id in user_ids},
+            'cache_misses': len(missing),
+        }
 
     async def get_user_punishments(self, user_id: int, chat_id: int = None) -> List[Dict]:
         pool = await self.get_pool()
@@ -238,28 +1328,170 @@ class DatabaseManager:
             results = await conn.fetch(query, *params)
             return [dict(row) for row in results]
 
+    @staticmethod
+    def _punishment_conditions(params: List[Any], chat_id: Optional[int] = None,
+                               punishment_type: Optional[str] = None,
+                               moderator_id: Optional[int] = None,
+                               date_from: Optional[date] = None,
+                               date_to: Optional[date] = None) -> List[str]:
+        """Умови WHERE для punishments p; значення додаються в params як $N"""
+        conditions = []
+
+        def param(value) -> str:
+            params.append(value)
+            return f'${len(params)}'
+
+        if chat_id:
+            conditions.append(f"p.chat_id = {param(chat_id)}")
+        if punishment_type:
+            conditions.append(f"p.punishment_type = {param(punishment_type)}")
+        if moderator_id:
+            conditions.append(f"p.moderator_id = {param(moderator_id)}")
+        if date_from:
+            conditions.append(f"p.timestamp >= {param(date_from)}::date")
+        if date_to:
+            conditions.append(f"p.timestamp < {param(date_to)}::date + 1")
+        return conditions
+
+    async def search_punishments(self, query: Optional[str] = None, chat_id: Optional[int] = None,
+                                 punishment_type: Optional[str] = None,
+                                 moderator_id: Optional[int] = None,
+                                 date_from: Optional[date] = None, date_to: Optional[date] = None,
+                                 page: int = 1, per_page: int = 50) -> Dict[str, Any]:
+        """Повнотекстовий пошук по причинах покарань з фільтрами.
+
+        З query результати впорядковані за ts_rank_cd, інакше — від нових до старих.
+        COUNT(*) не рахується: has_next визначається вибіркою per_page + 1 рядків.
+        """
+        params: List[Any] = []
+        conditions = self._punishment_conditions(params, chat_id, punishment_type, moderator_id,
+                                                 date_from, date_to)
+
+        rank = "NULL::real"
+        order = "p.timestamp DESC, p.id DESC"
+        if query:
+            params.append(query)
+            tsquery = f"websearch_to_tsquery('simple', ${len(params)})"
+            conditions.append(f"{REASON_TSVECTOR} @@ {tsquery}")
+            rank = f"ts_rank_cd({REASON_TSVECTOR}, {tsquery})"
+            order = "rank DESC, " + order
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        params.extend([per_page + 1, (page - 1) * per_page])
+        sql = f"""
+            SELECT p.*, m.username AS moderator_username, {rank} AS rank
+            FROM punishments p
+            LEFT JOIN moderators m ON p.moderator_id = m.user_id
+            {where}
+            ORDER BY {order}
+            LIMIT ${len(params) - 1} OFFSET ${len(params)}
+        """
+
+        pool = await self.get_pool()
+        async with pool.acquire() as conn:
+            rows = await conn.fetch(sql, *params)
+        return {
+            'results': [dict(row) for row in rows[:per_page]],
+            'page': page,
+            'has_next': len(rows) > per_page,
+            'has_previous': page > 1,
+        }
+
+    @classmethod
+    def _export_query(cls, chat_id: Optional[int] = None, punishment_type: Optional[str] = None,
+                      moderator_id: Optional[int] = None, date_from: Optional[date] = None,
+                      date_to: Optional[date] = None) -> Tuple[str, List[Any]]:
+        params: List[Any] = []
+        conditions = cls._punishment_conditions(params, chat_id, punishment_type, moderator_id,
+                                                date_from, date_to)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        sql = f"""
+            SELECT p.id, p.timestamp, p.chat_id, cs.chat_title, p.user_id, p.punishment_type,
+                   p.reason, p.duration_minutes, p.moderator_id, m.username AS moderator_username
+            FROM punishments p
+            LEFT JOIN moderators m ON p.moderator_id = m.user_id
+            LEFT JOIN chat_settings cs ON p.chat_id = cs.chat_id
+            {where}
+            ORDER BY p.timestamp, p.id
+        """
+        return sql, params
+
+    async def export_punishments(self, chat_id: Optional[int] = None,
+                                 punishment_type: Optional[str] = None,
+                                 moderator_id: Optional[int] = None,
+                                 date_from: Optional[date] = None, date_to: Optional[date] = None,
+                                 batch_size: int = 5000):
+        """Async-генератор пакетів рядків для експорту (серверний курсор, стала пам'ять).
+
+        З'єднання утримується до кінця ітерації — закривайте генератор (aclose),
+        якщо споживач зупинився раніше.
+        """
+        sql, params = self._export_query(chat_id, punishment_type, moderator_id, date_from, date_to)
+
+        pool = await self.get_pool()
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                cursor = await conn.cursor(sql, *params)
+                while True:
+                    rows = await cursor.fetch(batch_size)
+                    if not rows:
+                        break
+                    yield rows
+
     async def get_moderation_stats(self, chat_id: int = None, days: int = 30) -> List[Dict]:
+        """Статистика по днях з punishment_daily_stats (без сканування punishments)"""
         pool = await self.get_pool()
         async with pool.acquire() as conn:
             query = """
-                SELECT 
+                SELECT
                     punishment_type,
-                    COUNT(*) as count,
-                    DATE(timestamp) as date
-                FROM punishments 
-                WHERE timestamp >= NOW() - INTERVAL '%s days'
-            """ % days
+                    SUM(count)::int as count,
+                    date
+                FROM punishment_daily_stats
+                WHERE date >= CURRENT_DATE - $1::int
+            """
 
-            params = []
+            params = [days]
             if chat_id:
-                query += " AND chat_id = $1"
+                query += " AND chat_id = $2"
                 params.append(chat_id)
 
-            query += " GROUP BY punishment_type, DATE(timestamp) ORDER BY date DESC"
+            query += " GROUP BY punishment_type, date ORDER BY date DESC"
 
             results = await conn.fetch(query, *params)
             return [dict(row) for row in results]
 
+    async def reconcile_daily_stats(self, days: Optional[int] = None) -> int:
+        """Перераховує punishment_daily_stats з punishments (за останні days днів або весь час).
+
+        Потрібно для записів, які бот пише в punishments напряму, в обхід DatabaseManager.
+        """
+        pool = await self.get_pool()
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                if days is None:
+                    # Підсумки за дні до найстарішого рядка лишаються: їхні партиції
+                    # могли бути від'єднані політикою retention (partition_punishments)
+                    await conn.execute(
+                        """DELETE FROM punishment_daily_stats
+                           WHERE date >= (SELECT DATE(MIN(timestamp)) FROM punishments)"""
+                    )
+                    where, params = "", []
+                else:
+                    await conn.execute(
+                        "DELETE FROM punishment_daily_stats WHERE date >= CURRENT_DATE - $1::int", days
+                    )
+                    where, params = "WHERE timestamp >= (CURRENT_DATE - $1::int)::timestamp", [days]
+                status = await conn.execute(
+                    f"""INSERT INTO punishment_daily_stats (date, chat_id, punishment_type, moderator_id, count)
+                        SELECT DATE(timestamp), chat_id, punishment_type, COALESCE(moderator_id, 0), COUNT(*)
+                        FROM punishments
+                        {where}
+                        GROUP BY 1, 2, 3, 4""",
+                    *params
+                )
+                return int(status.split()[-1])
+
 
 # Глобальний екземпляр
 db_manager = DatabaseManager()
\ No newline at end of file
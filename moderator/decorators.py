@@ -0,0 +1,64 @@
+import json
+from functools import wraps
+from typing import Iterable
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.views import redirect_to_login
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse
+from rest_framework import status
+
+# Django 4.2 login_required і DRF @api_view не підтримують async def view,
+# тому для async view — власні тонкі відповідники з тією ж поведінкою.
+
+
+async def _is_authenticated(request) -> bool:
+    # request.user лінивий: перше звернення читає сесію і користувача з БД
+    return await sync_to_async(lambda: request.user.is_authenticated)()
+
+
+def async_login_required(view):
+    """login_required для async view: неавторизованих перенаправляє на LOGIN_URL"""
+
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if not await _is_authenticated(request):
+            return redirect_to_login(request.get_full_path())
+        return await view(request, *args, **kwargs)
+
+    return wrapper
+
+
+def async_api_view(methods: Iterable[str]):
+    """Аналог @api_view + IsAuthenticated для async view.
+
+    Як і SessionAuthentication у REST_FRAMEWORK: сесійна автентифікація (CSRF
+    перевіряє CsrfViewMiddleware), 403 без входу, 405 для інших методів.
+    request.data — розібраний JSON або form-data; view повертає dict або JsonResponse.
+    """
+    allowed = [method.upper() for method in methods]
+
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in allowed:
+                return JsonResponse({'detail': f'Method "{request.method}" not allowed.'},
+                                    status=status.HTTP_405_METHOD_NOT_ALLOWED)
+            if not await _is_authenticated(request):
+                return JsonResponse({'detail': 'Authentication credentials were not provided.'},
+                                    status=status.HTTP_403_FORBIDDEN)
+            if request.content_type == 'application/json':
+                try:
+                    request.data = json.loads(request.body or b'{}')
+                except ValueError:
+                    return JsonResponse({'detail': 'JSON parse error'}, status=status.HTTP_400_BAD_REQUEST)
+            else:
+                request.data = request.POST
+            result = await view(request, *args, **kwargs)
+            if isinstance(result, dict):
+                return JsonResponse(result, encoder=DjangoJSONEncoder)
+            return result
+
+        return wrapper
+
+    return decorator
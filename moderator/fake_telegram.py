@@ -0,0 +1,203 @@
+import asyncio
+import json
+import math
+import random
+import ssl
+import time
+from collections import Counter
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+import certifi
+
+from .database import ModerationTask
+from .ratelimit import RetryAfter
+import logging
+logger = logging.getLogger(__name__)
+
+
+class _Bucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.ts = time.monotonic()
+
+    def wait(self) -> float:
+        """0 — токен є, інакше секунди до наступного токена (нічого не списує)"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.ts) * self.rate)
+        self.ts = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+
+class FakeTelegramServer:
+    """Локальний замінник Bot API для навантажувальних тестів воркера.
+
+    Приймає POST /bot<token>/<method> (JSON або form), відповідає {"ok": true}
+    з латентністю latency_ms і повертає 429 з parameters.retry_after, як Telegram,
+    коли перевищено ліміт на чат або глобальний.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 8081, latency_ms: float = 30.0,
+                 global_rate: float = 30.0, global_burst: int = 30,
+                 chat_rate: float = 20 / 60, chat_burst: int = 20):
+        self.host = host
+        self.port = port
+        self.latency_ms = latency_ms
+        self._global = _Bucket(global_rate, global_burst)
+        self._chat_limits = (chat_rate, chat_burst)
+        self._chats: Dict[str, _Bucket] = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+        self.stats: Counter = Counter()
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._serve, self.host, self.port)
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    def _limit(self, chat_id: Optional[str]) -> float:
+        # Як _ACQUIRE у ratelimit: токен списується лише якщо він є в обох відрах,
+        # тож відмова по чату не з'їдає глобальний ліміт
+        buckets = [self._global]
+        if chat_id is not None:
+            bucket = self._chats.get(chat_id)
+            if bucket is None:
+                bucket = self._chats[chat_id] = _Bucket(*self._chat_limits)
+            buckets.append(bucket)
+        wait = max(bucket.wait() for bucket in buckets)
+        if not wait:
+            for bucket in buckets:
+                bucket.take()
+        return wait
+
+    async def _respond(self, writer, status: int, payload: Dict[str, Any]):
+        body = json.dumps(payload).encode()
+        reason = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 429: 'Too Many Requests'}[status]
+        writer.write(f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\n"
+                     f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+        await writer.drain()
+
+    async def _serve(self, reader, writer):
+        try:
+            request_line = (await reader.readline()).decode()
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode().strip()
+                if not line:
+                    break
+                name, _, value = line.partition(':')
+                headers[name.strip().lower()] = value.strip()
+            raw = await reader.readexactly(int(headers.get('content-length', 0)))
+            path = request_line.split()[1]
+            parts = path.strip('/').split('/')
+            if len(parts) != 2 or not parts[0].startswith('bot'):
+                self.stats['not_found'] += 1
+                await self._respond(writer, 404, {'ok': False, 'error_code': 404, 'description': 'Not Found'})
+                return
+            method = parts[1]
+            if headers.get('content-type', '').startswith('application/json'):
+                params = json.loads(raw or b'{}')
+            else:
+                params = dict(parse_qsl(raw.decode()))
+
+            wait = self._limit(str(params['chat_id']) if 'chat_id' in params else None)
+            if wait:
+                retry_after = max(1, math.ceil(wait))
+                self.stats['throttled'] += 1
+                await self._respond(writer, 429, {
+                    'ok': False, 'error_code': 429,
+                    'description': f'Too Many Requests: retry after {retry_after}',
+                    'parameters': {'retry_after': retry_after},
+                })
+                return
+            await asyncio.sleep(max(0.0, random.gauss(self.latency_ms, self.latency_ms / 4)) / 1000)
+            self.stats['ok'] += 1
+            self.stats[method] += 1
+            await self._respond(writer, 200, {'ok': True, 'result': True})
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except Exception as e:
+            self.stats['errors'] += 1
+            logger.warning(f"Fake Telegram request failed: {e}")
+            await self._respond(writer, 400, {'ok': False, 'error_code': 400, 'description': str(e)})
+        finally:
+            writer.close()
+
+
+async def _post_json(url: str, payload: Dict[str, Any], timeout: float = 10.0) -> Tuple[int, Dict[str, Any]]:
+    # Мінімальний HTTP/1.1 клієнт (без keep-alive), щоб не додавати залежність
+    parts = urlsplit(url)
+    secure = parts.scheme == 'https'
+    context = ssl.create_default_context(cafile=certifi.where()) if secure else None
+    reader, writer = await asyncio.wait_for(
+        asyncio.open_connection(parts.hostname, parts.port or (443 if secure else 80), ssl=context), timeout
+    )
+    try:
+        body = json.dumps(payload).encode()
+        writer.write(f"POST {parts.path} HTTP/1.1\r\nHost: {parts.hostname}\r\n"
+                     f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+                     f"Connection: close\r\n\r\n".encode() + body)
+        await writer.drain()
+        response = await asyncio.wait_for(reader.read(), timeout)
+    finally:
+        writer.close()
+    head, _, content = response.partition(b'\r\n\r\n')
+    status = int(head.split(b' ', 2)[1])
+    return status, json.loads(content or b'{}')
+
+
+class BotApiExecutor:
+    """Обробник завдань, що викликає Bot API (справжній або FakeTelegramServer).
+
+    На 429 піднімає RetryAfter: QueueWorker з limiter поверне завдання в розклад.
+    """
+
+    def __init__(self, base_url: str, token: str):
+        self.base_url = base_url.rstrip('/')
+        self.token = token
+
+    async def _call(self, method: str, **params):
+        status, payload = await _post_json(f"{self.base_url}/bot{self.token}/{method}", params)
+        if status == 429:
+            raise RetryAfter(payload.get('parameters', {}).get('retry_after', 1),
+                             message=payload.get('description', ''))
+        if not payload.get('ok'):
+            raise RuntimeError(f"{method} failed: {payload.get('description', status)}")
+
+    async def __call__(self, task: ModerationTask):
+        target = {'chat_id': task.chat_id, 'user_id': task.user_id}
+        if task.task_type == 'ban':
+            await self._call('banChatMember', **target)
+        elif task.task_type == 'kick':
+            await self._call('banChatMember', **target)
+            await self._call('unbanChatMember', **target, only_if_banned=True)
+        elif task.task_type == 'unban':
+            await self._call('unbanChatMember', **target, only_if_banned=True)
+        elif task.task_type == 'mute':
+            until = int(time.time()) + (task.duration_minutes or 60) * 60
+            await self._call('restrictChatMember', **target, until_date=until,
+                             permissions={'can_send_messages': False})
+        elif task.task_type == 'unmute':
+            await self._call('restrictChatMember', **target, permissions={
+                'can_send_messages': True, 'can_send_other_messages': True,
+                'can_add_web_page_previews': True, 'can_send_polls': True,
+            })
+        elif task.task_type == 'warn':
+            await self._call('sendMessage', chat_id=task.chat_id,
+                             text=f"Попередження для {task.username or task.user_id}: {task.reason}")
+        elif task.task_type == 'unwarn':
+            # Знімається лише в БД, у Telegram дії немає
+            return
+        else:
+            raise LookupError(f"No Bot API mapping for task type {task.task_type!r}")
@@ -0,0 +1,134 @@
+import asyncio
+import os
+from typing import Any, Dict, Optional
+
+from asgiref.sync import sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+from .cache import get_chat_titles, get_moderator_map
+from .async_runtime import call_async
+from .database import db_manager
+import logging
+logger = logging.getLogger(__name__)
+
+DASHBOARD_GROUP = 'dashboard'
+LEADER_KEY = 'dashboard:feed:leader'
+
+# Продовжує лідерство лише власнику ключа або захоплює вільний ключ
+_CLAIM_LEADER = """
+    local owner = redis.call('GET', KEYS[1])
+    if owner == false or owner == ARGV[1] then
+        redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+        return 1
+    end
+    return 0
+"""
+
+_RELEASE_LEADER = """
+    if redis.call('GET', KEYS[1]) == ARGV[1] then
+        return redis.call('DEL', KEYS[1])
+    end
+    return 0
+"""
+
+
+class DashboardFeed:
+    """Розсилає живі оновлення dashboard пакетами з фіксованим тіком.
+
+    Раз на tick секунд забирає нові покарання з буфера в Redis, читає лічильники
+    і глибину черги (теж з Redis) і відправляє один кадр у групу Channels.
+    Кількість відкритих dashboard не впливає на навантаження на БД: кадр один
+    на тік, а не на з'єднання. Під кількома воркерами uvicorn тікає лише лідер
+    (ключ у Redis з TTL), решта чекають на випадок його зупинки.
+    """
+
+    def __init__(self, tick: float = None, max_events: int = None):
+        self.tick = tick or getattr(settings, 'DASHBOARD_FEED_TICK', 1.0)
+        self.max_events = max_events or getattr(settings, 'DASHBOARD_FEED_MAX_EVENTS', 200)
+        self.identity = f"{os.uname().nodename}:{os.getpid()}"
+        self._last_counters: Optional[Dict[str, int]] = None
+        self._last_queue_depth: Optional[int] = None
+        self._stopped = asyncio.Event()
+        self.frames = 0
+
+    def stop(self):
+        self._stopped.set()
+
+    async def _is_leader(self) -> bool:
+        ttl_ms = int(self.tick * 3000)
+        return bool(await db_manager.get_redis().eval(_CLAIM_LEADER, 1, LEADER_KEY, self.identity, ttl_ms))
+
+    @staticmethod
+    def _label(events, moderators: Dict[int, str], chats: Dict[str, str]):
+        for event in events:
+            event['moderator'] = moderators.get(event['moderator_id'])
+            event['chat_title'] = chats.get(str(event['chat_id']))
+        return events
+
+    async def build_frame(self) -> Optional[Dict[str, Any]]:
+        """Кадр з усім, що змінилося з попереднього тіку, або None, якщо змін немає"""
+        events, backlog = await db_manager.drain_dashboard_events(self.max_events)
+        frame: Dict[str, Any] = {}
+        if events:
+            # In-process LookupCache: без запиту в БД, поки кеш теплий
+            moderators = await sync_to_async(get_moderator_map)()
+            chats = await sync_to_async(get_chat_titles)()
+            frame['punishments'] = self._label(events, moderators, chats)
+            if backlog:
+                # Решта піде наступними тіками; клієнт показує, що стрічка відстає
+                frame['backlog'] = backlog
+
+        try:
+            counters = await db_manager.get_dashboard_counters()
+        except Exception as e:
+            logger.warning(f"Dashboard feed: counters unavailable: {e}")
+            counters = self._last_counters
+        if counters != self._last_counters:
+            frame['counters'] = counters
+            self._last_counters = counters
+
+        queue_depth = await db_manager.get_queue_length()
+        if queue_depth != self._last_queue_depth:
+            frame['queue_depth'] = queue_depth
+            self._last_queue_depth = queue_depth
+
+        return frame or None
+
+    @staticmethod
+    async def snapshot() -> Dict[str, Any]:
+        """Поточні лічильники і глибина черги для щойно підключеного клієнта"""
+        return {
+            'counters': await call_async(db_manager.get_dashboard_counters()),
+            'queue_depth': await call_async(db_manager.get_queue_length()),
+        }
+
+    async def run(self):
+        layer = get_channel_layer()
+        if layer is None:
+            logger.warning("Dashboard feed disabled: CHANNEL_LAYERS is not configured")
+            return
+        leader = False
+        while not self._stopped.is_set():
+            try:
+                leader = await self._is_leader()
+                if leader:
+                    frame = await self.build_frame()
+                    if frame:
+                        await layer.group_send(DASHBOARD_GROUP, {'type': 'dashboard.frame', 'frame': frame})
+                        self.frames += 1
+                else:
+                    # Новий лідер почне з повного кадру
+                    self._last_counters = self._last_queue_depth = None
+            except Exception as e:
+                logger.warning(f"Dashboard feed tick failed: {e}")
+            try:
+                await asyncio.wait_for(self._stopped.wait(), timeout=self.tick)
+            except asyncio.TimeoutError:
+                pass
+        if leader:
+            # Звільняємо лідерство одразу, щоб інший воркер не чекав TTL
+            try:
+                await db_manager.get_redis().eval(_RELEASE_LEADER, 1, LEADER_KEY, self.identity)
+            except Exception:
+                pass
@@ -0,0 +1,288 @@
+import csv
+import io
+import json
+import time
+from datetime import datetime, timezone as dt_timezone
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+
+from .database import db_manager
+from .async_runtime import run_async
+import logging
+logger = logging.getLogger(__name__)
+
+STAGING_COLUMNS = ['user_id', 'chat_id', 'punishment_type', 'reason', 'timestamp',
+                   'duration_minutes', 'moderator_id']
+VALID_TYPES = ('ban', 'kick', 'mute', 'warn')
+
+
+def _to_int(value) -> Optional[int]:
+    if value is None or value == '':
+        return None
+    return int(value)
+
+
+def _to_datetime(value) -> datetime:
+    parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    # punishments.timestamp — timestamp без зони (UTC), і експорт віддає його як є:
+    # наївний час лишається наївним, час із зоною переводиться в UTC
+    if parsed.tzinfo:
+        parsed = parsed.astimezone(dt_timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def _to_record(data: Dict[str, Any]) -> Tuple:
+    return (
+        _to_int(data.get('user_id')),
+        _to_int(data.get('chat_id')),
+        (data.get('punishment_type') or '').strip().lower(),
+        data.get('reason') or '',
+        _to_datetime(data['timestamp']),
+        _to_int(data.get('duration_minutes')),
+        _to_int(data.get('moderator_id')),
+    )
+
+
+def parse_records(lines: Iterable[str], file_format: str) -> Iterator[Tuple[Optional[Tuple], Optional[str]]]:
+    """Повертає (record, None) або (None, помилка) для кожного рядка CSV/NDJSON.
+
+    Формат колонок збігається з експортом (api/export/), зайві колонки ігноруються.
+    """
+    if file_format == 'csv':
+        rows = csv.DictReader(lines)
+        for line_no, row in enumerate(rows, start=2):
+            try:
+                yield _to_record(row), None
+            except (KeyError, TypeError, ValueError) as e:
+                yield None, f"line {line_no}: {e}"
+    elif file_format == 'ndjson':
+        for line_no, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield _to_record(json.loads(line)), None
+            except (KeyError, TypeError, ValueError) as e:
+                yield None, f"line {line_no}: {e}"
+    else:
+        raise ValueError(f"Unsupported format: {file_format}")
+
+
+class PunishmentImport:
+    """Імпорт історичних покарань: COPY у тимчасову staging-таблицю, валідація, merge.
+
+    Усе відбувається в одній транзакції на одному з'єднанні: або імпорт
+    застосовується повністю, або (помилка / dry_run) не застосовується зовсім.
+    Кожен метод — корутина; з sync-коду викликайте через run_async.
+    """
+
+    def __init__(self):
+        self._conn = None
+        self._pool = None
+        self._transaction = None
+        self.copied = 0
+
+    async def start(self):
+        self._pool = await db_manager.get_pool()
+        self._conn = await self._pool.acquire()
+        try:
+            self._transaction = self._conn.transaction()
+            await self._transaction.start()
+        except Exception:
+            await self._release()
+            raise
+        # now() і DATE(timestamp) порівнюються з наївним часом в UTC незалежно від TimeZone сервера
+        await self._conn.execute("SET LOCAL TimeZone = 'UTC'")
+        # Той самий тип, що й punishments.timestamp: анти-join дублів порівнює значення без перетворень
+        await self._conn.execute(
+            """CREATE TEMP TABLE punishments_import (
+                   user_id bigint,
+                   chat_id bigint,
+                   punishment_type text,
+                   reason text,
+                   timestamp timestamp,
+                   duration_minutes integer,
+                   moderator_id bigint
+               ) ON COMMIT DROP"""
+        )
+
+    async def copy(self, records: List[Tuple]):
+        await self._conn.copy_records_to_table('punishments_import', records=records,
+                                               columns=STAGING_COLUMNS)
+        self.copied += len(records)
+
+    async def finish(self, dry_run: bool = False) -> Dict[str, int]:
+        """Валідація, відсіювання дублів і merge у punishments, bans, warnings, punishment_daily_stats"""
+        conn = self._conn
+        try:
+            rejected = await conn.fetchval(
+                """WITH bad AS (
+                       DELETE FROM punishments_import
+                       WHERE user_id IS NULL OR chat_id IS NULL OR timestamp IS NULL
+                          OR punishment_type <> ALL($1::text[])
+                          OR timestamp > now()
+                       RETURNING 1
+                   )
+                   SELECT COUNT(*) FROM bad""",
+                list(VALID_TYPES)
+            )
+
+            # Ідемпотентність: покарання визначається (user_id, chat_id, punishment_type, timestamp).
+            # Повторний імпорт того самого файлу (або файлу, що перетинається з уже імпортованим
+            # чи з історією бота) не додає рядків і не збільшує warn_count вдруге
+            status = await conn.execute(
+                """DELETE FROM punishments_import
+                   WHERE ctid IN (
+                       SELECT ctid FROM (
+                           SELECT ctid, row_number() OVER (
+                               PARTITION BY user_id, chat_id, punishment_type, timestamp
+                           ) AS copy_no
+                           FROM punishments_import
+                       ) numbered
+                       WHERE copy_no > 1
+                   )"""
+            )
+            duplicates = int(status.split()[-1])
+            # Анти-join йде по індексу punishments_user_chat_type_timestamp
+            status = await conn.execute(
+                """DELETE FROM punishments_import i
+                   USING punishments p
+                   WHERE p.user_id = i.user_id AND p.chat_id = i.chat_id
+                     AND p.punishment_type = i.punishment_type AND p.timestamp = i.timestamp"""
+            )
+            duplicates += int(status.split()[-1])
+
+            status = await conn.execute(
+                """INSERT INTO punishments (user_id, chat_id, punishment_type, reason, timestamp,
+                                           duration_minutes, moderator_id)
+                   SELECT user_id, chat_id, punishment_type, reason, timestamp,
+                          duration_minutes, moderator_id
+                   FROM punishments_import"""
+            )
+            imported = int(status.split()[-1])
+
+            # Як add_ban: один рядок на (user_id, chat_id), перемагає причина останнього бану
+            new_bans = await conn.fetchval(
+                """WITH b AS (
+                       INSERT INTO bans (user_id, chat_id, reason)
+                       SELECT DISTINCT ON (user_id, chat_id) user_id, chat_id, reason
+                       FROM punishments_import
+                       WHERE punishment_type = 'ban'
+                       ORDER BY user_id, chat_id, timestamp DESC
+                       ON CONFLICT (user_id, chat_id) DO UPDATE SET reason = EXCLUDED.reason
+                       RETURNING (xmax = 0) AS inserted
+                   )
+                   SELECT COUNT(*) FILTER (WHERE inserted) FROM b"""
+            )
+
+            # Як add_warning, викликаний для кожного варну: лічильник збільшується на їх кількість
+            status = await conn.execute(
+                """INSERT INTO warnings (user_id, chat_id, warn_count)
+                   SELECT user_id, chat_id, COUNT(*)
+                   FROM punishments_import
+                   WHERE punishment_type = 'warn'
+                   GROUP BY user_id, chat_id
+                   ON CONFLICT (user_id, chat_id) DO
+                   UPDATE SET warn_count = warnings.warn_count + EXCLUDED.warn_count"""
+            )
+            warned = int(status.split()[-1])
+
+            await conn.execute(
+                """INSERT INTO punishment_daily_stats (date, chat_id, punishment_type, moderator_id, count)
+                   SELECT DATE(timestamp), chat_id, punishment_type, COALESCE(moderator_id, 0), COUNT(*)
+                   FROM punishments_import
+                   GROUP BY 1, 2, 3, 4
+                   ON CONFLICT (date, chat_id, punishment_type, moderator_id)
+                   DO UPDATE SET count = punishment_daily_stats.count + EXCLUDED.count"""
+            )
+
+            # HLL-лічильники живуть OFFENDERS_HLL_TTL_DAYS, старіша історія в них не потрапляє.
+            # Staging-таблиця зникає на COMMIT, тому читаємо до нього.
+            recent = await conn.fetch(
+                """SELECT DISTINCT DATE(timestamp) AS day, chat_id, user_id
+                   FROM punishments_import
+                   WHERE timestamp >= (CURRENT_DATE - $1::int)::timestamp""",
+                getattr(settings, 'OFFENDERS_HLL_TTL_DAYS', 400) - 1
+            )
+
+        except Exception:
+            await self.abort()
+            raise
+
+        try:
+            if dry_run:
+                await self._transaction.rollback()
+            else:
+                await self._transaction.commit()
+        finally:
+            await self._release()
+
+        if not dry_run:
+            if new_bans:
+                await db_manager.adjust_counters(total_bans=new_bans)
+            by_day: Dict[Any, List[Tuple[int, int]]] = {}
+            for row in recent:
+                by_day.setdefault(row['day'], []).append((row['chat_id'], row['user_id']))
+            for day, offenders in by_day.items():
+                await db_manager._track_offenders(offenders, day)
+        return {'imported': imported, 'rejected': rejected, 'duplicates': duplicates,
+                'new_bans': new_bans, 'warned_users': warned}
+
+    async def abort(self):
+        if self._conn is None:
+            return
+        try:
+            await self._transaction.rollback()
+        finally:
+            await self._release()
+
+    async def _release(self):
+        if self._conn is not None:
+            await self._pool.release(self._conn)
+            self._conn = None
+
+
+def import_punishments(lines: Iterable[str], file_format: str, batch_size: int = 50000,
+                       dry_run: bool = False,
+                       progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    """Синхронна обгортка: парсинг у поточному потоці, COPY пакетами через async runtime"""
+    started = time.perf_counter()
+    session = PunishmentImport()
+    errors: List[str] = []
+    batch: List[Tuple] = []
+    try:
+        run_async(session.start())
+        for record, error in parse_records(lines, file_format):
+            if error:
+                errors.append(error)
+                continue
+            batch.append(record)
+            if len(batch) >= batch_size:
+                run_async(session.copy(batch))
+                batch = []
+                if progress:
+                    elapsed = time.perf_counter() - started
+                    progress({'copied': session.copied, 'parse_errors': len(errors),
+                              'elapsed': elapsed, 'rows_per_second': session.copied / elapsed})
+        if batch:
+            run_async(session.copy(batch))
+    except Exception:
+        run_async(session.abort())
+        raise
+
+    result = run_async(session.finish(dry_run=dry_run))
+    elapsed = time.perf_counter() - started
+    result.update({
+        'copied': session.copied,
+        'parse_errors': len(errors),
+        'errors': errors[:100],
+        'dry_run': dry_run,
+        'elapsed': round(elapsed, 3),
+        'rows_per_second': round(session.copied / elapsed) if elapsed else None,
+    })
+    return result
+
+
+def text_lines(binary_file) -> io.TextIOWrapper:
+    """Текстовий потік з бінарного файлу (upload), з урахуванням BOM з експорту"""
+    return io.TextIOWrapper(binary_file, encoding='utf-8-sig', newline='')
@@ -0,0 +1,92 @@
+from typing import Callable, List, Tuple
+
+# Індекси для таблиць бота (managed = False): Django їх не створює, а запити
+# views.py / database.py на них розраховують. Кожен запис — (ім'я, таблиця, визначення).
+BOT_TABLE_INDEXES: Tuple[Tuple[str, str, str], ...] = (
+    # Дашборд, експорт, аналітика за період: keyset по (timestamp, id)
+    ('punishments_timestamp_id', 'punishments', '(timestamp DESC, id DESC)'),
+    # Профіль модератора (keyset) і фільтр moderator_id у пошуку
+    ('punishments_moderator_timestamp', 'punishments', '(moderator_id, timestamp DESC, id DESC)'),
+    # lift_mute / remove_mute, get_user_punishments, user_detail (префікс user_id)
+    ('punishments_user_chat_type_timestamp', 'punishments',
+     '(user_id, chat_id, punishment_type, timestamp DESC)'),
+    # Фільтр за чатом у пошуку, експорті й аналітиці
+    ('punishments_chat_timestamp', 'punishments', '(chat_id, timestamp DESC)'),
+    # Повнотекстовий пошук по причинах (з MANAGE_BOT_TABLE_INDEXES створює міграція 0006)
+    ('punishments_reason_fts', 'punishments',
+     "USING gin (to_tsvector('simple', coalesce(reason, '')))"),
+)
+
+
+def _table_exists(cursor, table: str) -> bool:
+    cursor.execute("SELECT to_regclass(%s) IS NOT NULL", [table])
+    return cursor.fetchone()[0]
+
+
+def _partitions(cursor, table: str) -> List[str]:
+    cursor.execute(
+        """SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+           WHERE i.inhparent = to_regclass(%s) ORDER BY c.relname""",
+        [table]
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+
+def _is_partitioned(cursor, table: str) -> bool:
+    cursor.execute("SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass(%s)", [table])
+    row = cursor.fetchone()
+    return bool(row and row[0])
+
+
+def _create_partitioned_index(cursor, name: str, table: str, definition: str,
+                              log: Callable[[str], None]):
+    # CONCURRENTLY не підтримується для партиціонованих таблиць: індекс створюється
+    # ON ONLY батьківської таблиці (невалідний), будується CONCURRENTLY на кожній
+    # партиції і приєднується; після останньої партиції батьківський стає валідним
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON ONLY {table} {definition}")
+    suffix = name[len(table):] if name.startswith(table) else f'_{name}'
+    for partition in _partitions(cursor, table):
+        child = f"{partition}{suffix}"[:63]
+        log(f"creating {child} on {partition}")
+        cursor.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {child} ON {partition} {definition}")
+        cursor.execute(f"ALTER INDEX {name} ATTACH PARTITION {child}")
+
+
+def create_bot_indexes(cursor, concurrently: bool = True,
+                       log: Callable[[str], None] = lambda message: None) -> List[str]:
+    """Створює відсутні індекси; повертає імена тих, для яких виконано CREATE INDEX.
+
+    concurrently=True не блокує запис бота, але не працює всередині транзакції.
+    """
+    created = []
+    mode = 'CONCURRENTLY ' if concurrently else ''
+    for name, table, definition in BOT_TABLE_INDEXES:
+        if not _table_exists(cursor, table):
+            log(f"skip {name}: table {table} does not exist")
+            continue
+        cursor.execute("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)", [name])
+        row = cursor.fetchone()
+        if row and row[0]:
+            continue
+        if concurrently and _is_partitioned(cursor, table):
+            _create_partitioned_index(cursor, name, table, definition, log)
+            created.append(name)
+            continue
+        if row:
+            # Перерваний CREATE INDEX CONCURRENTLY лишає невалідний індекс — перестворюємо
+            log(f"dropping invalid index {name}")
+            cursor.execute(f"DROP INDEX {mode}IF EXISTS {name}")
+        log(f"creating {name} on {table}")
+        cursor.execute(f"CREATE INDEX {mode}IF NOT EXISTS {name} ON {table} {definition}")
+        created.append(name)
+    return created
+
+
+def drop_bot_indexes(cursor, concurrently: bool = True) -> None:
+    for name, table, _definition in BOT_TABLE_INDEXES:
+        if name == 'punishments_reason_fts':
+            # Належить міграції 0006
+            continue
+        # Індекс партиціонованої таблиці видаляється лише без CONCURRENTLY
+        mode = 'CONCURRENTLY ' if concurrently and not _is_partitioned(cursor, table) else ''
+        cursor.execute(f"DROP INDEX {mode}IF EXISTS {name}")
@@ -0,0 +1,192 @@
+import asyncio
+import statistics
+import time
+from datetime import date
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from moderator.database import db_manager, ModerationTask
+from moderator.async_runtime import run_async
+
+MODES = ('view-legacy', 'view', 'legacy', 'runtime', 'composite')
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = ("Бенчмарк бану. view / view-legacy — POST api/ban/ через повний стек Django "
+            "(middleware, сесія, view) з постійним пулом або з новим пулом на кожен запит, як "
+            "до async runtime. legacy / runtime / composite — лише шлях до БД без view. "
+            "Пише лише у порожній тестовий чат (--chat-id) і відкочує все після себе: бани, "
+            "punishments, punishment_daily_stats, лічильники і HLL; завдання бота йдуть в окремий стрім.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chat-id', type=int, required=True,
+                            help='Тестовий chat_id без жодних даних (не в chat_settings, без банів і покарань)')
+        parser.add_argument('--user-id', type=int, default=1, help='Перший user_id для бану')
+        parser.add_argument('--moderator-id', type=int, default=0)
+        parser.add_argument('--iterations', type=int, default=200)
+        parser.add_argument('--mode', choices=MODES + ('all',), default='all')
+        parser.add_argument('--username', help='Від чийого імені POST (за замовчуванням — перший superuser)')
+
+    def _ban(self, user_id, chat_id, moderator_id):
+        return [
+            db_manager.add_ban(user_id, chat_id, 'benchmark'),
+            db_manager.add_punishment(user_id, chat_id, 'ban', 'benchmark', moderator_id),
+        ]
+
+    def _run_legacy(self, user_id, chat_id, moderator_id):
+        # Так працювали view раніше: новий loop -> новий пул -> нове з'єднання
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            for coro in self._ban(user_id, chat_id, moderator_id):
+                loop.run_until_complete(coro)
+            loop.run_until_complete(db_manager.close_all())
+        finally:
+            loop.close()
+
+    def _run_runtime(self, user_id, chat_id, moderator_id):
+        for coro in self._ban(user_id, chat_id, moderator_id):
+            run_async(coro)
+
+    def _run_composite(self, user_id, chat_id, moderator_id):
+        run_async(db_manager.apply_ban(user_id, chat_id, 'benchmark', moderator_id))
+
+    def _client(self, username):
+        User = get_user_model()
+        users = User.objects.filter(username=username) if username else \
+            User.objects.filter(is_superuser=True).order_by('pk')
+        user = users.first()
+        if user is None:
+            raise CommandError("No user to authenticate as; pass --username")
+        client = Client(HTTP_HOST='localhost')
+        client.force_login(user)
+        return client
+
+    def _run_view(self, user_id, chat_id, moderator_id):
+        response = self.client.post(reverse('api_ban_user'),
+                                    {'user_id': user_id, 'chat_id': chat_id, 'reason': 'benchmark'},
+                                    content_type='application/json')
+        if response.status_code != 200 or response.json().get('duplicate'):
+            raise CommandError(f"api/ban/ returned {response.status_code}: {response.content[:200]!r}")
+
+    def _run_view_legacy(self, user_id, chat_id, moderator_id):
+        # Старі view створювали пул на кожен запит: закриваємо його, щоб наступний запит почав з нуля
+        self._run_view(user_id, chat_id, moderator_id)
+        run_async(db_manager.close_all())
+
+    async def _check_throwaway(self, chat_id):
+        pool = await db_manager.get_pool()
+        async with pool.acquire() as conn:
+            return not await conn.fetchval(
+                """SELECT EXISTS (SELECT 1 FROM chat_settings WHERE chat_id = $1)
+                       OR EXISTS (SELECT 1 FROM bans WHERE chat_id = $1)
+                       OR EXISTS (SELECT 1 FROM punishments WHERE chat_id = $1)
+                       OR EXISTS (SELECT 1 FROM punishment_daily_stats WHERE chat_id = $1)""",
+                chat_id
+            )
+
+    async def _cleanup(self, chat_id):
+        """Відкочує все, що записав шлях бану: рядки, денні підсумки, лічильники, HLL"""
+        pool = await db_manager.get_pool()
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                removed_bans = await conn.fetchval(
+                    """WITH b AS (
+                           DELETE FROM bans WHERE chat_id = $1 AND reason = 'benchmark' RETURNING 1
+                       )
+                       SELECT COUNT(*) FROM b""",
+                    chat_id
+                )
+                # Видалення і декремент punishment_daily_stats одним запитом, як DAILY_STATS_CTE при записі
+                days = await conn.fetch(
+                    """WITH p AS (
+                           DELETE FROM punishments WHERE chat_id = $1 AND reason = 'benchmark'
+                           RETURNING DATE(timestamp) AS date, punishment_type,
+                                     COALESCE(moderator_id, 0) AS moderator_id
+                       ), d AS (
+                           SELECT date, punishment_type, moderator_id, COUNT(*) AS n FROM p GROUP BY 1, 2, 3
+                       ), stat AS (
+                           UPDATE punishment_daily_stats s SET count = s.count - d.n
+                           FROM d
+                           WHERE s.date = d.date AND s.chat_id = $1
+                             AND s.punishment_type = d.punishment_type AND s.moderator_id = d.moderator_id
+                       )
+                       SELECT DISTINCT date FROM d""",
+                    chat_id
+                )
+                await conn.execute("DELETE FROM punishment_daily_stats WHERE chat_id = $1 AND count <= 0",
+                                   chat_id)
+        if removed_bans:
+            await db_manager.adjust_counters(total_bans=-removed_bans)
+        days = [row['date'] for row in days]
+        if days:
+            # З HyperLogLog не можна видалити елемент: ключі тих днів перебудовуються з punishments
+            client = db_manager.get_redis()
+            await client.delete(*(db_manager._offenders_key(key_chat, day)
+                                  for day in days for key_chat in (chat_id, None)))
+            await db_manager.rebuild_offender_counters(days=(date.today() - min(days)).days + 1)
+
+    async def _cleanup_view(self, chat_id, user_ids):
+        await db_manager.clear_queue()
+        await db_manager.release_tasks([
+            ModerationTask(task_type='ban', user_id=user_id, username=None, reason='benchmark',
+                           chat_id=chat_id, moderator_id=0)
+            for user_id in user_ids
+        ])
+
+    def handle(self, *args, **options):
+        chat_id = options['chat_id']
+        iterations = options['iterations']
+        modes = MODES if options['mode'] == 'all' else (options['mode'],)
+        runners = {
+            'view-legacy': self._run_view_legacy,
+            'view': self._run_view,
+            'legacy': self._run_legacy,
+            'runtime': self._run_runtime,
+            'composite': self._run_composite,
+        }
+        if not run_async(self._check_throwaway(chat_id)):
+            raise CommandError(f"Chat {chat_id} already has data; pass an unused throwaway --chat-id")
+        through_view = any(mode.startswith('view') for mode in modes)
+        if through_view:
+            self.client = self._client(options['username'])
+        # api_ban_user ставить завдання для бота: під час бенчмарку — в окремий стрім
+        queue_stream = db_manager.queue_stream
+        db_manager.queue_stream = 'bench:ban_stream'
+        # Живу стрічку dashboard з буфера не відкотити — під час бенчмарку події не пишуться
+        no_feed = override_settings(DASHBOARD_FEED_ENABLED=False)
+        no_feed.enable()
+
+        try:
+            for offset, mode in enumerate(modes):
+                # Кожен режим банить своїх користувачів: інакше view відсіче повтор як дубль
+                first_user = options['user_id'] + offset * iterations
+                samples = []
+                for i in range(iterations):
+                    started = time.perf_counter()
+                    runners[mode](first_user + i, chat_id, options['moderator_id'])
+                    samples.append((time.perf_counter() - started) * 1000)
+
+                self.stdout.write(
+                    f"{mode:11s} n={iterations} "
+                    f"p50={statistics.median(samples):.2f}ms "
+                    f"p99={_percentile(samples, 99):.2f}ms "
+                    f"max={max(samples):.2f}ms"
+                )
+        finally:
+            run_async(self._cleanup(chat_id))
+            if through_view:
+                run_async(self._cleanup_view(
+                    chat_id, range(options['user_id'], options['user_id'] + len(modes) * iterations)
+                ))
+            db_manager.queue_stream = queue_stream
+            no_feed.disable()
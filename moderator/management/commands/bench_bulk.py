@@ -0,0 +1,61 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from moderator.database import db_manager, ModerationTask
+from moderator.async_runtime import run_async
+
+
+class Command(BaseCommand):
+    help = ("Пропускна здатність масової модерації: apply_bulk + pipelined XADD "
+            "проти окремого запиту на кожну дію. Пише у тестовий чат і прибирає за собою.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chat-id', type=int, required=True, help='Тестовий chat_id')
+        parser.add_argument('--user-id', type=int, default=1, help='Перший user_id')
+        parser.add_argument('--moderator-id', type=int, default=0)
+        parser.add_argument('--actions', type=int, default=500)
+        parser.add_argument('--with-queue', action='store_true',
+                            help='Також пушити завдання в чергу модерації')
+
+    def _tasks(self, options, action):
+        return [
+            ModerationTask(
+                task_type=action,
+                user_id=options['user_id'] + i,
+                username=None,
+                reason='benchmark',
+                chat_id=options['chat_id'],
+                moderator_id=options['moderator_id'],
+            )
+            for i in range(options['actions'])
+        ]
+
+    async def _cleanup(self, chat_id):
+        pool = await db_manager.get_pool()
+        async with pool.acquire() as conn:
+            await conn.execute("DELETE FROM bans WHERE chat_id = $1 AND reason = 'benchmark'", chat_id)
+            await conn.execute("DELETE FROM punishments WHERE chat_id = $1 AND reason = 'benchmark'", chat_id)
+
+    def _report(self, label, count, elapsed):
+        self.stdout.write(f"{label:12s} {count} actions in {elapsed:.2f}s -> {count / elapsed:.0f} actions/s")
+
+    def handle(self, *args, **options):
+        tasks = self._tasks(options, 'ban')
+        try:
+            started = time.perf_counter()
+            for task in tasks:
+                run_async(db_manager.apply_ban(task.user_id, task.chat_id, task.reason, task.moderator_id))
+                if options['with_queue']:
+                    run_async(db_manager.add_to_queue(task, dedup=False))
+            self._report('per-request', len(tasks), time.perf_counter() - started)
+
+            run_async(self._cleanup(options['chat_id']))
+
+            started = time.perf_counter()
+            run_async(db_manager.apply_bulk(tasks))
+            if options['with_queue']:
+                run_async(db_manager.add_to_queue_bulk(tasks, dedup=False))
+            self._report('bulk', len(tasks), time.perf_counter() - started)
+        finally:
+            run_async(self._cleanup(options['chat_id']))
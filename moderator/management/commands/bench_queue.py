@@ -0,0 +1,62 @@
+import asyncio
+import time
+
+from django.core.management.base import BaseCommand
+
+from moderator.database import DatabaseManager, ModerationTask
+
+
+class Command(BaseCommand):
+    help = ("Пропускна здатність черги: старий список (RPUSH/LPOP по одному) "
+            "проти Redis Streams (pipelined XADD + XREADGROUP COUNT + XACK).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--redis-url', default='redis://localhost:6379/15',
+                            help='Локальний Redis для бенчмарку')
+        parser.add_argument('--tasks', type=int, default=10000)
+        parser.add_argument('--batch', type=int, default=100, help='COUNT для XREADGROUP')
+
+    def _report(self, label, count, elapsed):
+        self.stdout.write(f"{label:8s} {count} tasks in {elapsed:.2f}s -> {count / elapsed:.0f} tasks/s")
+
+    async def _bench(self, options):
+        manager = DatabaseManager(redis_url=options['redis_url'])
+        manager.queue_stream = 'bench:moderation_stream'
+        manager.queue_group = 'bench:workers'
+        client = manager.get_redis()
+
+        tasks = [
+            ModerationTask(task_type='warn', user_id=i, username=None, reason='benchmark',
+                           chat_id=-100, moderator_id=0)
+            for i in range(options['tasks'])
+        ]
+        list_key = 'bench:moderation_queue'
+        await client.delete(list_key)
+        await manager.clear_queue()
+
+        try:
+            started = time.perf_counter()
+            for task in tasks:
+                await client.rpush(list_key, manager._encode_task(task)['task'])
+            consumed = 0
+            while await client.lpop(list_key) is not None:
+                consumed += 1
+            self._report('list', consumed, time.perf_counter() - started)
+
+            started = time.perf_counter()
+            await manager.add_to_queue_bulk(tasks, dedup=False)
+            consumed = 0
+            while True:
+                batch = await manager.read_tasks('bench-consumer', count=options['batch'])
+                if not batch:
+                    break
+                await manager.ack_tasks([entry_id for entry_id, _ in batch])
+                consumed += len(batch)
+            self._report('stream', consumed, time.perf_counter() - started)
+        finally:
+            await client.delete(list_key)
+            await manager.clear_queue()
+            await manager.close_all()
+
+    def handle(self, *args, **options):
+        asyncio.run(self._bench(options))
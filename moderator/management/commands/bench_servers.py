@@ -0,0 +1,142 @@
+import asyncio
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import time
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, get_user_model
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management.base import BaseCommand, CommandError
+
+SERVERS = {
+    # Синхронні воркери: кожен запит займає воркер повністю, async view йдуть через AsyncRuntime
+    'gunicorn': [sys.executable, '-m', 'gunicorn', 'QuantRPmoderatorDjango.wsgi:application',
+                 '--bind', '127.0.0.1:{port}', '--workers', '{workers}', '--log-level', 'warning'],
+    # ASGI: async view чекають db_manager на loop сервера, sync view — у пулі потоків
+    'uvicorn': [sys.executable, '-m', 'uvicorn', 'QuantRPmoderatorDjango.asgi:application',
+                '--host', '127.0.0.1', '--port', '{port}', '--workers', '{workers}',
+                '--lifespan', 'on', '--log-level', 'warning'],
+}
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def _get(port: int, path: str, cookie: str) -> int:
+    # Мінімальний HTTP/1.0 клієнт, щоб не тягнути залежність лише для бенчмарку
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        writer.write(f"GET {path} HTTP/1.0\r\nHost: localhost\r\nCookie: {cookie}\r\n\r\n".encode())
+        await writer.drain()
+        status_line = await reader.readline()
+        await reader.read()
+        return int(status_line.split()[1])
+    finally:
+        writer.close()
+
+
+async def _load(port: int, path: str, cookie: str, concurrency: int, requests: int):
+    samples, errors = [], 0
+    remaining = iter(range(requests))
+
+    async def client():
+        nonlocal errors
+        for _ in remaining:
+            started = time.perf_counter()
+            try:
+                status = await _get(port, path, cookie)
+            except OSError:
+                status = 0
+            samples.append((time.perf_counter() - started) * 1000)
+            if status != 200:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return samples, errors, time.perf_counter() - started
+
+
+class Command(BaseCommand):
+    help = ("Бенчмарк пропускної здатності: uvicorn (ASGI, async view) проти gunicorn (sync-воркери). "
+            "Запускає кожен сервер локально й навантажує ендпоінт паралельними запитами.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', action='append',
+                            help='Шлях для навантаження (можна кілька); за замовчуванням /api/user/<id>/')
+        parser.add_argument('--user-id', type=int, default=1, help='user_id для /api/user/<id>/')
+        parser.add_argument('--username', help='Від чийого імені запити (за замовчуванням — перший superuser)')
+        parser.add_argument('--server', choices=list(SERVERS) + ['both'], default='both')
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--concurrency', type=int, default=64)
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--port', type=int, default=8765)
+
+    def _session_cookie(self, username):
+        User = get_user_model()
+        users = User.objects.filter(username=username) if username else \
+            User.objects.filter(is_superuser=True).order_by('pk')
+        user = users.first()
+        if user is None:
+            raise CommandError("No user to authenticate as; pass --username")
+        session = SessionStore()
+        session[SESSION_KEY] = str(user.pk)
+        session[BACKEND_SESSION_KEY] = 'django.contrib.auth.backends.ModelBackend'
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.create()
+        return session, f"{settings.SESSION_COOKIE_NAME}={session.session_key}"
+
+    def _wait_ready(self, process, port, timeout=30.0):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise CommandError(f"Server exited with code {process.returncode}")
+            try:
+                asyncio.run(_get(port, '/', ''))
+                return
+            except OSError:
+                time.sleep(0.2)
+        raise CommandError(f"Server did not start on port {port} within {timeout:.0f}s")
+
+    def handle(self, *args, **options):
+        paths = options['path'] or [f"/api/user/{options['user_id']}/"]
+        for path in paths:
+            if urlsplit(path).netloc:
+                raise CommandError("--path must be a path, not a full URL")
+        servers = list(SERVERS) if options['server'] == 'both' else [options['server']]
+        session, cookie = self._session_cookie(options['username'])
+
+        try:
+            for server in servers:
+                port = options['port']
+                command = [part.format(port=port, workers=options['workers']) for part in SERVERS[server]]
+                process = subprocess.Popen(command, env=os.environ.copy())
+                try:
+                    self._wait_ready(process, port)
+                    for path in paths:
+                        # Прогрів: пули з'єднань і кеші в кожному воркері
+                        asyncio.run(_load(port, path, cookie, options['concurrency'], options['concurrency'] * 2))
+                        samples, errors, elapsed = asyncio.run(
+                            _load(port, path, cookie, options['concurrency'], options['requests'])
+                        )
+                        self.stdout.write(
+                            f"{server:9s} {path} c={options['concurrency']} n={len(samples)} "
+                            f"{len(samples) / elapsed:.0f} req/s "
+                            f"p50={statistics.median(samples):.1f}ms "
+                            f"p99={_percentile(samples, 99):.1f}ms "
+                            f"errors={errors}"
+                        )
+                finally:
+                    process.send_signal(signal.SIGTERM)
+                    try:
+                        process.wait(timeout=15)
+                    except subprocess.TimeoutExpired:
+                        process.kill()
+        finally:
+            session.delete()
@@ -0,0 +1,66 @@
+import random
+import statistics
+import string
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from moderator.models import TelegramUser
+from moderator.search import search_users, autocomplete_users
+
+# Синтетичні користувачі отримують user_id з цього діапазону, щоб їх легко прибрати
+SEED_BASE_ID = 9_000_000_000_000
+
+
+class Command(BaseCommand):
+    help = ("Бенчмарк пошуку користувачів (триграмні індекси) і автодоповнення. "
+            "--seed N додає N синтетичних користувачів, --cleanup їх видаляє.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--cleanup', action='store_true')
+        parser.add_argument('--queries', type=int, default=200)
+
+    def _seed(self, count):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """INSERT INTO telegramuser (user_id, username, first_name, last_name, last_seen)
+                   SELECT %s + g,
+                          'user_' || substr(md5(g::text), 1, 10),
+                          initcap(substr(md5((g * 7)::text), 1, 8)),
+                          initcap(substr(md5((g * 13)::text), 1, 10)),
+                          now()
+                   FROM generate_series(1, %s) AS g
+                   ON CONFLICT (user_id) DO NOTHING""",
+                [SEED_BASE_ID, count]
+            )
+            cursor.execute("ANALYZE telegramuser")
+
+    def _measure(self, label, func, queries):
+        samples = []
+        for query in queries:
+            started = time.perf_counter()
+            func(query)
+            samples.append((time.perf_counter() - started) * 1000)
+        ordered = sorted(samples)
+        p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+        self.stdout.write(f"{label:14s} n={len(samples)} p50={statistics.median(ordered):.2f}ms p99={p99:.2f}ms")
+
+    def handle(self, *args, **options):
+        if options['cleanup']:
+            deleted, _ = TelegramUser.objects.filter(user_id__gt=SEED_BASE_ID).delete()
+            self.stdout.write(f"Deleted {deleted} synthetic users")
+            return
+
+        if options['seed']:
+            started = time.perf_counter()
+            self._seed(options['seed'])
+            self.stdout.write(f"Seeded {options['seed']} users in {time.perf_counter() - started:.1f}s")
+
+        alphabet = string.ascii_lowercase + string.digits
+        queries = [''.join(random.choices(alphabet, k=random.randint(3, 6)))
+                   for _ in range(options['queries'])]
+
+        self._measure('search', lambda q: list(search_users(q)[:20]), queries)
+        self._measure('autocomplete', lambda q: autocomplete_users(q, limit=10, budget_ms=1000), queries)
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from moderator.indexes import BOT_TABLE_INDEXES, create_bot_indexes, drop_bot_indexes
+
+
+class Command(BaseCommand):
+    help = "Створює (CONCURRENTLY) або видаляє індекси на таблицях бота; без прапорців — показує стан"
+
+    def add_arguments(self, parser):
+        group = parser.add_mutually_exclusive_group()
+        group.add_argument('--create', action='store_true')
+        group.add_argument('--drop', action='store_true')
+
+    def handle(self, *args, **options):
+        # Django працює в autocommit, тож CONCURRENTLY виконується поза транзакцією
+        with connection.cursor() as cursor:
+            if options['create']:
+                created = create_bot_indexes(cursor, log=self.stdout.write)
+                self.stdout.write(self.style.SUCCESS(f"Created {len(created)} indexes"))
+            elif options['drop']:
+                drop_bot_indexes(cursor)
+                self.stdout.write(self.style.SUCCESS("Dropped bot table indexes"))
+            else:
+                for name, table, definition in BOT_TABLE_INDEXES:
+                    cursor.execute("SELECT to_regclass(%s) IS NOT NULL", [name])
+                    state = 'present' if cursor.fetchone()[0] else 'missing'
+                    self.stdout.write(f"{name:40} {state:8} {table} {definition}")
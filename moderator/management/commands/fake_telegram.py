@@ -0,0 +1,39 @@
+import asyncio
+import signal
+
+from django.core.management.base import BaseCommand
+
+from moderator.fake_telegram import FakeTelegramServer
+
+
+class Command(BaseCommand):
+    help = ("Локальний фейковий Bot API з лімітами Telegram (429 + retry_after) "
+            "для тестування воркера без справжнього бота")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8081)
+        parser.add_argument('--latency-ms', type=float, default=30.0)
+        parser.add_argument('--global-rate', type=float, default=30.0)
+        parser.add_argument('--chat-rate', type=float, default=20 / 60)
+        parser.add_argument('--chat-burst', type=int, default=20)
+
+    def handle(self, *args, **options):
+        server = FakeTelegramServer(host=options['host'], port=options['port'],
+                                    latency_ms=options['latency_ms'],
+                                    global_rate=options['global_rate'],
+                                    global_burst=max(1, int(options['global_rate'])),
+                                    chat_rate=options['chat_rate'], chat_burst=options['chat_burst'])
+
+        async def main():
+            stopped = asyncio.Event()
+            loop = asyncio.get_running_loop()
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                loop.add_signal_handler(sig, stopped.set)
+            await server.start()
+            self.stdout.write(f"Fake Bot API on {server.url}/bot<token>/<method>")
+            await stopped.wait()
+            await server.stop()
+
+        asyncio.run(main())
+        self.stdout.write(", ".join(f"{name}={count}" for name, count in sorted(server.stats.items())))
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from moderator.importer import import_punishments
+
+
+class Command(BaseCommand):
+    help = ("Імпортує історичні покарання з CSV/NDJSON (формат як у експорту) через COPY "
+            "у staging-таблицю з merge у punishments, bans, warnings і добові підсумки")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Шлях до файлу')
+        parser.add_argument('--format', choices=['csv', 'ndjson'],
+                            help='За замовчуванням — з розширення файлу')
+        parser.add_argument('--batch-size', type=int, default=50000,
+                            help='Рядків на один COPY')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Перевірити і порахувати без запису (транзакція відкочується)')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or ('csv' if path.lower().endswith('.csv') else 'ndjson')
+
+        def progress(info):
+            self.stdout.write(
+                f"  copied {info['copied']} rows ({info['rows_per_second']:.0f} rows/s), "
+                f"parse errors: {info['parse_errors']}"
+            )
+
+        try:
+            with open(path, encoding='utf-8-sig', newline='') as f:
+                result = import_punishments(f, file_format, batch_size=options['batch_size'],
+                                            dry_run=options['dry_run'], progress=progress)
+        except OSError as e:
+            raise CommandError(str(e))
+
+        for error in result['errors']:
+            self.stderr.write(f"  {error}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{'Dry run: ' if result['dry_run'] else ''}"
+            f"imported {result['imported']} of {result['copied']} rows "
+            f"(rejected {result['rejected']}, duplicates {result['duplicates']}, parse errors {result['parse_errors']}), "
+            f"new bans {result['new_bans']}, warned users {result['warned_users']} "
+            f"in {result['elapsed']}s ({result['rows_per_second']} rows/s)"
+        ))
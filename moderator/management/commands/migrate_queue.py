@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from moderator.database import db_manager
+from moderator.async_runtime import run_async
+
+
+class Command(BaseCommand):
+    help = "Переносить завдання зі старого списку moderation_queue у Redis Stream і обрізає стрім"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--trim', type=int, default=None,
+                            help='Після перенесення обрізати стрім до вказаної довжини')
+
+    def handle(self, *args, **options):
+        moved = run_async(db_manager.migrate_legacy_queue())
+        self.stdout.write(f"Moved {moved} tasks to the {db_manager.queue_stream} lanes")
+        if options['trim']:
+            removed = run_async(db_manager.trim_queue(options['trim']))
+            self.stdout.write(f"Trimmed {removed} entries")
@@ -0,0 +1,52 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from moderator.partitions import (apply_retention, convert_to_partitioned, ensure_partitions,
+                                  is_partitioned, list_partitions)
+
+
+class Command(BaseCommand):
+    help = ("Помісячні партиції punishments: --convert один раз переводить таблицю на партиції, "
+            "без прапорців створює майбутні партиції і застосовує retention (запускати щодня)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--convert', action='store_true',
+                            help='Перетворити наявну таблицю на партиціоновану (без копіювання рядків)')
+        parser.add_argument('--status', action='store_true', help='Лише показати партиції')
+        parser.add_argument('--months-ahead', type=int,
+                            default=getattr(settings, 'PUNISHMENTS_PARTITION_MONTHS_AHEAD', 3))
+        parser.add_argument('--keep-months', type=int,
+                            default=getattr(settings, 'PUNISHMENTS_RETENTION_MONTHS', 0),
+                            help="Від'єднати партиції, старші за стільки місяців (0 — не чіпати)")
+        parser.add_argument('--drop', action='store_true',
+                            help="Видаляти від'єднані партиції замість перенесення в архівну схему")
+
+    def handle(self, *args, **options):
+        log = self.stdout.write
+        with connection.cursor() as cursor:
+            if options['status']:
+                for partition in list_partitions(cursor):
+                    bounds = 'DEFAULT' if partition.is_default else \
+                        f"[{partition.lower or 'MINVALUE'}, {partition.upper or 'MAXVALUE'})"
+                    self.stdout.write(f"{partition.name:32} {bounds}")
+                return
+
+            if options['convert']:
+                cutover = convert_to_partitioned(cursor, options['months_ahead'], log=log)
+                if cutover:
+                    self.stdout.write(self.style.SUCCESS(f"Converted; monthly partitions start at {cutover}"))
+                return
+
+            if not is_partitioned(cursor):
+                raise CommandError("punishments is not partitioned yet; run with --convert first")
+
+            created = ensure_partitions(cursor, options['months_ahead'], log=log)
+            detached = []
+            if options['keep_months'] > 0:
+                archive_schema = None if options['drop'] else \
+                    (getattr(settings, 'PUNISHMENTS_ARCHIVE_SCHEMA', 'archive') or None)
+                detached = apply_retention(cursor, options['keep_months'], archive_schema, log=log)
+            self.stdout.write(self.style.SUCCESS(
+                f"Created {len(created)} partitions, detached {len(detached)}"
+            ))
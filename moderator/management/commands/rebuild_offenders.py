@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from moderator.database import db_manager
+from moderator.async_runtime import run_async
+
+
+class Command(BaseCommand):
+    help = "Заповнює HyperLogLog-лічильники унікальних порушників з історії punishments"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30)
+
+    def handle(self, *args, **options):
+        rows = run_async(db_manager.rebuild_offender_counters(options['days']))
+        self.stdout.write(f"Added {rows} (day, chat, user) entries to offender counters")
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from moderator.database import db_manager
+from moderator.async_runtime import run_async
+
+
+class Command(BaseCommand):
+    help = "Перераховує лічильники dashboard (бани, модератори, чати) з БД у Redis"
+
+    def handle(self, *args, **options):
+        counters = run_async(db_manager.reconcile_counters())
+        for name, value in counters.items():
+            self.stdout.write(f"{name}={value}")
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from moderator.database import db_manager
+from moderator.async_runtime import run_async
+
+
+class Command(BaseCommand):
+    help = "Перераховує punishment_daily_stats з punishments (запускати періодично, напр. з cron)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=2,
+                            help='Скільки останніх днів перерахувати')
+        parser.add_argument('--all', action='store_true', help='Перерахувати весь період')
+
+    def handle(self, *args, **options):
+        days = None if options['all'] else options['days']
+        rows = run_async(db_manager.reconcile_daily_stats(days))
+        self.stdout.write(f"Rebuilt {rows} daily stat rows ({'all time' if days is None else f'{days} days'})")
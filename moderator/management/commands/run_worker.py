@@ -0,0 +1,131 @@
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from moderator.database import db_manager, ModerationTask
+from moderator.fake_telegram import BotApiExecutor, FakeTelegramServer
+from moderator.ratelimit import TokenBucketLimiter
+from moderator.worker import QueueWorker, SanctionScheduler, StubExecutor, load_handlers
+
+TASK_TYPES = ('ban', 'kick', 'mute', 'warn')
+# Скасування покарань з форми moderation_actions
+REMOVAL_TASK_TYPES = ('unban', 'unmute', 'unwarn')
+# Завдання, які створює сама система (SanctionScheduler)
+SYSTEM_TASK_TYPES = ('unmute',)
+# Усе, що може потрапити в чергу: кожному типу потрібен обробник
+HANDLED_TASK_TYPES = tuple(dict.fromkeys(TASK_TYPES + REMOVAL_TASK_TYPES + SYSTEM_TASK_TYPES))
+
+
+class Command(BaseCommand):
+    help = "Асинхронний воркер черги модерації з автомасштабуванням concurrency"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--consumer', default=f'{socket.gethostname()}-{os.getpid()}')
+        parser.add_argument('--min-concurrency', type=int, default=1)
+        parser.add_argument('--max-concurrency', type=int, default=32)
+        parser.add_argument('--batch', type=int, default=50)
+        parser.add_argument('--scale-interval', type=float, default=5.0)
+        parser.add_argument('--stats-interval', type=float, default=30.0)
+        parser.add_argument('--stub', action='store_true',
+                            help='Обробляти всі завдання StubExecutor замість Telegram')
+        parser.add_argument('--stub-latency-ms', type=float, default=50.0)
+        parser.add_argument('--stub-error-rate', type=float, default=0.0)
+        parser.add_argument('--fake-telegram', action='store_true',
+                            help='Підняти локальний FakeTelegramServer (з лімітами і 429) і слати завдання туди')
+        parser.add_argument('--fake-port', type=int, default=8081)
+        parser.add_argument('--rate-limit', action=argparse.BooleanOptionalAction, default=None,
+                            help='Token bucket на чат і глобальний перед викликом обробника '
+                                 '(за замовчуванням RATE_LIMIT_ENABLED; з --stub вимкнено)')
+        parser.add_argument('--max-deliveries', type=int,
+                            default=getattr(settings, 'REDIS_QUEUE_MAX_DELIVERIES', 5),
+                            help='Після скількох невдалих видач завдання йде в dead-letter стрім')
+        parser.add_argument('--max-pending', type=int, default=1000,
+                            help='Скільки завдань тримати в розкладі rate limit')
+        parser.add_argument('--load', type=int, default=0,
+                            help='Перед стартом додати N синтетичних завдань (разом з --stub або --fake-telegram)')
+        parser.add_argument('--load-chats', type=int, default=50,
+                            help='Між скількома чатами розподілити синтетичні завдання')
+        parser.add_argument('--exit-when-empty', action='store_true')
+        parser.add_argument('--scheduler', action='store_true',
+                            help='Також запустити планувальник закінчення мутів (SanctionScheduler)')
+
+    def handle(self, *args, **options):
+        fake = None
+        if options['fake_telegram']:
+            fake = FakeTelegramServer(port=options['fake_port'])
+            executor = BotApiExecutor(fake.url, token='fake')
+            handlers = {task_type: executor for task_type in HANDLED_TASK_TYPES}
+        elif options['stub']:
+            stub = StubExecutor(latency_ms=options['stub_latency_ms'],
+                                error_rate=options['stub_error_rate'])
+            handlers = {task_type: stub for task_type in HANDLED_TASK_TYPES}
+        else:
+            handlers = load_handlers()
+        if not handlers:
+            raise CommandError("No task handlers configured: set MODERATION_TASK_HANDLERS or use --stub")
+
+        if options['load'] and not (options['stub'] or fake):
+            raise CommandError("--load only makes sense together with --stub or --fake-telegram")
+
+        rate_limit = options['rate_limit']
+        if rate_limit is None:
+            # StubExecutor не має лімітів Telegram — його бенчмарк міряє сирий throughput
+            rate_limit = getattr(settings, 'RATE_LIMIT_ENABLED', True) and not (options['stub'] and not fake)
+
+        worker = QueueWorker(
+            handlers,
+            consumer=options['consumer'],
+            min_concurrency=options['min_concurrency'],
+            max_concurrency=options['max_concurrency'],
+            batch_size=options['batch'],
+            scale_interval=options['scale_interval'],
+            stats_interval=options['stats_interval'],
+            limiter=TokenBucketLimiter() if rate_limit else None,
+            max_pending=options['max_pending'],
+            max_deliveries=options['max_deliveries'],
+        )
+
+        scheduler = SanctionScheduler() if options['scheduler'] else None
+
+        def stop():
+            worker.stop()
+            if scheduler:
+                scheduler.stop()
+
+        async def main():
+            loop = asyncio.get_running_loop()
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                loop.add_signal_handler(sig, stop)
+            if fake:
+                await fake.start()
+            scheduler_job = asyncio.create_task(scheduler.run()) if scheduler else None
+            if options['load']:
+                chats = max(1, options['load_chats'])
+                await db_manager.add_to_queue_bulk([
+                    ModerationTask(task_type=TASK_TYPES[i % len(TASK_TYPES)], user_id=i, username=None,
+                                   reason='load test', chat_id=-100 - i % chats, moderator_id=0)
+                    for i in range(options['load'])
+                ], dedup=False)
+            try:
+                await worker.run(exit_when_empty=options['exit_when_empty'])
+            finally:
+                if scheduler_job:
+                    scheduler.stop()
+                    scheduler_job.cancel()
+                if fake:
+                    await fake.stop()
+                await db_manager.close_all()
+
+        started = time.perf_counter()
+        asyncio.run(main())
+        elapsed = time.perf_counter() - started
+        self.stdout.write(worker.stats_line())
+        self.stdout.write(f"{worker.processed / elapsed:.0f} tasks/s over {elapsed:.1f}s")
+        if fake:
+            self.stdout.write(f"fake telegram: ok={fake.stats['ok']} 429={fake.stats['throttled']}")
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from moderator.database import db_manager
+from moderator.async_runtime import run_async
+
+
+class Command(BaseCommand):
+    help = ("Заповнює active_sanctions дійсними мутами з punishments і відновлює "
+            "розклад їх закінчення в Redis")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30,
+                            help='За скільки останніх днів шукати мути')
+
+    def handle(self, *args, **options):
+        synced = run_async(db_manager.sync_sanctions(options['days']))
+        scheduled = run_async(db_manager.rebuild_expiry_schedule())
+        self.stdout.write(f"Synced {synced} active mutes, {scheduled} expiries scheduled")
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.7 on 2026-10-17 12:00
+
+from django.db import migrations, models
+
+
+# Початкове заповнення з наявних punishments: manage.py reconcile_stats --all
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moderator', '0003_remove_telegramuser_id_alter_telegramuser_user_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PunishmentDailyStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('chat_id', models.BigIntegerField()),
+                ('punishment_type', models.CharField(choices=[('kick', 'Kick'), ('ban', 'Ban'), ('mute', 'Mute'), ('warn', 'Warning')], max_length=10)),
+                ('moderator_id', models.BigIntegerField()),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'punishment_daily_stats',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='punishmentdailystat',
+            constraint=models.UniqueConstraint(fields=('date', 'chat_id', 'punishment_type', 'moderator_id'), name='punishment_daily_stats_key'),
+        ),
+    ]
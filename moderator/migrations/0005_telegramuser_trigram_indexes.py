@@ -0,0 +1,31 @@
+# Generated by Django 4.2.7 on 2026-10-17 12:30
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently, TrigramExtension
+from django.db import migrations
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY не можна виконати в транзакції
+    atomic = False
+
+    dependencies = [
+        ('moderator', '0004_punishmentdailystat'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        AddIndexConcurrently(
+            model_name='telegramuser',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('username'), name='gin_trgm_ops'), name='telegramuser_username_trgm'),
+        ),
+        AddIndexConcurrently(
+            model_name='telegramuser',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('first_name'), name='gin_trgm_ops'), name='telegramuser_first_name_trgm'),
+        ),
+        AddIndexConcurrently(
+            model_name='telegramuser',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('last_name'), name='gin_trgm_ops'), name='telegramuser_last_name_trgm'),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 4.2.7 on 2026-10-17 13:00
+
+from django.conf import settings
+from django.db import migrations
+
+# SQL зафіксовано тут, а не взято з moderator.indexes: зміни модуля не мають
+# змінювати те, що робить уже застосована міграція
+REASON_INDEX = 'punishments_reason_fts'
+REASON_INDEX_DEFINITION = "USING gin (to_tsvector('simple', coalesce(reason, '')))"
+
+
+def _is_partitioned(cursor):
+    cursor.execute("SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass('punishments')")
+    row = cursor.fetchone()
+    return bool(row and row[0])
+
+
+def create_reason_index(apps, schema_editor):
+    # punishments належить боту (managed = False): як і 0007, лише з MANAGE_BOT_TABLE_INDEXES,
+    # інакше — manage.py bot_indexes
+    if not getattr(settings, 'MANAGE_BOT_TABLE_INDEXES', False):
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT to_regclass('punishments') IS NOT NULL")
+        if not cursor.fetchone()[0]:
+            return
+        if not _is_partitioned(cursor):
+            cursor.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {REASON_INDEX} "
+                           f"ON punishments {REASON_INDEX_DEFINITION}")
+            return
+        # CONCURRENTLY не підтримується для партиціонованої таблиці: індекс ON ONLY батьківської,
+        # CONCURRENTLY на кожній партиції і ATTACH — після останньої батьківський стає валідним
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {REASON_INDEX} ON ONLY punishments {REASON_INDEX_DEFINITION}")
+        cursor.execute(
+            """SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+               WHERE i.inhparent = to_regclass('punishments') ORDER BY c.relname"""
+        )
+        for (partition,) in cursor.fetchall():
+            child = f"{partition}_reason_fts"[:63]
+            cursor.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {child} "
+                           f"ON {partition} {REASON_INDEX_DEFINITION}")
+            cursor.execute(f"ALTER INDEX {REASON_INDEX} ATTACH PARTITION {child}")
+
+
+def drop_reason_index(apps, schema_editor):
+    if not getattr(settings, 'MANAGE_BOT_TABLE_INDEXES', False):
+        return
+    with schema_editor.connection.cursor() as cursor:
+        # Індекс партиціонованої таблиці видаляється лише без CONCURRENTLY
+        mode = '' if _is_partitioned(cursor) else 'CONCURRENTLY '
+        cursor.execute(f"DROP INDEX {mode}IF EXISTS {REASON_INDEX}")
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY не можна виконати в транзакції
+    atomic = False
+
+    dependencies = [
+        ('moderator', '0005_telegramuser_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_reason_index, drop_reason_index),
+    ]
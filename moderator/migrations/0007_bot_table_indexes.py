@@ -0,0 +1,81 @@
+# Generated by Django 4.2.7 on 2026-10-17 14:00
+
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+# Індекси таблиць бота на момент цієї міграції. SQL зафіксовано тут, а не взято з
+# moderator.indexes: зміни модуля не мають змінювати те, що робить уже застосована міграція.
+# punishments_reason_fts належить міграції 0006.
+BOT_TABLE_INDEXES = (
+    ('punishments_timestamp_id', 'punishments', '(timestamp DESC, id DESC)'),
+    ('punishments_moderator_timestamp', 'punishments', '(moderator_id, timestamp DESC, id DESC)'),
+    ('punishments_user_chat_type_timestamp', 'punishments',
+     '(user_id, chat_id, punishment_type, timestamp DESC)'),
+    ('punishments_chat_timestamp', 'punishments', '(chat_id, timestamp DESC)'),
+)
+
+
+def _is_partitioned(cursor, table):
+    cursor.execute("SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass(%s)", [table])
+    row = cursor.fetchone()
+    return bool(row and row[0])
+
+
+def create_indexes(apps, schema_editor):
+    # Опційно (MANAGE_BOT_TABLE_INDEXES): таблиці належать боту; інакше — manage.py bot_indexes
+    if not getattr(settings, 'MANAGE_BOT_TABLE_INDEXES', False):
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for name, table, definition in BOT_TABLE_INDEXES:
+            cursor.execute("SELECT to_regclass(%s) IS NOT NULL", [table])
+            if not cursor.fetchone()[0]:
+                continue
+            cursor.execute("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)", [name])
+            row = cursor.fetchone()
+            if row and row[0]:
+                continue
+            if not _is_partitioned(cursor, table):
+                if row:
+                    # Перерваний CREATE INDEX CONCURRENTLY лишає невалідний індекс — перестворюємо
+                    cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+                cursor.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} {definition}")
+                continue
+            # Партиціонована таблиця: ON ONLY батьківської, CONCURRENTLY на партиціях, ATTACH
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON ONLY {table} {definition}")
+            cursor.execute(
+                """SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+                   WHERE i.inhparent = to_regclass(%s) ORDER BY c.relname""",
+                [table]
+            )
+            for (partition,) in cursor.fetchall():
+                child = f"{partition}{name[len(table):]}"[:63]
+                cursor.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {child} ON {partition} {definition}")
+                cursor.execute(f"ALTER INDEX {name} ATTACH PARTITION {child}")
+
+
+def drop_indexes(apps, schema_editor):
+    if not getattr(settings, 'MANAGE_BOT_TABLE_INDEXES', False):
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for name, table, _definition in BOT_TABLE_INDEXES:
+            # Індекс партиціонованої таблиці видаляється лише без CONCURRENTLY
+            mode = '' if _is_partitioned(cursor, table) else 'CONCURRENTLY '
+            cursor.execute(f"DROP INDEX {mode}IF EXISTS {name}")
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY не можна виконати в транзакції
+    atomic = False
+
+    dependencies = [
+        ('moderator', '0006_punishments_reason_fts'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='punishmentdailystat',
+            index=models.Index(fields=['moderator_id', 'date'], name='pds_moderator_date'),
+        ),
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
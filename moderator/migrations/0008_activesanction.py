@@ -0,0 +1,43 @@
+# Generated by Django 4.2.7 on 2026-10-17 15:00
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+# Початкове заповнення з наявних мутів: manage.py sync_sanctions
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moderator', '0007_bot_table_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActiveSanction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.BigIntegerField()),
+                ('chat_id', models.BigIntegerField()),
+                ('sanction_type', models.CharField(choices=[('mute', 'Mute')], max_length=10)),
+                ('expires_at', models.DateTimeField(blank=True, null=True)),
+                ('punishment_id', models.BigIntegerField(blank=True, null=True)),
+                ('moderator_id', models.BigIntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'db_table': 'active_sanctions',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='activesanction',
+            constraint=models.UniqueConstraint(fields=('user_id', 'chat_id', 'sanction_type'), name='active_sanctions_key'),
+        ),
+        migrations.AddIndex(
+            model_name='activesanction',
+            index=models.Index(fields=['chat_id', 'sanction_type'], name='active_sanctions_chat'),
+        ),
+        migrations.AddIndex(
+            model_name='activesanction',
+            index=models.Index(condition=models.Q(('expires_at__isnull', False)), fields=['expires_at'], name='active_sanctions_expires'),
+        ),
+    ]
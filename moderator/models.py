@@ -1,6 +1,8 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.utils import timezone
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.db.models.functions import Upper
 
 
 # Соответствует вашей таблице bans
@@ -62,6 +64,59 @@ class Punishment(models.Model):
 
 
 
+# Добові підсумки покарань (оновлюються DatabaseManager при кожному записі в punishments)
+class PunishmentDailyStat(models.Model):
+    date = models.DateField()
+    chat_id = models.BigIntegerField()
+    punishment_type = models.CharField(max_length=10, choices=Punishment.PUNISHMENT_TYPES)
+    moderator_id = models.BigIntegerField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'punishment_daily_stats'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['date', 'chat_id', 'punishment_type', 'moderator_id'],
+                name='punishment_daily_stats_key',
+            ),
+        ]
+        indexes = [
+            # Підсумки профілю модератора (без фільтра за датою)
+            models.Index(fields=['moderator_id', 'date'], name='pds_moderator_date'),
+        ]
+
+
+
+# Поточний стан санкцій (хто замучений зараз і до коли), без сканування історії punishments.
+# expires_at = NULL — безстрокова санкція; строкові також стоять у Redis ZSET для планувальника.
+class ActiveSanction(models.Model):
+    SANCTION_TYPES = [
+        ('mute', 'Mute'),
+    ]
+
+    user_id = models.BigIntegerField()
+    chat_id = models.BigIntegerField()
+    sanction_type = models.CharField(max_length=10, choices=SANCTION_TYPES)
+    expires_at = models.DateTimeField(null=True, blank=True)
+    punishment_id = models.BigIntegerField(null=True, blank=True)
+    moderator_id = models.BigIntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'active_sanctions'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user_id', 'chat_id', 'sanction_type'],
+                name='active_sanctions_key',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['chat_id', 'sanction_type'], name='active_sanctions_chat'),
+            models.Index(fields=['expires_at'], name='active_sanctions_expires',
+                         condition=models.Q(expires_at__isnull=False)),
+        ]
+
+
 # Соответствует вашей таблице warnings
 class Warning(models.Model):
     user_id = models.BigIntegerField(primary_key=True)
@@ -93,6 +148,12 @@ class TelegramUser(models.Model):
 
     class Meta:
         db_table = 'telegramuser'  # вкажи реальне ім’я таблиці в БД
+        # Триграмні індекси для пошуку (icontains/istartswith -> UPPER(col) LIKE)
+        indexes = [
+            GinIndex(OpClass(Upper('username'), name='gin_trgm_ops'), name='telegramuser_username_trgm'),
+            GinIndex(OpClass(Upper('first_name'), name='gin_trgm_ops'), name='telegramuser_first_name_trgm'),
+            GinIndex(OpClass(Upper('last_name'), name='gin_trgm_ops'), name='telegramuser_last_name_trgm'),
+        ]
 
 
 
@@ -0,0 +1,113 @@
+import base64
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
+
+from django.db import connection
+from django.db.models import Q
+
+
+@dataclass
+class KeysetPage:
+    items: List[Any]
+    next_cursor: Optional[str]
+    prev_cursor: Optional[str]
+
+    @property
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self) -> bool:
+        return self.prev_cursor is not None
+
+    @property
+    def has_other_pages(self) -> bool:
+        return self.has_next or self.has_previous
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def encode_cursor(timestamp: datetime, pk: int) -> str:
+    raw = f"{timestamp.isoformat()}|{pk}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token: str) -> Optional[Tuple[datetime, int]]:
+    """Повертає (timestamp, id) або None для пошкодженого курсора"""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+        timestamp, pk = raw.rsplit('|', 1)
+        return datetime.fromisoformat(timestamp), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def keyset_paginate(queryset, after: Optional[str] = None, before: Optional[str] = None,
+                    per_page: int = 20, field: str = 'timestamp') -> KeysetPage:
+    """Курсорна пагінація по (field, id) від нових до старих.
+
+    На відміну від Paginator не робить COUNT(*) і OFFSET: кожна сторінка —
+    це індексний range scan на per_page + 1 рядків незалежно від глибини.
+    after — курсор останнього рядка попередньої сторінки (рух до старіших),
+    before — курсор першого рядка поточної сторінки (рух до новіших).
+    """
+    after_key = decode_cursor(after) if after else None
+    before_key = decode_cursor(before) if before else None
+
+    if before_key:
+        value, pk = before_key
+        qs = (queryset
+              .filter(Q(**{f'{field}__gt': value}) | Q(**{field: value, 'id__gt': pk}))
+              .order_by(field, 'id'))
+        rows = list(qs[:per_page + 1])
+        has_more = len(rows) > per_page
+        items = list(reversed(rows[:per_page]))
+        has_newer, has_older = has_more, True
+    else:
+        qs = queryset
+        if after_key:
+            value, pk = after_key
+            qs = qs.filter(Q(**{f'{field}__lt': value}) | Q(**{field: value, 'id__lt': pk}))
+        rows = list(qs.order_by(f'-{field}', '-id')[:per_page + 1])
+        items = rows[:per_page]
+        has_newer, has_older = after_key is not None, len(rows) > per_page
+
+    if not items:
+        if after_key or before_key:
+            # Курсор вказує за межі даних (рядки видалили) — повертаємо першу сторінку
+            return keyset_paginate(queryset, per_page=per_page, field=field)
+        return KeysetPage(items=[], next_cursor=None, prev_cursor=None)
+
+    first, last = items[0], items[-1]
+    return KeysetPage(
+        items=items,
+        next_cursor=encode_cursor(getattr(last, field), last.id) if has_older else None,
+        prev_cursor=encode_cursor(getattr(first, field), first.id) if has_newer else None,
+    )
+
+
+def approximate_count(table: str) -> Optional[int]:
+    """Оцінка кількості рядків зі статистики планувальника (pg_class.reltuples).
+
+    Для партиціонованої таблиці reltuples батьківської таблиці не ведеться — сумуємо партиції.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """SELECT CASE WHEN t.relkind = 'p' THEN (
+                          SELECT SUM(c.reltuples) FILTER (WHERE c.reltuples >= 0)
+                          FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+                          WHERE i.inhparent = t.oid)
+                      ELSE t.reltuples END::bigint
+               FROM pg_class t WHERE t.oid = to_regclass(%s)""",
+            [table]
+        )
+        row = cursor.fetchone()
+    # -1 означає, що таблиця ще не аналізувалась
+    if not row or row[0] is None or row[0] < 0:
+        return None
+    return row[0]
@@ -0,0 +1,205 @@
+import re
+from datetime import date
+from typing import Callable, List, NamedTuple, Optional
+
+from django.db import transaction
+from django.utils import timezone
+
+from .indexes import create_bot_indexes
+
+# Помісячне range-партиціювання punishments по timestamp.
+# Після конвертації стара таблиця стає партицією punishments_legacy (MINVALUE .. cutover),
+# нові місяці — punishments_pYYYYMM, а punishments_default ловить рядки поза всіма
+# діапазонами, щоб запис бота ніколи не падав через відсутню партицію.
+PARENT = 'punishments'
+LEGACY = 'punishments_legacy'
+DEFAULT = 'punishments_default'
+
+_BOUND = re.compile(r"FROM \((MINVALUE|'[^']+')\) TO \((MAXVALUE|'[^']+')\)")
+
+
+class Partition(NamedTuple):
+    name: str
+    lower: Optional[date]   # None — MINVALUE
+    upper: Optional[date]   # None — MAXVALUE
+    is_default: bool
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def add_months(day: date, months: int) -> date:
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{PARENT}_p{month:%Y%m}"
+
+
+def _parse_bound(value: str) -> Optional[date]:
+    if value in ('MINVALUE', 'MAXVALUE'):
+        return None
+    return date.fromisoformat(value.strip("'")[:10])
+
+
+def is_partitioned(cursor) -> bool:
+    cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", [PARENT])
+    row = cursor.fetchone()
+    return bool(row) and row[0] == 'p'
+
+
+def list_partitions(cursor) -> List[Partition]:
+    cursor.execute(
+        """SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+           FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+           WHERE i.inhparent = to_regclass(%s)
+           ORDER BY c.relname""",
+        [PARENT]
+    )
+    partitions = []
+    for name, bound in cursor.fetchall():
+        if bound == 'DEFAULT':
+            partitions.append(Partition(name, None, None, True))
+            continue
+        match = _BOUND.search(bound)
+        partitions.append(Partition(name, _parse_bound(match.group(1)), _parse_bound(match.group(2)), False))
+    return partitions
+
+
+def _overlaps(partition: Partition, lower: date, upper: date) -> bool:
+    if partition.is_default:
+        return False
+    return ((partition.lower is None or partition.lower < upper)
+            and (partition.upper is None or partition.upper > lower))
+
+
+def ensure_partitions(cursor, months_ahead: int = 3, start: Optional[date] = None,
+                      log: Callable[[str], None] = lambda message: None) -> List[str]:
+    """Створює партиції від start (поточний місяць) на months_ahead місяців уперед.
+
+    Рядки, що вже потрапили в punishments_default для нового місяця, переносяться
+    в створену партицію в тій самій транзакції.
+    """
+    start = month_start(start or timezone.now().date())
+    existing = list_partitions(cursor)
+    has_default = any(p.is_default for p in existing)
+    created = []
+    for offset in range(months_ahead + 1):
+        lower = add_months(start, offset)
+        upper = add_months(lower, 1)
+        if any(_overlaps(p, lower, upper) for p in existing):
+            continue
+        name = partition_name(lower)
+        with transaction.atomic():
+            if has_default:
+                cursor.execute(f"CREATE TABLE {name} (LIKE {PARENT} INCLUDING DEFAULTS)")
+                cursor.execute(
+                    f"""WITH moved AS (
+                            DELETE FROM {DEFAULT} WHERE timestamp >= %s AND timestamp < %s RETURNING *
+                        )
+                        INSERT INTO {name} SELECT * FROM moved""",
+                    [lower, upper]
+                )
+                cursor.execute(f"ALTER TABLE {PARENT} ATTACH PARTITION {name} "
+                               f"FOR VALUES FROM ('{lower}') TO ('{upper}')")
+            else:
+                cursor.execute(f"CREATE TABLE {name} PARTITION OF {PARENT} "
+                               f"FOR VALUES FROM ('{lower}') TO ('{upper}')")
+        log(f"created {name} [{lower}, {upper})")
+        created.append(name)
+    return created
+
+
+def convert_to_partitioned(cursor, months_ahead: int = 3,
+                           log: Callable[[str], None] = lambda message: None) -> date:
+    """Перетворює punishments на партиціоновану таблицю без копіювання рядків.
+
+    Важкі кроки (індекси, перевірка CHECK) виконуються без блокування запису;
+    під ACCESS EXCLUSIVE лишаються лише перейменування і ATTACH, який завдяки
+    валідованому CHECK не сканує таблицю. Потрібен autocommit (не всередині atomic).
+    Повертає cutover — першу дату, що йде в нові помісячні партиції.
+    """
+    if is_partitioned(cursor):
+        log(f"{PARENT} is already partitioned")
+        return None
+    cutover = add_months(month_start(timezone.now().date()), 1)
+
+    cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [PARENT])
+    sequence = cursor.fetchone()[0]
+    if sequence is None:
+        raise RuntimeError(f"{PARENT}.id is not a serial column; convert it manually")
+
+    # 1. Без блокування запису: індекси, які потім приєднаються до індексів батьківської таблиці
+    create_bot_indexes(cursor, log=log)
+    log("creating unique index (id, timestamp) for the partitioned primary key")
+    cursor.execute(f"CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS {PARENT}_id_timestamp "
+                   f"ON {PARENT} (id, timestamp)")
+    log(f"validating timestamp < {cutover}")
+    cursor.execute(f"ALTER TABLE {PARENT} DROP CONSTRAINT IF EXISTS {LEGACY}_bound")
+    cursor.execute(f"ALTER TABLE {PARENT} ADD CONSTRAINT {LEGACY}_bound "
+                   f"CHECK (timestamp IS NOT NULL AND timestamp < '{cutover}') NOT VALID")
+    cursor.execute(f"ALTER TABLE {PARENT} VALIDATE CONSTRAINT {LEGACY}_bound")
+
+    # 2. Коротка транзакція: підміна таблиці
+    with transaction.atomic():
+        cursor.execute(f"LOCK TABLE {PARENT} IN ACCESS EXCLUSIVE MODE")
+        cursor.execute(f"ALTER TABLE {PARENT} RENAME TO {LEGACY}")
+        cursor.execute("SELECT indexname FROM pg_indexes WHERE tablename = %s", [LEGACY])
+        for (index,) in cursor.fetchall():
+            if index.startswith(PARENT) and not index.startswith(LEGACY):
+                cursor.execute(f"ALTER INDEX {index} RENAME TO {LEGACY}{index[len(PARENT):]}")
+        # Використовує валідований CHECK замість сканування
+        cursor.execute(f"ALTER TABLE {LEGACY} ALTER COLUMN timestamp SET NOT NULL")
+        # ATTACH зіставляє лише індекси-обмеження: первинний ключ legacy має стати (id, timestamp)
+        cursor.execute(
+            "SELECT conname FROM pg_constraint WHERE conrelid = to_regclass(%s) AND contype = 'p'", [LEGACY]
+        )
+        for (constraint,) in cursor.fetchall():
+            cursor.execute(f"ALTER TABLE {LEGACY} DROP CONSTRAINT {constraint}")
+        cursor.execute(f"ALTER TABLE {LEGACY} ADD CONSTRAINT {LEGACY}_pkey "
+                       f"PRIMARY KEY USING INDEX {LEGACY}_id_timestamp")
+
+        cursor.execute(f"CREATE TABLE {PARENT} (LIKE {LEGACY} INCLUDING DEFAULTS) "
+                       f"PARTITION BY RANGE (timestamp)")
+        # Інакше послідовність id зникне разом з архівованою legacy-партицією
+        cursor.execute(f"ALTER SEQUENCE {sequence} OWNED BY {PARENT}.id")
+        cursor.execute(f"ALTER TABLE {PARENT} ADD PRIMARY KEY (id, timestamp)")
+        create_bot_indexes(cursor, concurrently=False)
+        # Рівноцінні індекси legacy приєднуються до батьківських автоматично
+        cursor.execute(f"ALTER TABLE {PARENT} ATTACH PARTITION {LEGACY} "
+                       f"FOR VALUES FROM (MINVALUE) TO ('{cutover}')")
+        cursor.execute(f"ALTER TABLE {LEGACY} DROP CONSTRAINT {LEGACY}_bound")
+        cursor.execute(f"CREATE TABLE {DEFAULT} PARTITION OF {PARENT} DEFAULT")
+    log(f"{PARENT} is partitioned; rows before {cutover} stay in {LEGACY}")
+
+    ensure_partitions(cursor, months_ahead, start=cutover, log=log)
+    cursor.execute(f"ANALYZE {PARENT}")
+    return cutover
+
+
+def apply_retention(cursor, keep_months: int, archive_schema: Optional[str] = 'archive',
+                    log: Callable[[str], None] = lambda message: None) -> List[str]:
+    """Від'єднує партиції, повністю старші за keep_months місяців.
+
+    З archive_schema партиція переноситься в цю схему (дані лишаються доступними
+    для ручних запитів і pg_dump), без неї — видаляється. Добові підсумки
+    (punishment_daily_stats) не змінюються, тому аналітика за старі місяці лишається.
+    """
+    cutoff = add_months(month_start(timezone.now().date()), -keep_months)
+    detached = []
+    for partition in list_partitions(cursor):
+        if partition.is_default or partition.upper is None or partition.upper > cutoff:
+            continue
+        with transaction.atomic():
+            cursor.execute(f"ALTER TABLE {PARENT} DETACH PARTITION {partition.name}")
+            if archive_schema:
+                cursor.execute(f"CREATE SCHEMA IF NOT EXISTS {archive_schema}")
+                cursor.execute(f"ALTER TABLE {partition.name} SET SCHEMA {archive_schema}")
+                log(f"archived {partition.name} to {archive_schema}")
+            else:
+                cursor.execute(f"DROP TABLE {partition.name}")
+                log(f"dropped {partition.name}")
+        detached.append(partition.name)
+    return detached
@@ -0,0 +1,119 @@
+import math
+import time
+from typing import NamedTuple, Optional
+
+from django.conf import settings
+
+from .database import db_manager
+import logging
+logger = logging.getLogger(__name__)
+
+# Два token bucket (глобальний і чату) перевіряються й списуються атомарно:
+# токен береться лише якщо він є в обох, інакше повертається час очікування
+# і відро, що обмежує. Стан відра — хеш {tokens, ts}; ключ живе, доки відро
+# не наповниться повністю (повне відро і відсутній ключ — одне й те саме).
+# KEYS: [global, chat]; ARGV: [now_ms, global_rate, global_burst, chat_rate, chat_burst]
+_ACQUIRE = """
+local now = tonumber(ARGV[1])
+local function level(key, rate, burst)
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or burst
+    local ts = tonumber(state[2]) or now
+    return math.min(burst, tokens + math.max(0, now - ts) * rate / 1000)
+end
+local function take(key, tokens, rate, burst)
+    redis.call('HSET', key, 'tokens', tokens - 1, 'ts', now)
+    redis.call('PEXPIRE', key, math.ceil((burst - tokens + 1) * 1000 / rate) + 1000)
+end
+local global_rate, global_burst = tonumber(ARGV[2]), tonumber(ARGV[3])
+local chat_rate, chat_burst = tonumber(ARGV[4]), tonumber(ARGV[5])
+local g = level(KEYS[1], global_rate, global_burst)
+local c = level(KEYS[2], chat_rate, chat_burst)
+if g >= 1 and c >= 1 then
+    take(KEYS[1], g, global_rate, global_burst)
+    take(KEYS[2], c, chat_rate, chat_burst)
+    return {1, 0, ''}
+end
+local wait_g = g >= 1 and 0 or math.ceil((1 - g) * 1000 / global_rate)
+local wait_c = c >= 1 and 0 or math.ceil((1 - c) * 1000 / chat_rate)
+if wait_c >= wait_g then
+    return {0, wait_c, 'chat'}
+end
+return {0, wait_g, 'global'}
+"""
+
+# Після 429 відро спорожнюється так, щоб наступний токен з'явився через retry_after
+# KEYS: [bucket]; ARGV: [now_ms, rate, burst, retry_after_ms]
+_PENALIZE = """
+local rate = tonumber(ARGV[2])
+redis.call('HSET', KEYS[1], 'tokens', 1 - rate * tonumber(ARGV[4]) / 1000, 'ts', ARGV[1])
+redis.call('PEXPIRE', KEYS[1], math.ceil(tonumber(ARGV[3]) * 1000 / rate) + tonumber(ARGV[4]) + 1000)
+return 1
+"""
+
+
+class Acquired(NamedTuple):
+    allowed: bool
+    wait: float             # секунди до наступної спроби, якщо не allowed
+    scope: Optional[str]    # 'chat' або 'global' — яке відро обмежило
+
+
+class TokenBucketLimiter:
+    """Спільний для всіх воркерів rate limit викликів Telegram: відро на кожен чат плюс глобальне.
+
+    Стан у Redis, тож кілька процесів run_worker разом не перевищують ліміт.
+    Якщо Redis недоступний, виклик дозволяється: від 429 тоді захищає
+    обробка retry_after у воркері.
+    """
+
+    def __init__(self, global_rate: float = None, global_burst: int = None,
+                 chat_rate: float = None, chat_burst: int = None, prefix: str = 'ratelimit'):
+        self.global_rate = global_rate or getattr(settings, 'RATE_LIMIT_GLOBAL_RATE', 30.0)
+        self.global_burst = global_burst or getattr(settings, 'RATE_LIMIT_GLOBAL_BURST', 30)
+        self.chat_rate = chat_rate or getattr(settings, 'RATE_LIMIT_CHAT_RATE', 20 / 60)
+        self.chat_burst = chat_burst or getattr(settings, 'RATE_LIMIT_CHAT_BURST', 20)
+        self.prefix = prefix
+
+    def _global_key(self) -> str:
+        return f"{self.prefix}:global"
+
+    def _chat_key(self, chat_id: int) -> str:
+        return f"{self.prefix}:chat:{chat_id}"
+
+    async def acquire(self, chat_id: int) -> Acquired:
+        try:
+            allowed, wait_ms, scope = await db_manager.get_redis().eval(
+                _ACQUIRE, 2, self._global_key(), self._chat_key(chat_id),
+                int(time.time() * 1000), self.global_rate, self.global_burst,
+                self.chat_rate, self.chat_burst
+            )
+        except Exception as e:
+            logger.warning(f"Rate limiter unavailable, allowing chat {chat_id}: {e}")
+            return Acquired(True, 0.0, None)
+        return Acquired(bool(allowed), wait_ms / 1000, scope or None)
+
+    async def penalize(self, retry_after: float, chat_id: Optional[int] = None):
+        """Telegram відповів 429: блокує відро чату (або глобальне) на retry_after секунд"""
+        if chat_id is None:
+            key, rate, burst = self._global_key(), self.global_rate, self.global_burst
+        else:
+            key, rate, burst = self._chat_key(chat_id), self.chat_rate, self.chat_burst
+        try:
+            await db_manager.get_redis().eval(_PENALIZE, 1, key, int(time.time() * 1000), rate, burst,
+                                              math.ceil(retry_after * 1000))
+        except Exception as e:
+            logger.warning(f"Failed to apply retry_after={retry_after} to {key}: {e}")
+
+
+class RetryAfter(Exception):
+    """Telegram відхилив виклик з 429.
+
+    Обробник завдання піднімає це (або будь-який виняток з атрибутом retry_after,
+    як TelegramRetryAfter в aiogram чи RetryAfter у python-telegram-bot); воркер
+    повертає завдання в розклад. scope='global' блокує всі чати, а не лише цей.
+    """
+
+    def __init__(self, retry_after: float, scope: str = 'chat', message: str = ''):
+        super().__init__(message or f"Too Many Requests: retry after {retry_after}")
+        self.retry_after = retry_after
+        self.scope = scope
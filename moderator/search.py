@@ -0,0 +1,64 @@
+from typing import Dict, List
+
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db import connection, transaction
+from django.db.models import Q
+from django.db.models.functions import Greatest, Upper
+from django.db.utils import OperationalError
+
+from .models import TelegramUser
+
+SEARCH_FIELDS = ('username', 'first_name', 'last_name')
+
+
+def _name_filter(query: str, lookup: str) -> Q:
+    # icontains/istartswith на PostgreSQL дають UPPER(col::text) LIKE UPPER(...),
+    # що збігається з GIN-індексами gin_trgm_ops по Upper(col) з міграції 0005
+    condition = Q()
+    for field in SEARCH_FIELDS:
+        condition |= Q(**{f'{field}__{lookup}': query})
+    return condition
+
+
+def search_users(query: str, lookup: str = 'icontains'):
+    """Пошук користувачів по username/first_name/last_name (і точному user_id),
+    відсортований за триграмною схожістю до запиту"""
+    query = query.strip().lstrip('@')
+    condition = _name_filter(query, lookup)
+    if query.isdigit():
+        condition |= Q(user_id=int(query))
+
+    upper_query = query.upper()
+    return (TelegramUser.objects
+            .filter(condition)
+            .annotate(similarity=Greatest(*[
+                TrigramSimilarity(Upper(field), upper_query) for field in SEARCH_FIELDS
+            ]))
+            .order_by('-similarity', 'user_id'))
+
+
+def autocomplete_users(query: str, limit: int = 10, budget_ms: int = 100) -> Dict:
+    """Топ limit користувачів за префіксом; запит обривається після budget_ms"""
+    query = query.strip().lstrip('@')
+    if not query:
+        return {'results': [], 'timed_out': False}
+
+    try:
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL statement_timeout = %s", [int(budget_ms)])
+            users = list(search_users(query, lookup='istartswith')[:limit])
+    except OperationalError:
+        # statement_timeout: краще порожня підказка, ніж повільна сторінка
+        return {'results': [], 'timed_out': True}
+
+    results: List[Dict] = [
+        {
+            'user_id': user.user_id,
+            'username': user.username,
+            'display_name': user.get_display_name(),
+            'similarity': round(user.similarity or 0, 3),
+        }
+        for user in users
+    ]
+    return {'results': results, 'timed_out': False}
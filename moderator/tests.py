@@ -1,3 +1,1199 @@
-from django.test import TestCase
+import asyncio
+import base64
+import json
+import os
+import re
+import unittest
+import uuid
+from datetime import date, datetime, timedelta
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.db import connection
+from django.http import JsonResponse
+from django.test import RequestFactory, SimpleTestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from moderator import partitions
+from moderator.async_runtime import run_async
+from moderator.cache import InvalidationBus, LookupCache, invalidate_chats, invalidate_moderators
+from moderator.database import SANCTIONS_EXPIRY_KEY, DatabaseManager, ModerationTask, db_manager
+from moderator.decorators import async_api_view, async_login_required
+from moderator.fake_telegram import FakeTelegramServer
+from moderator.importer import import_punishments
+from moderator.indexes import create_bot_indexes
+from moderator.models import Punishment
+from moderator.pagination import decode_cursor, encode_cursor, keyset_paginate
+from moderator.ratelimit import RetryAfter, TokenBucketLimiter
+from moderator.views import api_bulk_moderation
+from moderator.worker import QueueWorker
+
+# Таблиця вважається великою, якщо планувальник оцінює її від стількох рядків
+LARGE_TABLE_ROWS = 10000
+
+# Таблиці бота (managed = False) у тестовій БД не створюються міграціями
+BOT_SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS punishments (
+           id serial PRIMARY KEY,
+           user_id bigint NOT NULL,
+           chat_id bigint NOT NULL,
+           punishment_type varchar(10) NOT NULL,
+           reason text,
+           timestamp timestamp DEFAULT CURRENT_TIMESTAMP,
+           duration_minutes integer,
+           moderator_id bigint
+       )""",
+    """CREATE TABLE IF NOT EXISTS bans (
+           user_id bigint NOT NULL,
+           chat_id bigint NOT NULL,
+           reason text,
+           UNIQUE (user_id, chat_id)
+       )""",
+    """CREATE TABLE IF NOT EXISTS warnings (
+           user_id bigint NOT NULL,
+           chat_id bigint NOT NULL,
+           warn_count integer DEFAULT 0,
+           UNIQUE (user_id, chat_id)
+       )""",
+    "CREATE TABLE IF NOT EXISTS moderators (user_id bigint PRIMARY KEY, username text)",
+    """CREATE TABLE IF NOT EXISTS chat_settings (
+           chat_id bigint PRIMARY KEY,
+           chat_title text,
+           filter_enabled boolean DEFAULT true
+       )""",
+)
+
+# 200k покарань за рік: 20k користувачів, 50 чатів, 20 модераторів
+BOT_SEED = (
+    """INSERT INTO punishments (user_id, chat_id, punishment_type, reason, timestamp,
+                                duration_minutes, moderator_id)
+       SELECT 1000 + g % 20000, -100 - g % 50, (ARRAY['ban', 'kick', 'mute', 'warn'])[1 + g % 4],
+              'spam link ' || g % 997, now() - (g % 525600) * interval '1 minute',
+              CASE WHEN g % 4 = 2 THEN 60 END, 1 + g % 20
+       FROM generate_series(1, 200000) g""",
+    """INSERT INTO bans (user_id, chat_id, reason)
+       SELECT 1000 + g, -100 - g % 50, 'spam' FROM generate_series(1, 20000) g""",
+    """INSERT INTO warnings (user_id, chat_id, warn_count)
+       SELECT 1000 + g, -100 - g % 50, 1 + g % 3 FROM generate_series(1, 20000) g""",
+    "INSERT INTO moderators (user_id, username) SELECT g, 'mod' || g FROM generate_series(1, 20) g",
+    """INSERT INTO chat_settings (chat_id, chat_title)
+       SELECT -100 - g, 'Chat ' || g FROM generate_series(0, 49) g""",
+)
+
+# Managed-таблиці очищуються після кожного тесту TransactionTestCase
+MANAGED_SEED = (
+    """INSERT INTO telegramuser (user_id, username, first_name, last_name, last_seen)
+       SELECT 1000 + g, 'user' || g, 'First' || g % 500, 'Last' || g % 700, now()
+       FROM generate_series(0, 49999) g""",
+    """INSERT INTO punishment_daily_stats (date, chat_id, punishment_type, moderator_id, count)
+       SELECT DATE(timestamp), chat_id, punishment_type, moderator_id, COUNT(*)
+       FROM punishments GROUP BY 1, 2, 3, 4""",
+)
+
+# Агрегат без WHERE за визначенням читає всю таблицю (Paginator.count, запасні лічильники)
+FULL_TABLE_AGGREGATE = re.compile(r'SELECT COUNT\(\*\)( AS "__count")? FROM "?\w+"?', re.IGNORECASE)
+PLANNED_STATEMENTS = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE')
+
+
+def _seq_scans(plan, large_tables):
+    found = []
+
+    def walk(node):
+        if node.get('Node Type') == 'Seq Scan' and node.get('Relation Name') in large_tables:
+            found.append(node['Relation Name'])
+        for child in node.get('Plans', []):
+            walk(child)
+
+    walk(plan[0]['Plan'])
+    return found
+
+
+async def _explain_async(manager, sql, args):
+    pool = await manager.get_pool()
+    async with pool.acquire() as conn:
+        return json.loads(await conn.fetchval('EXPLAIN (FORMAT JSON) ' + sql, *args))
+
+
+@override_settings(REDIS_HOST='127.0.0.1', REDIS_PORT=1, REDIS_PASSWORD=None, REDIS_SSL=False)
+class QueryPlanTests(TransactionTestCase):
+    """EXPLAIN для запитів views.py і database.py: жодного Seq Scan по великих таблицях.
+
+    Redis навмисно недоступний — views мають працювати через запасні шляхи з БД.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        with connection.cursor() as cursor:
+            for statement in BOT_SCHEMA:
+                cursor.execute(statement)
+            cursor.execute("SELECT EXISTS (SELECT 1 FROM punishments)")
+            if not cursor.fetchone()[0]:
+                for statement in BOT_SEED:
+                    cursor.execute(statement)
+            create_bot_indexes(cursor)
+            cursor.execute("ANALYZE")
+
+    def setUp(self):
+        with connection.cursor() as cursor:
+            for statement in MANAGED_SEED:
+                cursor.execute(statement)
+            cursor.execute("ANALYZE telegramuser")
+            cursor.execute("ANALYZE punishment_daily_stats")
+        invalidate_moderators()
+        invalidate_chats()
+
+        self.async_queries = []
+        db_manager.query_observers.append(self._observe)
+        # Спостерігач підключається лише до нових з'єднань пулу
+        run_async(db_manager.close_all())
+
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(self.user)
+
+    def tearDown(self):
+        db_manager.query_observers.remove(self._observe)
+        run_async(db_manager.close_all())
+
+    def _observe(self, record):
+        self.async_queries.append((record.query, record.args))
+
+    def _large_tables(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT relname FROM pg_class WHERE relkind IN ('r', 'p') AND reltuples >= %s",
+                           [LARGE_TABLE_ROWS])
+            return {row[0] for row in cursor.fetchall()}
+
+    def _is_checked(self, sql):
+        sql = sql.strip()
+        return sql.upper().startswith(PLANNED_STATEMENTS) and not FULL_TABLE_AGGREGATE.fullmatch(sql)
+
+    def assertNoSeqScans(self, orm_queries=(), async_queries=(), manager=db_manager):
+        large_tables = self._large_tables()
+        self.assertIn('punishments', large_tables)
+        problems = []
+        with connection.cursor() as cursor:
+            for query in orm_queries:
+                if not self._is_checked(query['sql']):
+                    continue
+                cursor.execute('EXPLAIN (FORMAT JSON) ' + query['sql'])
+                plan = cursor.fetchone()[0]
+                plan = json.loads(plan) if isinstance(plan, str) else plan
+                for table in _seq_scans(plan, large_tables):
+                    problems.append(f"Seq Scan on {table}: {query['sql']}")
+        for sql, args in list(async_queries):
+            if not self._is_checked(sql):
+                continue
+            plan = run_async(_explain_async(manager, sql, args))
+            for table in _seq_scans(plan, large_tables):
+                problems.append(f"Seq Scan on {table}: {' '.join(sql.split())} {args}")
+        self.assertFalse(problems, '\n'.join(problems))
+
+    def _get(self, url, **params):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url, params)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        self.assertLess(response.status_code, 400, url)
+        return list(captured.captured_queries)
+
+    def test_dashboard_queries(self):
+        queries = []
+        queries += self._get(reverse('dashboard'))
+        first_page = self.client.get(reverse('dashboard')).context['recent_punishments']
+        queries += self._get(reverse('dashboard'), after=first_page.next_cursor)
+        queries += self._get(reverse('dashboard'), before=first_page.next_cursor)
+        queries += self._get(reverse('dashboard'), q='spam link 42')
+        queries += self._get(reverse('dashboard'), chat_id='-105', type='ban', page='2')
+        queries += self._get(reverse('dashboard'), moderator_id='7',
+                             date_from=(date.today() - timedelta(days=7)).isoformat())
+        self.assertNoSeqScans(queries, self.async_queries)
+
+    def test_profile_queries(self):
+        queries = []
+        queries += self._get(reverse('moderator_profile', args=[5]))
+        response = self.client.get(reverse('api_moderator_punishments', args=[5]))
+        queries += self._get(reverse('api_moderator_punishments', args=[5]),
+                             after=response.json()['next_cursor'])
+        self.assertNoSeqScans(queries, self.async_queries)
+
+    def test_user_queries(self):
+        queries = []
+        queries += self._get(reverse('users_list'), page='3')
+        queries += self._get(reverse('users_list'), search='user123')
+        queries += self._get(reverse('user_detail', args=[1500]))
+        queries += self._get(reverse('api_user_info', args=[1500]))
+        queries += self._get(reverse('api_user_autocomplete'), q='user42')
+        self.assertNoSeqScans(queries, self.async_queries)
+
+    def test_analytics_search_and_export_queries(self):
+        queries = []
+        queries += self._get(reverse('analytics'))
+        queries += self._get(reverse('analytics'), days='7', chat_id='-110')
+        queries += self._get(reverse('api_search_punishments'), q='spam link 17', chat_id='-120')
+        queries += self._get(reverse('export_punishments', args=['csv']), days='2')
+        queries += self._get(reverse('export_punishments', args=['ndjson']), chat_id='-130', days='30')
+        self.assertNoSeqScans(queries, self.async_queries)
+
+    def test_database_manager_queries(self):
+        run_async(db_manager.get_user_punishments(1500))
+        run_async(db_manager.get_user_punishments(1500, -100))
+        run_async(db_manager.get_warning_count(1500, -100))
+        run_async(db_manager.search_punishments('spam', moderator_id=3))
+        run_async(db_manager.search_punishments(punishment_type='mute', page=5))
+        run_async(db_manager.get_moderation_stats(-100, days=30))
+        run_async(db_manager.lift_mute(1002, -102))
+        run_async(db_manager.remove_warning(1001, -101))
+        run_async(db_manager.apply_ban(1003, -103, 'test', 1))
+        run_async(db_manager.apply_warn(1004, -104, 'test', 1))
+        run_async(db_manager.reconcile_daily_stats(days=2))
+
+        # Експорт читає через серверний курсор, який asyncpg не логує — перевіряємо сам запит
+        export_queries = [
+            DatabaseManager._export_query(date_from=date.today() - timedelta(days=2)),
+            DatabaseManager._export_query(chat_id=-100, date_from=date.today() - timedelta(days=30)),
+            DatabaseManager._export_query(moderator_id=4, punishment_type='ban'),
+        ]
+        self.assertNoSeqScans(async_queries=self.async_queries + export_queries)
+
+
+# Тести черги і дедуплікації потребують справжнього Redis (за замовчуванням — локальний, db 15)
+TEST_REDIS_URL = os.environ.get('TEST_REDIS_URL', 'redis://127.0.0.1:6379/15')
+
+
+def _task(task_type, user_id=1, chat_id=-100):
+    return ModerationTask(task_type=task_type, user_id=user_id, username=None, reason='test',
+                          chat_id=chat_id, moderator_id=1)
+
+
+def _redis_available() -> bool:
+    async def ping():
+        manager = DatabaseManager(redis_url=TEST_REDIS_URL)
+        try:
+            return await manager.get_redis().ping()
+        finally:
+            await manager.close_all()
+    try:
+        return bool(run_async(ping(), timeout=2))
+    except Exception:
+        return False
+
+
+class QueueLaneAndDedupTests(SimpleTestCase):
+    """Пріоритетні смуги черги і SET NX дедуплікація на справжньому Redis"""
+
+    @classmethod
+    def setUpClass(cls):
+        if not _redis_available():
+            raise unittest.SkipTest(f"Redis is not reachable at {TEST_REDIS_URL}")
+        super().setUpClass()
+
+    def setUp(self):
+        self.manager = DatabaseManager(redis_url=TEST_REDIS_URL)
+        prefix = f"test:{uuid.uuid4().hex}"
+        self.manager.queue_stream = f"{prefix}:stream"
+        self.manager.queue_group = f"{prefix}:group"
+        # Ключі дедуплікації глобальні — окремий чат на кожен тест, щоб тести не заважали один одному
+        self.chat_id = -int(uuid.uuid4().int % 10 ** 12)
+
+    def tearDown(self):
+        async def cleanup():
+            client = self.manager.get_redis()
+            await self.manager.clear_queue()
+            keys = [key async for key in client.scan_iter(f"dedup:*:{self.chat_id}:*")]
+            if keys:
+                await client.delete(*keys)
+            await self.manager.close_all()
+        run_async(cleanup())
+
+    def test_claim_rejects_duplicates_within_window(self):
+        ban = _task('ban', chat_id=self.chat_id)
+        self.assertEqual(run_async(self.manager.claim_tasks([ban])), [True])
+        self.assertEqual(run_async(self.manager.claim_tasks([ban])), [False])
+        # Інший користувач — інший ключ
+        self.assertEqual(run_async(self.manager.claim_tasks([_task('ban', 2, self.chat_id)])), [True])
+
+    def test_claim_marks_duplicates_inside_one_batch(self):
+        warn = _task('warn', chat_id=self.chat_id)
+        self.assertEqual(run_async(self.manager.claim_tasks([warn, warn, _task('mute', chat_id=self.chat_id)])),
+                         [True, False, True])
+
+    def test_release_allows_retry(self):
+        mute = _task('mute', chat_id=self.chat_id)
+        run_async(self.manager.claim_tasks([mute]))
+        run_async(self.manager.release_tasks([mute]))
+        self.assertEqual(run_async(self.manager.claim_tasks([mute])), [True])
+
+    def test_inverse_action_clears_claim(self):
+        ban, unban = _task('ban', chat_id=self.chat_id), _task('unban', chat_id=self.chat_id)
+        self.assertEqual(run_async(self.manager.claim_tasks([ban])), [True])
+        self.assertEqual(run_async(self.manager.claim_tasks([unban])), [True])
+        # Повторний бан після розбану — нова дія, а не дубль
+        self.assertEqual(run_async(self.manager.claim_tasks([ban])), [True])
+
+    def test_claim_window_is_key_ttl(self):
+        warn = _task('warn', chat_id=self.chat_id)
+        run_async(self.manager.claim_tasks([warn], window=1))
+        ttl = run_async(self.manager.get_redis().ttl(f"dedup:warn:{self.chat_id}:1"))
+        self.assertTrue(0 < ttl <= 1)
+
+    def test_add_to_queue_skips_duplicates(self):
+        ban = _task('ban', chat_id=self.chat_id)
+        self.assertTrue(run_async(self.manager.add_to_queue(ban)))
+        self.assertFalse(run_async(self.manager.add_to_queue(ban)))
+        queued = run_async(self.manager.add_to_queue_bulk([ban, _task('warn', chat_id=self.chat_id)]))
+        self.assertEqual(queued, [False, True])
+        self.assertEqual(run_async(self.manager.get_queue_length()), 2)
+
+    def test_dedup_can_be_disabled(self):
+        warn = _task('warn', chat_id=self.chat_id)
+        self.assertEqual(run_async(self.manager.add_to_queue_bulk([warn, warn], dedup=False)), [True, True])
+        self.assertEqual(run_async(self.manager.get_queue_length()), 2)
+
+    def test_tasks_are_routed_to_lanes(self):
+        run_async(self.manager.add_to_queue_bulk(
+            [_task(task_type, i, self.chat_id) for i, task_type in
+             enumerate(('warn', 'unwarn', 'mute', 'unmute', 'ban', 'kick', 'unban'))],
+            dedup=False
+        ))
+        self.assertEqual(run_async(self.manager.get_lane_lengths()), {'high': 3, 'normal': 2, 'low': 2})
+
+    def test_read_tasks_drains_higher_lanes_first(self):
+        # Варни надходять першими, але бан і мут мають бути прочитані раніше
+        tasks = [_task('warn', i, self.chat_id) for i in range(3)]
+        tasks += [_task('mute', 10, self.chat_id), _task('ban', 11, self.chat_id)]
+        run_async(self.manager.add_to_queue_bulk(tasks, dedup=False))
+
+        first = run_async(self.manager.read_tasks('tester', count=3))
+        self.assertEqual([task.task_type for _, task in first], ['ban', 'mute', 'warn'])
+        self.assertEqual([entry_id.split(':')[0] for entry_id, _ in first], ['high', 'normal', 'low'])
+        rest = run_async(self.manager.read_tasks('tester', count=10))
+        self.assertEqual([task.task_type for _, task in rest], ['warn', 'warn'])
+
+        acked = run_async(self.manager.ack_tasks([entry_id for entry_id, _ in first + rest]))
+        self.assertEqual(acked, 5)
+        self.assertEqual(run_async(self.manager.get_queue_length()), 0)
+
+    def test_blocking_read_wakes_on_any_lane(self):
+        async def scenario():
+            reader = asyncio.ensure_future(self.manager.read_tasks('tester', count=10, block_ms=2000))
+            await asyncio.sleep(0.1)
+            await self.manager.add_to_queue(_task('warn', chat_id=self.chat_id), dedup=False)
+            return await reader
+        entries = run_async(scenario())
+        self.assertEqual([task.task_type for _, task in entries], ['warn'])
+
+
+@override_settings(REDIS_HOST='127.0.0.1', REDIS_PORT=1, REDIS_PASSWORD=None, REDIS_SSL=False)
+class DedupFailOpenTests(SimpleTestCase):
+    """Без Redis дедуплікація пропускає завдання: дубль краще за втрачену дію"""
+
+    def test_claim_accepts_everything_when_redis_is_down(self):
+        manager = DatabaseManager()
+        warn = _task('warn')
+        try:
+            self.assertEqual(run_async(manager.claim_tasks([warn, warn])), [True, True])
+        finally:
+            run_async(manager.close_all())
+
+
+class WorkerLaneOrderTests(SimpleTestCase):
+    """Локальний розклад воркера з rate limit зберігає пріоритет смуг у черзі чату"""
+
+    def setUp(self):
+        # limiter лише вмикає розклад; сам _dispatch тут не запускається
+        self.worker = QueueWorker({}, consumer='tester', limiter=object())
+        self.worker._wakeup = asyncio.Event()
+
+    def _queued(self, chat_id):
+        return [entry_id for entry_id, _ in self.worker._pending[chat_id]]
+
+    def test_higher_lane_jumps_ahead_within_chat(self):
+        self.worker._schedule([('low:1-0', _task('warn', 1)), ('low:2-0', _task('warn', 2))])
+        self.worker._schedule([('normal:3-0', _task('mute', 3))])
+        self.worker._schedule([('high:4-0', _task('ban', 4)), ('low:5-0', _task('warn', 5))])
+        self.assertEqual(self._queued(-100), ['high:4-0', 'normal:3-0', 'low:1-0', 'low:2-0', 'low:5-0'])
+        self.assertEqual(self.worker._pending_count, 5)
+
+    def test_retry_goes_to_front(self):
+        self.worker._schedule([('high:1-0', _task('ban', 1))])
+        self.worker._schedule([('low:2-0', _task('warn', 2))], front=True)
+        self.assertEqual(self._queued(-100), ['low:2-0', 'high:1-0'])
+
+    def test_chats_are_scheduled_independently(self):
+        self.worker._schedule([('low:1-0', _task('warn', 1, -100)), ('high:2-0', _task('ban', 2, -200))])
+        self.assertEqual(self._queued(-100), ['low:1-0'])
+        self.assertEqual(self._queued(-200), ['high:2-0'])
+        self.assertEqual(len(self.worker._ready), 2)
+
+
+class TokenBucketLimiterTests(SimpleTestCase):
+    """Відра чату і глобальне на справжньому Redis: списання, відмова і блокування після 429"""
+
+    @classmethod
+    def setUpClass(cls):
+        if not _redis_available():
+            raise unittest.SkipTest(f"Redis is not reachable at {TEST_REDIS_URL}")
+        super().setUpClass()
+
+    def setUp(self):
+        self.manager = DatabaseManager(redis_url=TEST_REDIS_URL)
+        self.prefix = f"test:ratelimit:{uuid.uuid4().hex}"
+        patcher = mock.patch('moderator.ratelimit.db_manager', self.manager)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        async def cleanup():
+            client = self.manager.get_redis()
+            keys = [key async for key in client.scan_iter(f"{self.prefix}:*")]
+            if keys:
+                await client.delete(*keys)
+            await self.manager.close_all()
+        run_async(cleanup())
+
+    def _limiter(self, **limits):
+        # Повільне поповнення: за час тесту жодне відро не отримує нового токена
+        params = dict(global_rate=0.01, global_burst=100, chat_rate=0.01, chat_burst=100)
+        params.update(limits)
+        return TokenBucketLimiter(prefix=self.prefix, **params)
+
+    def test_chat_burst_is_allowed_then_denied(self):
+        limiter = self._limiter(chat_burst=2)
+        self.assertTrue(run_async(limiter.acquire(-1)).allowed)
+        self.assertTrue(run_async(limiter.acquire(-1)).allowed)
+        denied = run_async(limiter.acquire(-1))
+        self.assertFalse(denied.allowed)
+        self.assertEqual(denied.scope, 'chat')
+        self.assertGreater(denied.wait, 0)
+        # Інший чат має власне відро
+        self.assertTrue(run_async(limiter.acquire(-2)).allowed)
+
+    def test_global_bucket_limits_all_chats(self):
+        limiter = self._limiter(global_burst=2)
+        self.assertTrue(run_async(limiter.acquire(-1)).allowed)
+        self.assertTrue(run_async(limiter.acquire(-2)).allowed)
+        denied = run_async(limiter.acquire(-3))
+        self.assertEqual((denied.allowed, denied.scope), (False, 'global'))
+        self.assertGreater(denied.wait, 0)
+
+    def test_chat_denial_does_not_spend_global_token(self):
+        limiter = self._limiter(global_burst=2, chat_burst=1)
+        self.assertTrue(run_async(limiter.acquire(-1)).allowed)
+        self.assertEqual(run_async(limiter.acquire(-1)).scope, 'chat')
+        # Відмова чату -1 не з'їла другий глобальний токен
+        self.assertTrue(run_async(limiter.acquire(-2)).allowed)
+
+    def test_penalize_chat_blocks_for_retry_after(self):
+        limiter = self._limiter(chat_rate=1, chat_burst=5)
+        run_async(limiter.penalize(5, chat_id=-1))
+        denied = run_async(limiter.acquire(-1))
+        self.assertEqual((denied.allowed, denied.scope), (False, 'chat'))
+        self.assertTrue(4 < denied.wait <= 5)
+        self.assertTrue(run_async(limiter.acquire(-2)).allowed)
+
+    def test_penalize_global_blocks_every_chat(self):
+        limiter = self._limiter(global_rate=10, global_burst=30)
+        run_async(limiter.penalize(3))
+        for chat_id in (-1, -2):
+            denied = run_async(limiter.acquire(chat_id))
+            self.assertEqual((denied.allowed, denied.scope), (False, 'global'))
+            self.assertTrue(2 < denied.wait <= 3)
+
+
+@override_settings(REDIS_HOST='127.0.0.1', REDIS_PORT=1, REDIS_PASSWORD=None, REDIS_SSL=False)
+class TokenBucketFailOpenTests(SimpleTestCase):
+    """Без Redis limiter пропускає виклики: від 429 тоді захищає retry_after у воркері"""
+
+    def test_acquire_allows_when_redis_is_down(self):
+        manager = DatabaseManager()
+        try:
+            with mock.patch('moderator.ratelimit.db_manager', manager):
+                limiter = TokenBucketLimiter(prefix='test:ratelimit:down')
+                self.assertEqual(run_async(limiter.acquire(-1)), (True, 0.0, None))
+                # penalize лише логує помилку
+                run_async(limiter.penalize(1, chat_id=-1))
+        finally:
+            run_async(manager.close_all())
+
+
+class _RecordingLimiter:
+    def __init__(self):
+        self.penalties = []
+
+    async def penalize(self, retry_after, chat_id=None):
+        self.penalties.append((retry_after, chat_id))
+
+
+class WorkerRetryAfterTests(SimpleTestCase):
+    """429 від обробника блокує відро і повертає завдання на початок черги чату без ack"""
+
+    def _worker(self, error):
+        async def handler(task):
+            raise error
+        worker = QueueWorker({'ban': handler}, consumer='tester', limiter=_RecordingLimiter())
+        worker._wakeup = asyncio.Event()
+        return worker
+
+    def test_chat_retry_after_reschedules_task(self):
+        worker = self._worker(RetryAfter(7))
+        worker._schedule([('high:2-0', _task('ban', 2))])
+        run_async(worker._handle('high:1-0', _task('ban', 1)))
+        self.assertEqual(worker.limiter.penalties, [(7.0, -100)])
+        self.assertEqual([entry_id for entry_id, _ in worker._pending[-100]], ['high:1-0', 'high:2-0'])
+        self.assertEqual((worker.retried, worker.failed, worker.processed), (1, 0, 0))
+
+    def test_global_retry_after_penalizes_global_bucket(self):
+        worker = self._worker(RetryAfter(2, scope='global'))
+        run_async(worker._handle('high:1-0', _task('ban')))
+        self.assertEqual(worker.limiter.penalties, [(2.0, None)])
+
+
+class FakeTelegramLimitTests(SimpleTestCase):
+    """Ліміти локального Bot API: відмова по чату не списує глобальний токен"""
+
+    def test_chat_reject_keeps_global_token(self):
+        server = FakeTelegramServer(global_rate=0.01, global_burst=2, chat_rate=0.01, chat_burst=1)
+        self.assertEqual(server._limit('-1'), 0)
+        self.assertGreater(server._limit('-1'), 0)
+        self.assertEqual(server._limit('-2'), 0)
+        self.assertGreater(server._limit('-3'), 0)
+
+
+@async_api_view(['POST'])
+async def _echo_view(request):
+    return {'data': dict(request.data)}
+
+
+@async_login_required
+async def _page_view(request):
+    return JsonResponse({'ok': True})
+
+
+class AsyncViewDecoratorTests(SimpleTestCase):
+    """async_api_view і async_login_required відповідають так само, як @api_view і login_required"""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def _call(self, view, request, user=None):
+        request.user = user or SimpleNamespace(is_authenticated=True)
+        return async_to_sync(view)(request)
+
+    def _post(self, body, content_type='application/json'):
+        return self.factory.post('/echo/', data=body, content_type=content_type)
+
+    def test_disallowed_method_is_405(self):
+        response = self._call(_echo_view, self.factory.get('/echo/'))
+        self.assertEqual(response.status_code, 405)
+        self.assertEqual(json.loads(response.content), {'detail': 'Method "GET" not allowed.'})
+
+    def test_anonymous_user_is_403(self):
+        response = self._call(_echo_view, self._post('{}'), user=AnonymousUser())
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(json.loads(response.content), {'detail': 'Authentication credentials were not provided.'})
+
+    def test_method_is_checked_before_authentication(self):
+        response = self._call(_echo_view, self.factory.get('/echo/'), user=AnonymousUser())
+        self.assertEqual(response.status_code, 405)
+
+    def test_malformed_json_is_400(self):
+        response = self._call(_echo_view, self._post('{"user_id": '))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(json.loads(response.content), {'detail': 'JSON parse error'})
+
+    def test_json_body_becomes_data(self):
+        response = self._call(_echo_view, self._post(json.dumps({'user_id': 42})))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), {'data': {'user_id': 42}})
+
+    def test_empty_json_body_is_empty_dict(self):
+        response = self._call(_echo_view, self._post(''))
+        self.assertEqual(json.loads(response.content), {'data': {}})
+
+    def test_form_body_becomes_data(self):
+        request = self.factory.post('/echo/', data={'user_id': '42'})
+        response = self._call(_echo_view, request)
+        self.assertEqual(json.loads(response.content), {'data': {'user_id': ['42']}})
+
+    def test_login_required_redirects_anonymous(self):
+        response = self._call(_page_view, self.factory.get('/page/?tab=1'), user=AnonymousUser())
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response['Location'], f"{settings.LOGIN_URL}?next=/page/%3Ftab%3D1")
+
+    def test_login_required_passes_authenticated(self):
+        response = self._call(_page_view, self.factory.get('/page/'))
+        self.assertEqual(response.status_code, 200)
+
+
+class LookupCacheInvalidationTests(SimpleTestCase):
+    """Версії ключів у LookupCache і застосування повідомлень шини інвалідації"""
+
+    def setUp(self):
+        self.loads = 0
+        self.cache = LookupCache(ttl=60)
+        self.cache.register('moderator_map', self._load)
+        self.bus = InvalidationBus(self.cache, channel='test:invalidate', versions_key='test:versions')
+
+    def _load(self):
+        self.loads += 1
+        return {'loads': self.loads}
+
+    def test_get_caches_until_invalidated(self):
+        self.assertEqual(self.cache.get('moderator_map'), {'loads': 1})
+        self.assertEqual(self.cache.get('moderator_map'), {'loads': 1})
+        self.cache.invalidate('moderator_map')
+        self.assertEqual(self.cache.get('moderator_map'), {'loads': 2})
+
+    def test_load_started_before_invalidation_is_not_cached(self):
+        def racing_load():
+            # Інвалідація надходить, поки завантаження ще йде
+            self.cache.invalidate('moderator_map')
+            return self._load()
+        self.cache.register('moderator_map', racing_load)
+        self.cache.get('moderator_map')
+        self.cache.register('moderator_map', self._load)
+        self.assertEqual(self.cache.get('moderator_map'), {'loads': 2})
+
+    def test_get_does_not_start_the_bus(self):
+        self.cache.get('moderator_map')
+        self.assertIsNone(self.bus._thread)
+
+    def test_message_from_other_process_invalidates(self):
+        self.cache.get('moderator_map')
+        self.bus._apply({'moderator_map': '1'}, origin='other-host:1')
+        self.assertEqual(self.cache.get('moderator_map'), {'loads': 2})
+
+    def test_own_and_stale_messages_are_ignored(self):
+        self.cache.get('moderator_map')
+        # Власну публікацію publish() уже застосував локально
+        self.bus._apply({'moderator_map': 1}, origin=self.bus.origin)
+        # Версія не новіша за бачену — повтор після перепідключення
+        self.bus._apply({'moderator_map': 1}, origin='other-host:1')
+        self.assertEqual(self.cache.get('moderator_map'), {'loads': 1})
+        self.assertEqual(self.bus.stats()['versions'], {'moderator_map': 1})
+
+    def test_unknown_keys_are_ignored(self):
+        self.bus._apply({'chat_settings:-100': 3}, origin='other-host:1')
+        self.assertEqual(self.cache.stats()['moderator_map']['version'], 0)
+
+
+STATUS_CHAT_ID = -990002
+STATUS_USER_ID = 880001
+
+
+class StatusCacheInvalidationTests(TransactionTestCase):
+    """Кеш статусів для бота скидається, коли модератора додають чи видаляють"""
+
+    @classmethod
+    def setUpClass(cls):
+        if not _redis_available():
+            raise unittest.SkipTest(f"Redis is not reachable at {TEST_REDIS_URL}")
+        super().setUpClass()
+        with connection.cursor() as cursor:
+            for statement in BOT_SCHEMA:
+                cursor.execute(statement)
+
+    def setUp(self):
+        self.manager = DatabaseManager(redis_url=TEST_REDIS_URL)
+        patcher = mock.patch('moderator.admin_views.db_manager', self.manager)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(self.user)
+
+    def tearDown(self):
+        async def cleanup():
+            await self.manager.invalidate_status(pairs=[(STATUS_CHAT_ID, STATUS_USER_ID)],
+                                                 moderators=[STATUS_USER_ID], chats=[STATUS_CHAT_ID])
+            await self.manager.close_all()
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM moderators WHERE user_id = %s", [STATUS_USER_ID])
+        run_async(cleanup())
+
+    def _status(self):
+        result = run_async(self.manager.get_status_bulk(STATUS_CHAT_ID, [STATUS_USER_ID]))
+        return result['users'][STATUS_USER_ID]['is_moderator'], result['cache_misses']
+
+    def test_warm_cache_serves_without_database(self):
+        self.assertEqual(self._status(), (False, 1))
+        self.assertEqual(self._status(), (False, 0))
+
+    def test_admin_views_invalidate_moderator_status(self):
+        self._status()
+        response = self.client.post(reverse('create_moderator'),
+                                    {'user_id': STATUS_USER_ID, 'username': 'status_test'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self._status(), (True, 1))
+
+        self.client.get(reverse('delete_moderator', args=[STATUS_USER_ID]))
+        self.assertEqual(self._status(), (False, 1))
+
+    def test_database_manager_invalidates_moderator_status(self):
+        self._status()
+        run_async(self.manager.add_moderator_to_db(STATUS_USER_ID, 'status_test'))
+        self.assertEqual(self._status(), (True, 1))
+        run_async(self.manager.remove_moderator_from_db(STATUS_USER_ID))
+        self.assertEqual(self._status(), (False, 1))
+
+
+SANCTION_CHAT_ID = -990003
+
+
+@override_settings(DASHBOARD_FEED_ENABLED=False)
+class SanctionExpiryTests(TransactionTestCase):
+    """Мут у active_sanctions, розклад у ZSET і зняття мутів, строк яких минув"""
+
+    @classmethod
+    def setUpClass(cls):
+        if not _redis_available():
+            raise unittest.SkipTest(f"Redis is not reachable at {TEST_REDIS_URL}")
+        super().setUpClass()
+        with connection.cursor() as cursor:
+            for statement in BOT_SCHEMA:
+                cursor.execute(statement)
+
+    def setUp(self):
+        self.manager = DatabaseManager(redis_url=TEST_REDIS_URL)
+        prefix = f"test:{uuid.uuid4().hex}"
+        self.manager.queue_stream = f"{prefix}:stream"
+        self.manager.queue_group = f"{prefix}:group"
+
+    def tearDown(self):
+        async def cleanup():
+            client = self.manager.get_redis()
+            members = [member for member in await client.zrange(SANCTIONS_EXPIRY_KEY, 0, -1)
+                       if member.split(':')[1] == str(SANCTION_CHAT_ID)]
+            if members:
+                await client.zrem(SANCTIONS_EXPIRY_KEY, *members)
+            await self.manager.clear_queue()
+            await self.manager.close_all()
+        with connection.cursor() as cursor:
+            for table in ('active_sanctions', 'punishments', 'punishment_daily_stats'):
+                cursor.execute(f"DELETE FROM {table} WHERE chat_id = %s", [SANCTION_CHAT_ID])
+        run_async(cleanup())
+
+    def _insert_mute(self, user_id, expires_in):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """INSERT INTO active_sanctions (user_id, chat_id, sanction_type, expires_at, moderator_id, created_at)
+                   VALUES (%s, %s, 'mute', now() + make_interval(secs => %s), 7, now())""",
+                [user_id, SANCTION_CHAT_ID, expires_in]
+            )
+
+    def _active(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT user_id FROM active_sanctions WHERE chat_id = %s ORDER BY user_id",
+                           [SANCTION_CHAT_ID])
+            return [row[0] for row in cursor.fetchall()]
+
+    def _score(self, user_id):
+        return run_async(self.manager.get_redis().zscore(SANCTIONS_EXPIRY_KEY,
+                                                         f"mute:{SANCTION_CHAT_ID}:{user_id}"))
+
+    def test_due_mute_is_lifted_and_unmute_queued(self):
+        self._insert_mute(1, -60)
+        self._insert_mute(2, 3600)
+        self.assertEqual(run_async(self.manager.rebuild_expiry_schedule()), 2)
+
+        tasks = run_async(self.manager.expire_due_sanctions())
+        self.assertEqual([(task.task_type, task.user_id, task.moderator_id) for task in tasks], [('unmute', 1, 7)])
+        self.assertEqual(self._active(), [2])
+        self.assertIsNone(self._score(1))
+        self.assertIsNotNone(self._score(2))
+        self.assertEqual(run_async(self.manager.get_queue_length()), 1)
+        # Повторний запуск нічого не знімає
+        self.assertEqual(run_async(self.manager.expire_due_sanctions()), [])
+
+    def test_extended_mute_is_not_lifted(self):
+        self._insert_mute(1, -60)
+        run_async(self.manager.rebuild_expiry_schedule())
+        # Повторний мут переніс строк у БД, а розклад ще має старий score
+        with connection.cursor() as cursor:
+            cursor.execute("UPDATE active_sanctions SET expires_at = now() + interval '1 hour' WHERE chat_id = %s",
+                           [SANCTION_CHAT_ID])
+        self.assertEqual(run_async(self.manager.expire_due_sanctions()), [])
+        self.assertEqual(self._active(), [1])
+        self.assertEqual(run_async(self.manager.get_queue_length()), 0)
+
+    def test_apply_and_lift_mute(self):
+        result = run_async(self.manager.apply_mute(1, SANCTION_CHAT_ID, 'flood', 7, duration_minutes=10))
+        self.assertEqual(self._active(), [1])
+        self.assertAlmostEqual(self._score(1), result['expires_at'].timestamp(), delta=1)
+
+        self.assertEqual(run_async(self.manager.lift_mute(1, SANCTION_CHAT_ID)), result['punishment_id'])
+        self.assertEqual(self._active(), [])
+        self.assertIsNone(self._score(1))
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT count(*) FROM punishments WHERE chat_id = %s", [SANCTION_CHAT_ID])
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+
+class PartitionHelperTests(SimpleTestCase):
+    """Межі місяців і перетин діапазонів партицій"""
+
+    def test_add_months_crosses_year_boundaries(self):
+        self.assertEqual(partitions.add_months(date(2025, 11, 1), 2), date(2026, 1, 1))
+        self.assertEqual(partitions.add_months(date(2025, 1, 1), -1), date(2024, 12, 1))
+        self.assertEqual(partitions.add_months(date(2025, 3, 1), -15), date(2023, 12, 1))
+
+    def test_partition_name(self):
+        self.assertEqual(partitions.partition_name(date(2025, 7, 1)), 'punishments_p202507')
+
+    def test_overlaps(self):
+        legacy = partitions.Partition('punishments_legacy', None, date(2025, 2, 1), False)
+        month = partitions.Partition('punishments_p202502', date(2025, 2, 1), date(2025, 3, 1), False)
+        default = partitions.Partition('punishments_default', None, None, True)
+        self.assertTrue(partitions._overlaps(legacy, date(2025, 1, 1), date(2025, 2, 1)))
+        self.assertFalse(partitions._overlaps(legacy, date(2025, 2, 1), date(2025, 3, 1)))
+        self.assertTrue(partitions._overlaps(month, date(2025, 2, 1), date(2025, 3, 1)))
+        self.assertFalse(partitions._overlaps(month, date(2025, 3, 1), date(2025, 4, 1)))
+        self.assertFalse(partitions._overlaps(default, date(2025, 2, 1), date(2025, 3, 1)))
+
+
+class PartitionConversionTests(TransactionTestCase):
+    """Конвертація punishments у помісячні партиції і retention.
+
+    Працює в окремій схемі (search_path), щоб не чіпати таблиці бота інших тестів;
+    TransactionTestCase — бо конвертація будує індекси CONCURRENTLY.
+    """
+
+    def setUp(self):
+        suffix = uuid.uuid4().hex[:8]
+        self.schema = f"test_partitions_{suffix}"
+        self.archive = f"test_archive_{suffix}"
+        self.cursor = connection.cursor()
+        self.cursor.execute(f"CREATE SCHEMA {self.schema}")
+        self.cursor.execute(f"SET search_path TO {self.schema}")
+        self.cursor.execute(BOT_SCHEMA[0])
+        self.month = partitions.month_start(date.today())
+        self.cutover = partitions.add_months(self.month, 1)
+        for months_back in (14, 1, 0):
+            self._insert(partitions.add_months(self.month, -months_back) + timedelta(days=3))
+
+    def tearDown(self):
+        self.cursor.execute("RESET search_path")
+        for schema in (self.schema, self.archive):
+            self.cursor.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+        self.cursor.close()
+
+    def _insert(self, day):
+        self.cursor.execute("""INSERT INTO punishments (user_id, chat_id, punishment_type, timestamp)
+                               VALUES (1, -100, 'warn', %s) RETURNING tableoid::regclass::text""", [day])
+        return self.cursor.fetchone()[0]
+
+    def _count(self, table):
+        self.cursor.execute(f"SELECT count(*) FROM {table}")
+        return self.cursor.fetchone()[0]
+
+    def test_conversion_keeps_rows_and_routes_new_months(self):
+        self.assertEqual(partitions.convert_to_partitioned(self.cursor, months_ahead=2), self.cutover)
+        self.assertTrue(partitions.is_partitioned(self.cursor))
+        self.assertEqual(self._count(partitions.PARENT), 3)
+        self.assertEqual(self._count(partitions.LEGACY), 3)
+
+        names = [partition.name for partition in partitions.list_partitions(self.cursor)]
+        expected = [partitions.partition_name(partitions.add_months(self.cutover, offset)) for offset in range(3)]
+        self.assertEqual(sorted(names), sorted([partitions.LEGACY, partitions.DEFAULT] + expected))
+
+        self.assertEqual(self._insert(self.month), partitions.LEGACY)
+        self.assertEqual(self._insert(self.cutover + timedelta(days=1)), expected[0])
+        # Нова послідовність id продовжує стару
+        self.cursor.execute("SELECT count(DISTINCT id) FROM punishments")
+        self.assertEqual(self.cursor.fetchone()[0], 5)
+        # Повторний запуск нічого не робить
+        self.assertIsNone(partitions.convert_to_partitioned(self.cursor))
+
+    def test_ensure_partitions_moves_rows_out_of_default(self):
+        partitions.convert_to_partitioned(self.cursor, months_ahead=0)
+        far = partitions.add_months(self.month, 24)
+        self.assertEqual(self._insert(far + timedelta(days=5)), partitions.DEFAULT)
+
+        self.assertEqual(partitions.ensure_partitions(self.cursor, months_ahead=0, start=far),
+                         [partitions.partition_name(far)])
+        self.assertEqual(self._count(partitions.DEFAULT), 0)
+        self.assertEqual(self._count(partitions.partition_name(far)), 1)
+        self.assertEqual(partitions.ensure_partitions(self.cursor, months_ahead=0, start=far), [])
+
+    def test_retention_archives_old_partitions(self):
+        partitions.convert_to_partitioned(self.cursor, months_ahead=2)
+        later = partitions.add_months(self.cutover, 3)
+        with mock.patch('moderator.partitions.timezone.now', return_value=datetime(later.year, later.month, 10)):
+            detached = partitions.apply_retention(self.cursor, keep_months=2, archive_schema=self.archive)
+        first_month = partitions.partition_name(self.cutover)
+        self.assertEqual(sorted(detached), sorted([partitions.LEGACY, first_month]))
+        self.assertEqual(self._count(partitions.PARENT), 0)
+        # Архівовані рядки лишаються доступними
+        self.assertEqual(self._count(f"{self.archive}.{partitions.LEGACY}"), 3)
+        self.assertEqual(self._count(f"{self.archive}.{first_month}"), 0)
+
+
+class KeysetCursorTests(SimpleTestCase):
+    def test_cursor_round_trip(self):
+        moment = datetime(2025, 5, 6, 7, 8, 9, 123456)
+        self.assertEqual(decode_cursor(encode_cursor(moment, 42)), (moment, 42))
+
+    def test_malformed_cursor_is_none(self):
+        for token in ('', 'not-a-cursor', base64.urlsafe_b64encode(b'yesterday|1').decode()):
+            self.assertIsNone(decode_cursor(token))
+
+
+KEYSET_CHAT_ID = -990004
+
+
+class KeysetPaginationTests(TransactionTestCase):
+    """Курсорна пагінація: рядки з однаковим timestamp не губляться і не повторюються на межі сторінок"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        with connection.cursor() as cursor:
+            for statement in BOT_SCHEMA:
+                cursor.execute(statement)
+
+    def setUp(self):
+        moment = datetime(2025, 3, 1, 12, 0)
+        self.older = Punishment.objects.create(user_id=1, chat_id=KEYSET_CHAT_ID, punishment_type='warn',
+                                               reason='', timestamp=moment - timedelta(hours=1), moderator_id=1)
+        # П'ять покарань в одну й ту саму мить
+        self.ties = [
+            Punishment.objects.create(user_id=i, chat_id=KEYSET_CHAT_ID, punishment_type='warn',
+                                      reason='', timestamp=moment, moderator_id=1)
+            for i in range(2, 7)
+        ]
+        self.queryset = Punishment.objects.filter(chat_id=KEYSET_CHAT_ID)
+
+    def tearDown(self):
+        self.queryset.delete()
+
+    def _ids(self, page):
+        return [p.id for p in page]
+
+    def test_pages_walk_through_ties_in_order(self):
+        expected = [p.id for p in reversed(self.ties)] + [self.older.id]
+        seen, after = [], None
+        while True:
+            page = keyset_paginate(self.queryset, after=after, per_page=2)
+            seen += self._ids(page)
+            if not page.has_next:
+                break
+            after = page.next_cursor
+        self.assertEqual(seen, expected)
+
+    def test_before_returns_previous_page(self):
+        first = keyset_paginate(self.queryset, per_page=2)
+        second = keyset_paginate(self.queryset, after=first.next_cursor, per_page=2)
+        third = keyset_paginate(self.queryset, after=second.next_cursor, per_page=2)
+        self.assertFalse(first.has_previous)
+        self.assertFalse(third.has_next)
+
+        back = keyset_paginate(self.queryset, before=third.prev_cursor, per_page=2)
+        self.assertEqual(self._ids(back), self._ids(second))
+        self.assertTrue(back.has_previous and back.has_next)
+        self.assertEqual(self._ids(keyset_paginate(self.queryset, before=back.prev_cursor, per_page=2)),
+                         self._ids(first))
+
+    def test_bad_or_stale_cursor_falls_back_to_first_page(self):
+        first = self._ids(keyset_paginate(self.queryset, per_page=2))
+        self.assertEqual(self._ids(keyset_paginate(self.queryset, after='garbage', per_page=2)), first)
+        past_end = encode_cursor(self.older.timestamp, self.older.id)
+        self.assertEqual(self._ids(keyset_paginate(self.queryset, after=past_end, per_page=2)), first)
+
+
+class BulkModerationValidationTests(SimpleTestCase):
+    """Перевірка тіла запиту масової модерації до будь-яких звернень до БД і Redis"""
+
+    def _post(self, body):
+        request = APIRequestFactory().post('/api/moderation/bulk/', body, format='json')
+        force_authenticate(request, user=SimpleNamespace(id=7, is_authenticated=True))
+        return api_bulk_moderation(request)
+
+    def test_actions_must_be_a_non_empty_list(self):
+        for body in ({}, {'actions': []}, {'actions': {'action': 'ban'}}):
+            self.assertEqual(self._post(body).status_code, 400)
+
+    @override_settings(BULK_MODERATION_MAX_ACTIONS=2)
+    def test_too_many_actions(self):
+        item = {'action': 'warn', 'user_id': 1, 'chat_id': -100}
+        response = self._post({'actions': [item] * 3})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {'error': 'At most 2 actions per request'})
+
+    def test_invalid_items_are_reported_per_item(self):
+        response = self._post({'actions': [
+            {'action': 'nuke', 'user_id': 1, 'chat_id': -100},
+            {'action': 'ban', 'chat_id': -100},
+            {'action': 'warn', 'user_id': 'abc', 'chat_id': -100},
+            'ban',
+        ]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['applied'], response.data['failed'], response.data['duplicates']),
+                         (0, 4, 0))
+        self.assertTrue(all(result['success'] is False for result in response.data['results']))
+        self.assertEqual(response.data['results'][0]['error'], 'Unknown action: nuke')
+
+
+BULK_CHAT_ID = -990005
+
+
+@override_settings(DASHBOARD_FEED_ENABLED=False)
+class BulkModerationTests(TransactionTestCase):
+    """Масова модерація: одна транзакція в БД, завдання в черзі, повтор — дублі"""
+
+    ACTIONS = [
+        {'action': 'ban', 'user_id': 1, 'chat_id': BULK_CHAT_ID, 'reason': 'raid'},
+        {'action': 'warn', 'user_id': 2, 'chat_id': BULK_CHAT_ID},
+        {'action': 'mute', 'user_id': 3, 'chat_id': BULK_CHAT_ID, 'duration': 5},
+        {'action': 'kick'},
+    ]
+
+    @classmethod
+    def setUpClass(cls):
+        if not _redis_available():
+            raise unittest.SkipTest(f"Redis is not reachable at {TEST_REDIS_URL}")
+        super().setUpClass()
+        with connection.cursor() as cursor:
+            for statement in BOT_SCHEMA:
+                cursor.execute(statement)
+
+    def setUp(self):
+        self.manager = DatabaseManager(redis_url=TEST_REDIS_URL)
+        prefix = f"test:{uuid.uuid4().hex}"
+        self.manager.queue_stream = f"{prefix}:stream"
+        self.manager.queue_group = f"{prefix}:group"
+        patcher = mock.patch('moderator.views.db_manager', self.manager)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(self.user)
+
+    def tearDown(self):
+        async def cleanup():
+            client = self.manager.get_redis()
+            keys = [key async for key in client.scan_iter(f"dedup:*:{BULK_CHAT_ID}:*")]
+            if keys:
+                await client.delete(*keys)
+            await client.zrem(SANCTIONS_EXPIRY_KEY, f"mute:{BULK_CHAT_ID}:3")
+            await self.manager.clear_queue()
+            await self.manager.close_all()
+        with connection.cursor() as cursor:
+            for table in ('punishments', 'bans', 'warnings', 'active_sanctions', 'punishment_daily_stats'):
+                cursor.execute(f"DELETE FROM {table} WHERE chat_id = %s", [BULK_CHAT_ID])
+        run_async(cleanup())
+
+    def _post(self):
+        response = self.client.post(reverse('api_bulk_moderation'), {'actions': self.ACTIONS},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def _punishments(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT user_id, punishment_type, moderator_id FROM punishments "
+                           "WHERE chat_id = %s ORDER BY user_id", [BULK_CHAT_ID])
+            return cursor.fetchall()
+
+    def test_actions_are_applied_and_queued(self):
+        data = self._post()
+        self.assertEqual((data['applied'], data['failed'], data['duplicates']), (3, 1, 0))
+        self.assertEqual(self._punishments(),
+                         [(1, 'ban', self.user.id), (2, 'warn', self.user.id), (3, 'mute', self.user.id)])
+        self.assertEqual(run_async(self.manager.get_queue_length()), 3)
+        self.assertFalse(data['results'][3]['success'])
+
+    def test_repeated_request_is_deduplicated(self):
+        self._post()
+        data = self._post()
+        self.assertEqual((data['applied'], data['failed'], data['duplicates']), (0, 1, 3))
+        self.assertEqual(len(self._punishments()), 3)
+        self.assertEqual(run_async(self.manager.get_queue_length()), 3)
+
+
+IMPORT_CHAT_ID = -990001
+
+
+@override_settings(REDIS_HOST='127.0.0.1', REDIS_PORT=1, REDIS_PASSWORD=None, REDIS_SSL=False)
+class PunishmentImportTests(TransactionTestCase):
+    """Імпорт історії: час без зони не зсувається, повторний імпорт того самого файлу нічого не змінює"""
+
+    # Формат як у експорту: наївний час з punishments.timestamp; один рядок — з явною зоною
+    LINES = [
+        json.dumps(row) + '\n' for row in (
+            {'user_id': 501, 'chat_id': IMPORT_CHAT_ID, 'punishment_type': 'warn', 'reason': 'flood',
+             'timestamp': '2025-01-02 03:04:05', 'moderator_id': 1},
+            {'user_id': 501, 'chat_id': IMPORT_CHAT_ID, 'punishment_type': 'warn', 'reason': 'flood',
+             'timestamp': '2025-01-03 03:04:05', 'moderator_id': 1},
+            {'user_id': 502, 'chat_id': IMPORT_CHAT_ID, 'punishment_type': 'ban', 'reason': 'spam',
+             'timestamp': '2025-01-04T12:00:00+02:00', 'moderator_id': 2},
+            # Дубль першого рядка в тому самому файлі
+            {'user_id': 501, 'chat_id': IMPORT_CHAT_ID, 'punishment_type': 'warn', 'reason': 'flood',
+             'timestamp': '2025-01-02 03:04:05', 'moderator_id': 1},
+        )
+    ]
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        with connection.cursor() as cursor:
+            for statement in BOT_SCHEMA:
+                cursor.execute(statement)
+
+    def setUp(self):
+        run_async(db_manager.close_all())
+
+    def tearDown(self):
+        with connection.cursor() as cursor:
+            for table in ('punishments', 'bans', 'warnings'):
+                cursor.execute(f"DELETE FROM {table} WHERE chat_id = %s", [IMPORT_CHAT_ID])
+        run_async(db_manager.close_all())
+
+    def _rows(self):
+        with connection.cursor() as cursor:
+            cursor.execute("""SELECT user_id, punishment_type, timestamp::text FROM punishments
+                              WHERE chat_id = %s ORDER BY timestamp""", [IMPORT_CHAT_ID])
+            return cursor.fetchall()
+
+    def _warn_count(self, user_id):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT warn_count FROM warnings WHERE chat_id = %s AND user_id = %s",
+                           [IMPORT_CHAT_ID, user_id])
+            return cursor.fetchone()[0]
+
+    def test_reimport_is_a_no_op(self):
+        first = import_punishments(self.LINES, 'ndjson')
+        self.assertEqual((first['imported'], first['duplicates'], first['rejected']), (3, 1, 0))
+        expected = [
+            (501, 'warn', '2025-01-02 03:04:05'),
+            (501, 'warn', '2025-01-03 03:04:05'),
+            # +02:00 переводиться в UTC
+            (502, 'ban', '2025-01-04 10:00:00'),
+        ]
+        self.assertEqual(self._rows(), expected)
+        self.assertEqual(self._warn_count(501), 2)
+
+        second = import_punishments(self.LINES, 'ndjson')
+        self.assertEqual((second['imported'], second['duplicates'], second['new_bans']), (0, 4, 0))
+        self.assertEqual(self._rows(), expected)
+        self.assertEqual(self._warn_count(501), 2)
+
+    def test_dry_run_writes_nothing(self):
+        result = import_punishments(self.LINES, 'ndjson', dry_run=True)
+        self.assertEqual(result['imported'], 3)
+        self.assertEqual(self._rows(), [])
+
+    def test_invalid_rows_are_rejected(self):
+        lines = [
+            'not json\n',
+            json.dumps({'user_id': 1, 'chat_id': IMPORT_CHAT_ID, 'punishment_type': 'nuke',
+                        'timestamp': '2025-01-01 00:00:00'}) + '\n',
+            json.dumps({'user_id': 1, 'chat_id': IMPORT_CHAT_ID, 'punishment_type': 'ban',
+                        'timestamp': '2999-01-01 00:00:00'}) + '\n',
+        ]
+        result = import_punishments(lines, 'ndjson')
+        self.assertEqual((result['parse_errors'], result['rejected'], result['imported']), (1, 2, 0))
+        self.assertEqual(self._rows(), [])
@@ -26,7 +26,18 @@ urlpatterns = [
     # API endpoints
     path('api/', include(router.urls)),
     path('api/ban/', views.api_ban_user, name='api_ban_user'),
+    path('api/moderation/bulk/', views.api_bulk_moderation, name='api_bulk_moderation'),
     path('api/user/<int:user_id>/', views.api_user_info, name='api_user_info'),
+    path('api/moderators/<int:moderator_id>/punishments/', views.api_moderator_punishments,
+         name='api_moderator_punishments'),
+    path('api/export/<str:export_format>/', views.export_punishments, name='export_punishments'),
+    path('api/import/', views.api_import_punishments, name='api_import_punishments'),
+    path('api/punishments/search/', views.api_search_punishments, name='api_search_punishments'),
+    path('api/users/autocomplete/', views.api_user_autocomplete, name='api_user_autocomplete'),
+    path('api/cache/stats/', views.api_cache_stats, name='api_cache_stats'),
+    path('api/analytics/unique-offenders/', views.api_unique_offenders, name='api_unique_offenders'),
+    path('api/status/', views.api_status_bulk, name='api_status_bulk'),
+    path('api/chats/<int:chat_id>/sanctions/', views.api_active_sanctions, name='api_active_sanctions'),
     path('chat/<str:chat_id>/settings/', views.edit_chat_settings, name='edit_chat_settings'),
     path('settings/bulk_filter/<str:action>/', views.bulk_filter_toggle, name='bulk_filter_toggle'),
 ]
\ No newline at end of file
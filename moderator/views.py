@@ -1,19 +1,75 @@
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import HttpResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.conf import settings
 from django.core.paginator import Paginator
 
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
+from asgiref.sync import sync_to_async
 
 import asyncio
-from datetime import datetime, timedelta
+import csv
+import json
+import os
+from datetime import date, datetime, timedelta
+from urllib.parse import urlencode
 
 from .models import *
 from .database import db_manager, ModerationTask
+from .async_runtime import run_async, call_async, stream_async
+from .decorators import async_api_view, async_login_required
+from .pagination import keyset_paginate, approximate_count
+from .search import search_users, autocomplete_users
+from .importer import import_punishments, text_lines
+from .cache import (get_moderator_map, get_moderator_ids, get_chat_titles,
+                    invalidate_chats, invalidation_bus, lookup_cache)
+
+
+PROFILE_PAGE_SIZE = 50
+
+# render для async view: контекст-процесори і шаблони звертаються до request.user і ORM синхронно
+async_render = sync_to_async(render)
+
+
+def _current_moderator(user):
+    """Модератор, що відповідає обліковому запису Django (за username або Telegram ID)"""
+    moderator = Moderator.objects.filter(username=user.username).first()
+    if moderator is None and user.username.isdigit():
+        moderator = Moderator.objects.filter(user_id=int(user.username)).first()
+    return moderator
+
+
+def _moderator_summary(moderator_id: int) -> dict:
+    """Підсумки модератора по типах (усього, за 7 і 30 днів) одним запитом до добових підсумків"""
+    today = timezone.now().date()
+    rows = (PunishmentDailyStat.objects
+            .filter(moderator_id=moderator_id)
+            .values('punishment_type')
+            .annotate(
+                total=models.Sum('count'),
+                last_7=models.Sum('count', filter=models.Q(date__gt=today - timedelta(days=7))),
+                last_30=models.Sum('count', filter=models.Q(date__gt=today - timedelta(days=30))),
+            )
+            .order_by('punishment_type'))
+    by_type = [
+        {
+            'punishment_type': row['punishment_type'],
+            'total': row['total'] or 0,
+            'last_7': row['last_7'] or 0,
+            'last_30': row['last_30'] or 0,
+        }
+        for row in rows
+    ]
+    return {
+        'by_type': by_type,
+        'total': sum(row['total'] for row in by_type),
+        'last_7': sum(row['last_7'] for row in by_type),
+        'last_30': sum(row['last_30'] for row in by_type),
+    }
 
 
 @login_required
@@ -26,61 +82,144 @@ def profile(request, moderator_id=None):
         if not moderator:
             messages.error(request, f"Модератор з ID {moderator_id} не знайдений")
             return redirect('dashboard')
-
-        punishments = Punishment.objects.filter(moderator_id=moderator_id).order_by('-timestamp')
     else:
-        # Стара логіка для поточного модератора
-        username = request.user.username
-
-        moderator = Moderator.objects.filter(username=username).first()
-        punishments = None
-
-        if moderator:
-            punishments = Punishment.objects.filter(moderator_id=moderator.user_id).order_by('-timestamp')
-        else:
-            try:
-                telegram_id = int(username)
-                moderator = Moderator.objects.filter(user_id=telegram_id).first()
-                if moderator:
-                    punishments = Punishment.objects.filter(moderator_id=telegram_id).order_by('-timestamp')
-            except ValueError:
-                moderator = None
-                punishments = Punishment.objects.none()
+        moderator = _current_moderator(request.user)
+
+    punishments = None
+    summary = None
+    if moderator:
+        # Перша сторінка рендериться на сервері, далі — api_moderator_punishments
+        punishments = keyset_paginate(
+            Punishment.objects.filter(moderator_id=moderator.user_id),
+            after=request.GET.get('after'),
+            per_page=PROFILE_PAGE_SIZE,
+        )
+        summary = _moderator_summary(moderator.user_id)
 
     # Мапа chat_id -> chat_title
-    chat_titles = {str(cs.chat_id): cs.chat_title for cs in ChatSetting.objects.all()}
+    chat_titles = get_chat_titles()
 
     context = {
         'moderator': moderator,
         'punishments': punishments,
+        'summary': summary,
         'chat_titles': chat_titles,
         'viewing_as_admin': moderator_id is not None and request.user.is_superuser,
     }
     return render(request, 'moderator/profile.html', context)
 
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def api_moderator_punishments(request, moderator_id):
+    """API: наступна сторінка покарань модератора (нескінченна прокрутка профілю)"""
+    if not request.user.is_superuser:
+        current = _current_moderator(request.user)
+        if current is None or current.user_id != moderator_id:
+            return Response({'error': 'Forbidden'}, status=status.HTTP_403_FORBIDDEN)
+
+    try:
+        per_page = min(int(request.query_params.get('per_page', PROFILE_PAGE_SIZE)), 200)
+    except ValueError:
+        return Response({'error': 'per_page must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+    page = keyset_paginate(
+        Punishment.objects.filter(moderator_id=moderator_id),
+        after=request.query_params.get('after'),
+        per_page=per_page,
+    )
+    chat_titles = get_chat_titles()
+    return Response({
+        'results': [
+            {
+                'id': p.id,
+                'user_id': p.user_id,
+                'chat_id': p.chat_id,
+                'chat_title': chat_titles.get(str(p.chat_id)),
+                'punishment_type': p.punishment_type,
+                'reason': p.reason,
+                'duration_minutes': p.duration_minutes,
+                'timestamp': p.timestamp,
+            }
+            for p in page
+        ],
+        'next_cursor': page.next_cursor,
+    })
+
+PUNISHMENT_FILTER_PARAMS = ('q', 'chat_id', 'type', 'moderator_id', 'date_from', 'date_to')
+
+
+def _punishment_filters(params) -> dict:
+    """Фільтри пошуку покарань з GET-параметрів (ValueError для некоректних значень)"""
+    punishment_type = params.get('type') or None
+    if punishment_type and punishment_type not in dict(Punishment.PUNISHMENT_TYPES):
+        raise ValueError(f'Unknown punishment type: {punishment_type}')
+    return {
+        'query': params.get('q', '').strip() or None,
+        'chat_id': int(params['chat_id']) if params.get('chat_id') else None,
+        'punishment_type': punishment_type,
+        'moderator_id': int(params['moderator_id']) if params.get('moderator_id') else None,
+        'date_from': date.fromisoformat(params['date_from']) if params.get('date_from') else None,
+        'date_to': date.fromisoformat(params['date_to']) if params.get('date_to') else None,
+    }
+
+
 @login_required
 def dashboard(request):
     """Главная панель"""
-    recent_punishments_all = Punishment.objects.order_by('-timestamp')
-    paginator = Paginator(recent_punishments_all, 20)
-    page = request.GET.get('page')
-    recent_punishments = paginator.get_page(page)
+    filter_values = {key: request.GET.get(key, '') for key in PUNISHMENT_FILTER_PARAMS}
+    filter_query = urlencode({key: value for key, value in filter_values.items() if value})
+
+    if filter_query:
+        # Пошук/фільтрація: ранжовані результати з FTS-індексу, сторінки по номеру
+        try:
+            filters = _punishment_filters(request.GET)
+            page = max(1, int(request.GET.get('page', 1)))
+            found = run_async(db_manager.search_punishments(**filters, page=page, per_page=20))
+        except ValueError as e:
+            messages.error(request, f'Некоректний фільтр: {e}')
+            found = {'results': [], 'page': 1, 'has_next': False, 'has_previous': False}
+        recent_punishments = found['results']
+        next_url = f"?{filter_query}&page={found['page'] + 1}" if found['has_next'] else None
+        prev_url = f"?{filter_query}&page={found['page'] - 1}" if found['has_previous'] else None
+        first_url = f"?{filter_query}" if found['has_previous'] else None
+    else:
+        recent_punishments = keyset_paginate(
+            Punishment.objects.all(),
+            after=request.GET.get('after'),
+            before=request.GET.get('before'),
+            per_page=20,
+        )
+        next_url = f"?after={recent_punishments.next_cursor}" if recent_punishments.has_next else None
+        prev_url = f"?before={recent_punishments.prev_cursor}" if recent_punishments.has_previous else None
+        first_url = "?" if recent_punishments.has_previous else None
 
     # Отримати всі user_id, які є у покараннях на поточній сторінці
-    user_ids = [p.user_id for p in recent_punishments]
+    user_ids = [p['user_id'] if isinstance(p, dict) else p.user_id for p in recent_punishments]
     # Створити словник user_id -> TelegramUser об'єкт
     user_map = {u.user_id: u for u in TelegramUser.objects.filter(user_id__in=user_ids)}
 
-    moderator_map = {
-        m.user_id: (m.username if m.username else str(m.user_id))
-        for m in Moderator.objects.all()
-    }
+    moderator_map = get_moderator_map()
+
+    # Лічильники з Redis (один MGET) замість трьох COUNT(*) у Postgres
+    try:
+        counters = run_async(db_manager.get_dashboard_counters())
+    except Exception:
+        counters = {
+            'total_bans': Ban.objects.count(),
+            'total_moderators': Moderator.objects.count(),
+            'total_chats': ChatSetting.objects.count(),
+        }
 
     context = {
-        'total_bans': Ban.objects.count(),
-        'total_moderators': Moderator.objects.count(),
-        'total_chats': ChatSetting.objects.count(),
+        **counters,
         'recent_punishments': recent_punishments,
+        'next_url': next_url,
+        'prev_url': prev_url,
+        'first_url': first_url,
+        'filters': filter_values,
+        'punishment_types': Punishment.PUNISHMENT_TYPES,
+        'total_punishments': approximate_count('punishments'),
         'moderator_map': moderator_map,
         'user_map': user_map,
     }
@@ -90,23 +229,17 @@ def dashboard(request):
 def users_list(request):
     """Список пользователей с поиском"""
     search_query = request.GET.get('search', '')
-    users = TelegramUser.objects.all()
+    users = TelegramUser.objects.order_by('user_id')
 
     if search_query:
-        users = users.filter(
-            username__icontains=search_query
-        ) | users.filter(
-            first_name__icontains=search_query
-        ) | users.filter(
-            user_id=search_query if search_query.isdigit() else 0
-        )
+        users = search_users(search_query)
 
     paginator = Paginator(users, 20)
     page = request.GET.get('page')
     users = paginator.get_page(page)
 
     # Ось це потрібно!
-    moderators_list = list(Moderator.objects.values_list('user_id', flat=True))
+    moderators_list = get_moderator_ids()
 
     context = {
         'users': users,
@@ -132,18 +265,16 @@ def user_detail(request, user_id):
     }
     return render(request, 'moderator/user_detail.html', context)
 
-@login_required
-def moderation_actions(request):
+@async_login_required
+async def moderation_actions(request):
     """Страница модераторских действий: наказания и их отмена"""
 
-    chats = ChatSetting.objects.all()  # Для выпадающего списка чатов
-
     # Дістаємо Telegram ID модератора
     try:
         telegram_id = int(request.user.username)
-        moderator = Moderator.objects.filter(user_id=telegram_id).first()
+        moderator = await Moderator.objects.filter(user_id=telegram_id).afirst()
     except Exception:
-        moderator = Moderator.objects.filter(username=request.user.username).first()
+        moderator = await Moderator.objects.filter(username=request.user.username).afirst()
         telegram_id = moderator.user_id if moderator else None
 
     if request.method == 'POST':
@@ -155,53 +286,49 @@ def moderation_actions(request):
             reason = request.POST.get('reason', 'No reason provided')
             duration = request.POST.get('duration')
 
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
+            # Формируем ModerationTask для воркера
+            task = ModerationTask(
+                task_type=action,
+                user_id=user_id,
+                username=None,
+                reason=reason,
+                chat_id=chat_id,
+                moderator_id=telegram_id,
+                duration_minutes=int(duration) if action == 'mute' and duration else None
+            )
+            # Повторна відправка форми не пише в БД і не доходить до бота
+            if not (await call_async(db_manager.claim_tasks([task])))[0]:
+                messages.warning(request, f'Action {action} for user {user_id} is already being processed')
+                return redirect('moderation_actions')
 
             try:
                 if action == 'ban':
-                    loop.run_until_complete(db_manager.add_ban(user_id, chat_id, reason))
-                    loop.run_until_complete(db_manager.add_punishment(
-                        user_id, chat_id, 'ban', reason, telegram_id
-                    ))
+                    await call_async(db_manager.apply_ban(user_id, chat_id, reason, telegram_id))
                     messages.success(request, f'User {user_id} banned successfully')
 
                 elif action == 'warn':
-                    warn_count = loop.run_until_complete(db_manager.add_warning(user_id, chat_id))
-                    loop.run_until_complete(db_manager.add_punishment(
-                        user_id, chat_id, 'warn', reason, telegram_id
-                    ))
+                    result = await call_async(db_manager.apply_warn(user_id, chat_id, reason, telegram_id))
+                    warn_count = result['warn_count']
                     messages.success(request, f'Warning added. Total warnings: {warn_count}')
 
                 elif action == 'mute':
                     duration_minutes = int(duration) if duration else 60
-                    loop.run_until_complete(db_manager.add_punishment(
-                        user_id, chat_id, 'mute', reason, telegram_id, duration_minutes
+                    await call_async(db_manager.apply_mute(
+                        user_id, chat_id, reason, telegram_id, duration_minutes
                     ))
                     messages.success(request, f'User {user_id} muted for {duration_minutes} minutes')
 
                 elif action == 'kick':
-                    loop.run_until_complete(db_manager.add_punishment(
+                    await call_async(db_manager.add_punishment(
                         user_id, chat_id, 'kick', reason, telegram_id
                     ))
                     messages.success(request, f'User {user_id} kicked')
 
-                # Формируем ModerationTask для воркера
-                task = ModerationTask(
-                    task_type=action,
-                    user_id=user_id,
-                    username=None,
-                    reason=reason,
-                    chat_id=chat_id,
-                    moderator_id=telegram_id,
-                    duration_minutes=int(duration) if action == 'mute' and duration else None
-                )
-                db_manager.add_to_queue(task)
+                await call_async(db_manager.add_to_queue(task, dedup=False))
 
             except Exception as e:
+                await call_async(db_manager.release_tasks([task]))
                 messages.error(request, f'Error: {str(e)}')
-            finally:
-                loop.close()
 
             return redirect('moderation_actions')
 
@@ -211,147 +338,433 @@ def moderation_actions(request):
             user_id = int(request.POST.get('user_id'))
             chat_id = int(request.POST.get('chat_id'))
 
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
+            # Формируем ModerationTask для отмены наказания
+            task = ModerationTask(
+                task_type=action,
+                user_id=user_id,
+                username=None,
+                reason=None,
+                chat_id=chat_id,
+                moderator_id=request.user.id,
+                duration_minutes=None
+            )
+            if not (await call_async(db_manager.claim_tasks([task])))[0]:
+                messages.warning(request, f'Action {action} for user {user_id} is already being processed')
+                return redirect('moderation_actions')
 
             try:
-                # Формируем ModerationTask для отмены наказания
-                task = ModerationTask(
-                    task_type=action,
-                    user_id=user_id,
-                    username=None,
-                    reason=None,
-                    chat_id=chat_id,
-                    moderator_id=request.user.id,
-                    duration_minutes=None
-                )
-                db_manager.add_to_queue(task)
+                await call_async(db_manager.add_to_queue(task, dedup=False))
 
                 # Для unwarn — удаляем предупреждение в БД
                 if action == 'unwarn':
-                    loop.run_until_complete(db_manager.remove_warning(user_id, chat_id))
+                    await call_async(db_manager.remove_warning(user_id, chat_id))
                     messages.success(request, f'Warning removed from user {user_id}')
                 elif action == 'unban':
-                    loop.run_until_complete(db_manager.remove_ban(user_id, chat_id))
+                    await call_async(db_manager.remove_ban(user_id, chat_id))
                     messages.success(request, f'Ban removed from user {user_id}')
                 elif action == 'unmute':
-                    loop.run_until_complete(db_manager.remove_mute(user_id, chat_id))
+                    await call_async(db_manager.lift_mute(user_id, chat_id))
                     messages.success(request, f'Mute removed from user {user_id}')
                 else:
                     messages.success(request, f'Action {action} queued for user {user_id}')
 
             except Exception as e:
+                await call_async(db_manager.release_tasks([task]))
                 messages.error(request, f'Error: {str(e)}')
-            finally:
-                loop.close()
 
             return redirect('moderation_actions')
 
-    return render(request, 'moderator/moderation_actions.html', {'chats': chats})
+    chats = [chat async for chat in ChatSetting.objects.all()]  # Для выпадающего списка чатов
+    return await async_render(request, 'moderator/moderation_actions.html', {'chats': chats})
 
-@api_view(['POST'])
-@permission_classes([IsAuthenticated])
-def api_ban_user(request):
+@async_api_view(['POST'])
+async def api_ban_user(request):
     """API для бана пользователя"""
     user_id = request.data.get('user_id')
     chat_id = request.data.get('chat_id')
     reason = request.data.get('reason', 'No reason provided')
 
     if not user_id or not chat_id:
-        return Response({'error': 'user_id and chat_id are required'},
-                        status=status.HTTP_400_BAD_REQUEST)
+        return JsonResponse({'error': 'user_id and chat_id are required'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        task = ModerationTask(task_type='ban', user_id=int(user_id), username=None, reason=reason,
+                              chat_id=int(chat_id), moderator_id=request.user.id)
+    except (TypeError, ValueError) as e:
+        return JsonResponse({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
+    if not (await call_async(db_manager.claim_tasks([task])))[0]:
+        return {'success': True, 'duplicate': True, 'message': 'Ban is already being processed'}
 
     try:
-        loop.run_until_complete(db_manager.add_ban(int(user_id), int(chat_id), reason))
-        loop.run_until_complete(db_manager.add_punishment(
-            int(user_id), int(chat_id), 'ban', reason, request.user.id
-        ))
-        return Response({'success': True, 'message': 'User banned successfully'})
+        await call_async(db_manager.apply_ban(task.user_id, task.chat_id, reason, request.user.id))
+        # Ключ дедуплікації вже зайнятий цим баном — завдання для бота ставимо тут же
+        await call_async(db_manager.add_to_queue(task, dedup=False))
+        return {'success': True, 'message': 'User banned successfully'}
     except Exception as e:
-        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-    finally:
-        loop.close()
+        await call_async(db_manager.release_tasks([task]))
+        return JsonResponse({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-@api_view(['GET'])
+BULK_ACTIONS = ('ban', 'warn', 'mute', 'kick')
+
+
+@api_view(['POST'])
 @permission_classes([IsAuthenticated])
-def api_user_info(request, user_id):
-    """API для получения информации о пользователе"""
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
+def api_bulk_moderation(request):
+    """API для масової модерації (очищення після рейду).
+
+    Приймає {"actions": [{"action", "user_id", "chat_id", "reason", "duration"}, ...]},
+    пише все в одній транзакції і ставить завдання в чергу одним pipeline.
+    Дії, що повторюють вже прийняту у вікні дедуплікації, позначаються duplicate і пропускаються.
+    """
+    items = request.data.get('actions')
+    if not isinstance(items, list) or not items:
+        return Response({'error': 'actions must be a non-empty list'},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    max_actions = getattr(settings, 'BULK_MODERATION_MAX_ACTIONS', 1000)
+    if len(items) > max_actions:
+        return Response({'error': f'At most {max_actions} actions per request'},
+                        status=status.HTTP_400_BAD_REQUEST)
 
+    results = [None] * len(items)
+    tasks = []
+    positions = []
+    for index, item in enumerate(items):
+        try:
+            action = item.get('action')
+            if action not in BULK_ACTIONS:
+                raise ValueError(f'Unknown action: {action}')
+            duration = item.get('duration')
+            task = ModerationTask(
+                task_type=action,
+                user_id=int(item['user_id']),
+                username=None,
+                reason=item.get('reason') or 'No reason provided',
+                chat_id=int(item['chat_id']),
+                moderator_id=request.user.id,
+                duration_minutes=(int(duration) if duration else 60) if action == 'mute' else None
+            )
+        except (AttributeError, KeyError, TypeError, ValueError) as e:
+            results[index] = {'success': False, 'error': str(e)}
+            continue
+        tasks.append(task)
+        positions.append(index)
+
+    duplicates = 0
+    if tasks:
+        # Дублі відсікаються до запису в БД, тож не створюють ні рядків, ні завдань для бота
+        claimed = run_async(db_manager.claim_tasks(tasks))
+        for index, task, ok in zip(positions, tasks, claimed):
+            if not ok:
+                results[index] = {'action': task.task_type, 'user_id': task.user_id,
+                                  'chat_id': task.chat_id, 'success': False, 'duplicate': True}
+                duplicates += 1
+        positions = [index for index, ok in zip(positions, claimed) if ok]
+        tasks = [task for task, ok in zip(tasks, claimed) if ok]
+
+    if tasks:
+        try:
+            applied = run_async(db_manager.apply_bulk(tasks))
+        except Exception as e:
+            run_async(db_manager.release_tasks(tasks))
+            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        for index, task, result in zip(positions, tasks, applied):
+            results[index] = {'action': task.task_type, 'user_id': task.user_id,
+                              'chat_id': task.chat_id, **result}
+
+        try:
+            run_async(db_manager.add_to_queue_bulk(tasks, dedup=False))
+        except Exception as e:
+            # Записи в БД вже є — повідомляємо, що до бота вони не дійшли
+            for index in positions:
+                results[index]['queued'] = False
+            return Response({'results': results, 'error': f'Queue error: {e}'},
+                            status=status.HTTP_207_MULTI_STATUS)
+
+    return Response({
+        'applied': len(tasks),
+        'failed': len(items) - len(tasks) - duplicates,
+        'duplicates': duplicates,
+        'results': results,
+    })
+
+@async_api_view(['GET'])
+async def api_user_info(request, user_id):
+    """API для получения информации о пользователе"""
     try:
-        punishments = loop.run_until_complete(db_manager.get_user_punishments(int(user_id)))
-        is_moderator = loop.run_until_complete(db_manager.is_moderator(int(user_id)))
+        # Обидва запити йдуть паралельно на різних з'єднаннях пулу
+        punishments, is_moderator = await asyncio.gather(
+            call_async(db_manager.get_user_punishments(int(user_id))),
+            call_async(db_manager.is_moderator(int(user_id))),
+        )
 
-        return Response({
+        return {
             'user_id': user_id,
             'is_moderator': is_moderator,
             'punishments': punishments
-        })
+        }
     except Exception as e:
-        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-    finally:
-        loop.close()
+        return JsonResponse({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-@login_required
-def analytics(request):
+@async_login_required
+async def analytics(request):
     """Страница аналитики"""
     days = int(request.GET.get('days', 30))
     chat_id = request.GET.get('chat_id')
 
-    # Статистика по типам наказаний
-    punishments_data = Punishment.objects.filter(
-        timestamp__gte=timezone.now() - timedelta(days=days)
+    # Статистика по типам наказаний — з добових підсумків, а не з усіх рядків punishments
+    stats_data = PunishmentDailyStat.objects.filter(
+        date__gte=timezone.now().date() - timedelta(days=days)
     )
 
     if chat_id:
-        punishments_data = punishments_data.filter(chat_id=int(chat_id))
+        stats_data = stats_data.filter(chat_id=int(chat_id))
 
-    punishment_stats = {}
-    for punishment in punishments_data:
-        punishment_stats[punishment.punishment_type] = punishment_stats.get(punishment.punishment_type, 0) + 1
+    punishment_stats = {
+        row['punishment_type']: row['count']
+        async for row in stats_data.values('punishment_type').annotate(count=models.Sum('count'))
+        if row['count']
+    }
 
     # Топ модераторов
-    top_moderators = (punishments_data
-                      .values('moderator_id')
-                      .annotate(count=models.Count('id'))
-                      .order_by('-count')[:10])
+    top_moderators = [row async for row in (stats_data
+                                            .values('moderator_id')
+                                            .annotate(count=models.Sum('count'))
+                                            .order_by('-count')[:10])]
+
+    # Унікальні порушники — HyperLogLog у Redis, без COUNT(DISTINCT) по punishments
+    try:
+        unique_offenders = await call_async(db_manager.count_unique_offenders(
+            [int(chat_id)] if chat_id else None, days
+        ))
+    except Exception:
+        unique_offenders = None
 
     context = {
         'punishment_stats': punishment_stats,
         'top_moderators': top_moderators,
+        'unique_offenders': unique_offenders,
         'days': days,
         'selected_chat_id': chat_id
     }
 
-    return render(request, 'moderator/analytics.html', context)
+    return await async_render(request, 'moderator/analytics.html', context)
 
-@login_required
-def settings_view(request):
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def api_active_sanctions(request, chat_id):
+    """API: хто зараз під санкціями в чаті (з active_sanctions, без сканування punishments)"""
+    sanctions = (ActiveSanction.objects
+                 .filter(chat_id=chat_id)
+                 .filter(models.Q(expires_at__isnull=True) | models.Q(expires_at__gt=timezone.now()))
+                 .order_by('expires_at'))
+    sanction_type = request.query_params.get('type')
+    if sanction_type:
+        sanctions = sanctions.filter(sanction_type=sanction_type)
+    return Response({
+        'chat_id': chat_id,
+        'results': [
+            {
+                'user_id': sanction.user_id,
+                'sanction_type': sanction.sanction_type,
+                'expires_at': sanction.expires_at,
+                'moderator_id': sanction.moderator_id,
+                'since': sanction.created_at,
+            }
+            for sanction in sanctions
+        ],
+    })
+
+@api_view(['GET', 'POST'])
+@permission_classes([IsAuthenticated])
+def api_status_bulk(request):
+    """API: статус багатьох користувачів чату одним викликом (модератор, варни, бан, мут, фільтр).
+
+    GET ?chat_id=...&user_ids=1,2,3 або POST {"chat_id": ..., "user_ids": [...]}
+    """
+    params = request.data if request.method == 'POST' else request.query_params
+    try:
+        chat_id = int(params.get('chat_id'))
+        user_ids = params.get('user_ids') or []
+        if isinstance(user_ids, str):
+            user_ids = [x for x in user_ids.split(',') if x.strip()]
+        user_ids = [int(x) for x in user_ids]
+    except (TypeError, ValueError):
+        return Response({'error': 'chat_id and user_ids must be integers'},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    max_users = getattr(settings, 'STATUS_BULK_MAX_USERS', 500)
+    if len(user_ids) > max_users:
+        return Response({'error': f'At most {max_users} user_ids per request'},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        result = run_async(db_manager.get_status_bulk(chat_id, user_ids))
+    except Exception as e:
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    return Response(result)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def api_unique_offenders(request):
+    """API: кількість унікальних покараних користувачів (HyperLogLog)"""
+    try:
+        days = int(request.query_params.get('days', 7))
+        chat_ids = [int(x) for x in request.query_params.get('chat_id', '').split(',') if x.strip()]
+    except ValueError:
+        return Response({'error': 'days and chat_id must be integers'},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        count = run_async(db_manager.count_unique_offenders(chat_ids or None, days))
+    except Exception as e:
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    return Response({
+        'unique_offenders': count,
+        'days': days,
+        'chat_ids': chat_ids,
+        'standard_error': db_manager.HLL_STANDARD_ERROR,
+    })
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def api_search_punishments(request):
+    """API: повнотекстовий пошук по причинах покарань з фільтрами і пагінацією"""
+    try:
+        filters = _punishment_filters(request.query_params)
+        page = max(1, int(request.query_params.get('page', 1)))
+        per_page = min(int(request.query_params.get('per_page', 50)), 200)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        found = run_async(db_manager.search_punishments(**filters, page=page, per_page=per_page))
+    except Exception as e:
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    return Response(found)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def api_user_autocomplete(request):
+    """API: підказки користувачів за префіксом імені/username"""
+    query = request.query_params.get('q', '')
+    try:
+        limit = min(int(request.query_params.get('limit', 10)), 50)
+    except ValueError:
+        return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+    result = autocomplete_users(query, limit=limit,
+                                budget_ms=getattr(settings, 'AUTOCOMPLETE_BUDGET_MS', 100))
+    return Response({'query': query, **result})
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def api_cache_stats(request):
+    """API: статистика in-process кешу (hits/misses по ключах) і шини інвалідації для поточного процесу"""
+    return Response({'pid': os.getpid(), 'caches': lookup_cache.stats(),
+                     'invalidation_bus': invalidation_bus.stats()})
+
+EXPORT_COLUMNS = ('id', 'timestamp', 'chat_id', 'chat_title', 'user_id', 'punishment_type',
+                  'reason', 'duration_minutes', 'moderator_id', 'moderator_username')
+
+
+class _Echo:
+    """Псевдо-буфер для csv.writer: write() просто повертає рядок"""
+
+    def write(self, value):
+        return value
+
+
+async def _export_csv(batches):
+    writer = csv.writer(_Echo())
+    # BOM, щоб Excel правильно відкривав кирилицю
+    yield '\ufeff' + writer.writerow(EXPORT_COLUMNS)
+    async for rows in batches:
+        yield ''.join(writer.writerow([row[column] for column in EXPORT_COLUMNS]) for row in rows)
+
+
+async def _export_ndjson(batches):
+    async for rows in batches:
+        yield ''.join(json.dumps(dict(row), default=str, ensure_ascii=False) + '\n' for row in rows)
+
+
+@async_login_required
+async def export_punishments(request, export_format):
+    """Потоковий експорт історії покарань (CSV або NDJSON) зі сталою пам'яттю"""
+    if export_format not in ('csv', 'ndjson', 'json'):
+        return HttpResponse('Unsupported format', status=400)
+
+    try:
+        filters = _punishment_filters(request.GET)
+        days = request.GET.get('days')
+        if days and not filters['date_from']:
+            filters['date_from'] = timezone.now().date() - timedelta(days=int(days))
+    except ValueError as e:
+        return HttpResponse(f'Invalid filter: {e}', status=400)
+    filters.pop('query')
+
+    batches = db_manager.export_punishments(**filters)
+    stamp = timezone.now().strftime('%Y%m%d-%H%M%S')
+    if export_format == 'csv':
+        response = StreamingHttpResponse(stream_async(_export_csv(batches)),
+                                         content_type='text/csv; charset=utf-8')
+        filename = f'punishments-{stamp}.csv'
+    else:
+        response = StreamingHttpResponse(stream_async(_export_ndjson(batches)),
+                                         content_type='application/x-ndjson')
+        filename = f'punishments-{stamp}.ndjson'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    # Не буферизувати відповідь на проксі (nginx), щоб байти йшли одразу
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def api_import_punishments(request):
+    """API: імпорт історичних покарань з CSV/NDJSON (формат як у експорту) через COPY.
+
+    multipart: file=<файл>, format=csv|ndjson (за замовчуванням — з розширення),
+    dry_run=1 — перевірити і порахувати без запису.
+    """
+    if not request.user.is_superuser:
+        return Response({'error': 'Only superusers can import punishments'}, status=status.HTTP_403_FORBIDDEN)
+
+    upload = request.FILES.get('file')
+    if upload is None:
+        return Response({'error': 'file is required'}, status=status.HTTP_400_BAD_REQUEST)
+    file_format = request.data.get('format') or ('csv' if upload.name.lower().endswith('.csv') else 'ndjson')
+    if file_format not in ('csv', 'ndjson'):
+        return Response({'error': 'Unsupported format'}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        result = import_punishments(text_lines(upload.file), file_format,
+                                    dry_run=request.data.get('dry_run') in ('1', 'true', 'on'))
+    except Exception as e:
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    return Response(result)
+
+@async_login_required
+async def settings_view(request):
     """Настройки чатов"""
     if request.method == 'POST':
         chat_id = int(request.POST.get('chat_id'))
         filter_enabled = request.POST.get('filter_enabled') == 'on'
 
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-
         try:
-            loop.run_until_complete(db_manager.set_filter_status(chat_id, filter_enabled))
+            await call_async(db_manager.set_filter_status(chat_id, filter_enabled))
             messages.success(request, f'Settings updated for chat {chat_id}')
         except Exception as e:
             messages.error(request, f'Error: {str(e)}')
-        finally:
-            loop.close()
 
         return redirect('settings')
 
-    chat_settings = ChatSetting.objects.all()
+    chat_settings = [chat async for chat in ChatSetting.objects.all()]
     context = {'chat_settings': chat_settings}
-    return render(request, 'moderator/settings.html', context)
+    return await async_render(request, 'moderator/settings.html', context)
 
 
 @login_required
@@ -364,6 +777,8 @@ def edit_chat_settings(request, chat_id):
         # Перемикаємо фільтр
         chat.filter_enabled = not chat.filter_enabled
         chat.save()
+        invalidate_chats([chat.chat_id])
+        run_async(db_manager.invalidate_status(chats=[chat.chat_id]))
         messages.success(request, f"Фільтр для чату оновлено: {'Увімкнено' if chat.filter_enabled else 'Вимкнено'}")
         return redirect('settings')
 
@@ -379,4 +794,8 @@ def bulk_filter_toggle(request, action):
         messages.success(request, "Фільтр слів вимкнено у всіх чатах!")
     else:
         messages.error(request, "Некоректна дія.")
+        return redirect('settings')
+    chat_ids = list(ChatSetting.objects.values_list('chat_id', flat=True))
+    invalidate_chats(chat_ids)
+    run_async(db_manager.invalidate_status(chats=chat_ids))
     return redirect('settings')
\ No newline at end of file
@@ -0,0 +1,405 @@
+import asyncio
+import heapq
+import itertools
+import random
+import statistics
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .database import db_manager, ModerationTask
+from .ratelimit import TokenBucketLimiter
+import logging
+logger = logging.getLogger(__name__)
+
+TaskHandler = Callable[[ModerationTask], Awaitable[None]]
+
+# task_type -> async handler. Заповнюється через register_handler або
+# settings.MODERATION_TASK_HANDLERS = {'ban': 'bot.handlers.ban', ...}
+_handlers: Dict[str, TaskHandler] = {}
+
+
+def register_handler(task_type: str):
+    """Декоратор: @register_handler('ban') async def ban(task): ..."""
+    def decorator(func: TaskHandler) -> TaskHandler:
+        _handlers[task_type] = func
+        return func
+    return decorator
+
+
+def load_handlers() -> Dict[str, TaskHandler]:
+    handlers = dict(_handlers)
+    for task_type, path in getattr(settings, 'MODERATION_TASK_HANDLERS', {}).items():
+        handlers[task_type] = import_string(path)
+    return handlers
+
+
+class StubExecutor:
+    """Замінник Telegram API для локального навантажувального тестування"""
+
+    def __init__(self, latency_ms: float = 50.0, jitter_ms: float = 20.0, error_rate: float = 0.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+
+    async def __call__(self, task: ModerationTask):
+        delay = max(0.0, random.gauss(self.latency_ms, self.jitter_ms)) / 1000
+        await asyncio.sleep(delay)
+        if self.error_rate and random.random() < self.error_rate:
+            raise RuntimeError(f"Stub failure for {task.task_type} {task.user_id}")
+
+
+def _entry_age_ms(entry_id: str) -> float:
+    # ID запису ("<смуга>:<ID стріму>") закінчується часом XADD у мілісекундах
+    return time.time() * 1000 - int(entry_id.rpartition(':')[2].split('-', 1)[0])
+
+
+def _lane_rank(entry_id: str) -> int:
+    lane = entry_id.rpartition(':')[0] or 'normal'
+    return db_manager.QUEUE_LANES.index(lane) if lane in db_manager.QUEUE_LANES else 1
+
+
+class QueueWorker:
+    """Асинхронний споживач черги модерації.
+
+    Читає завдання пакетами, обробляє їх паралельно (не більше concurrency
+    одночасно) і підлаштовує concurrency під довжину черги.
+
+    З limiter завдання спершу потрапляють у локальний розклад: черга на кожен чат
+    і купа чатів за часом, коли їхнє відро знову дозволить виклик. Чати
+    обслуговуються по колу, тож рейд в одному чаті не затримує інші, а завдання
+    чату, що впирається в ліміт, чекають рівно стільки, скільки потрібно відру.
+    У черзі чату завдання вищої смуги (бан) стають перед завданнями нижчих (варни).
+    Розклад вміщує не більше max_pending завдань; поки вони чекають, воркер
+    продовжує їм idle-час у PEL, щоб їх не забрав claim_stale_tasks.
+
+    Завдання, яке видавалося воркерам більше max_deliveries разів, або завдання
+    без обробника переноситься в dead-letter стрім, щоб не крутилося вічно.
+    """
+
+    def __init__(self, handlers: Dict[str, TaskHandler], consumer: str,
+                 min_concurrency: int = 1, max_concurrency: int = 32,
+                 batch_size: int = 50, block_ms: int = 1000,
+                 scale_interval: float = 5.0, claim_idle_ms: int = 60000,
+                 stats_interval: float = 30.0, limiter: Optional[TokenBucketLimiter] = None,
+                 max_pending: int = 1000, max_deliveries: int = 5):
+        self.handlers = handlers
+        self.consumer = consumer
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.concurrency = min_concurrency
+        self.batch_size = batch_size
+        self.block_ms = block_ms
+        self.scale_interval = scale_interval
+        self.claim_idle_ms = claim_idle_ms
+        self.stats_interval = stats_interval
+        self.max_deliveries = max_deliveries
+
+        self.limiter = limiter
+        self.max_pending = max_pending
+        # chat_id -> завдання чату в порядку надходження; купа (коли можна, порядковий №, chat_id)
+        self._pending: Dict[int, Deque[Tuple[str, ModerationTask]]] = {}
+        self._ready: List[Tuple[float, int, int]] = []
+        self._sequence = itertools.count()
+        self._pending_count = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self.throttled = 0
+        self.retried = 0
+
+        self._in_flight = set()
+        self._stopping = False
+        self._handler_ms = deque(maxlen=10000)
+        self._end_to_end_ms = deque(maxlen=10000)
+        self.processed = 0
+        self.failed = 0
+        self.dead_lettered = 0
+
+    def stop(self):
+        self._stopping = True
+
+    async def _handle(self, entry_id: str, task: ModerationTask):
+        handler = self.handlers.get(task.task_type)
+        started = time.perf_counter()
+        if handler is None:
+            # Повтор не допоможе: одразу в dead-letter
+            await self._dead_letter([(entry_id, task)], f"No handler for task type {task.task_type!r}")
+            return
+        try:
+            await handler(task)
+        except Exception as e:
+            retry_after = getattr(e, 'retry_after', None)
+            if self.limiter is not None and retry_after is not None:
+                # 429: відро вже спорожнене на retry_after, завдання повертається в розклад
+                self.retried += 1
+                chat_id = None if getattr(e, 'scope', 'chat') == 'global' else task.chat_id
+                await self.limiter.penalize(float(retry_after), chat_id)
+                self._schedule([(entry_id, task)], front=True)
+                return
+            # Не підтверджуємо — запис лишається в PEL і буде забраний claim_stale_tasks
+            self.failed += 1
+            logger.error(f"Task {entry_id} ({task.task_type} {task.user_id}) failed: {e}")
+            return
+        self._handler_ms.append((time.perf_counter() - started) * 1000)
+        self._end_to_end_ms.append(_entry_age_ms(entry_id))
+        self.processed += 1
+        await db_manager.ack_tasks([entry_id])
+
+    def _spawn(self, entries):
+        if self.limiter is not None:
+            self._schedule(entries)
+            return
+        self._start(entries)
+
+    def _start(self, entries):
+        for entry_id, task in entries:
+            job = asyncio.create_task(self._handle(entry_id, task))
+            self._in_flight.add(job)
+            job.add_done_callback(self._in_flight.discard)
+
+    # --- Розклад з rate limit ---
+    def _push_ready(self, chat_id: int, at: float):
+        heapq.heappush(self._ready, (at, next(self._sequence), chat_id))
+
+    def _schedule(self, entries, front: bool = False):
+        now = time.monotonic()
+        for entry in entries:
+            chat_id = entry[1].chat_id
+            queue = self._pending.get(chat_id)
+            if queue is None:
+                queue = self._pending[chat_id] = deque()
+                self._push_ready(chat_id, now)
+            if front:
+                queue.appendleft(entry)
+            else:
+                rank = _lane_rank(entry[0])
+                # Перед першим завданням нижчої смуги; в межах смуги — порядок надходження
+                position = next((i for i, queued in enumerate(queue) if _lane_rank(queued[0]) > rank),
+                                len(queue))
+                queue.insert(position, entry)
+            self._pending_count += 1
+        self._wakeup.set()
+
+    async def _wait(self, timeout: Optional[float]):
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _dispatch(self):
+        """Видає завдання обробникам з тією швидкістю, яку дозволяють відра"""
+        while not self._stopping:
+            if len(self._in_flight) >= self.concurrency:
+                await asyncio.wait(self._in_flight, return_when=asyncio.FIRST_COMPLETED)
+                continue
+            if not self._ready:
+                await self._wait(1.0)
+                continue
+            at, _, chat_id = self._ready[0]
+            delay = at - time.monotonic()
+            if delay > 0:
+                # Нове завдання чату без черги може стати готовим раніше — тому чекаємо і на _wakeup
+                await self._wait(delay)
+                continue
+            heapq.heappop(self._ready)
+            acquired = await self.limiter.acquire(chat_id)
+            if not acquired.allowed:
+                self.throttled += 1
+                self._push_ready(chat_id, time.monotonic() + acquired.wait)
+                if acquired.scope == 'global':
+                    # Усі чати впираються в те саме відро: немає сенсу пробувати інші
+                    await asyncio.sleep(acquired.wait)
+                continue
+            queue = self._pending[chat_id]
+            entry = queue.popleft()
+            self._pending_count -= 1
+            if queue:
+                # У кінець кола: спершу інші готові чати
+                self._push_ready(chat_id, time.monotonic())
+            else:
+                del self._pending[chat_id]
+            self._start([entry])
+
+    async def _keep_pending(self):
+        # Продовжує idle-час відкладених записів до спрацювання claim_stale_tasks в інших воркерів
+        while not self._stopping:
+            await asyncio.sleep(self.claim_idle_ms / 3000)
+            entry_ids = [entry_id for queue in self._pending.values() for entry_id, _ in queue]
+            try:
+                for start in range(0, len(entry_ids), 500):
+                    await db_manager.touch_tasks(self.consumer, entry_ids[start:start + 500])
+            except Exception as e:
+                logger.warning(f"Failed to refresh {len(entry_ids)} pending tasks: {e}")
+
+    async def _autoscale(self):
+        while not self._stopping:
+            await asyncio.sleep(self.scale_interval)
+            try:
+                depth = await db_manager.get_queue_length()
+            except Exception as e:
+                logger.warning(f"Queue length check failed: {e}")
+                continue
+            depth += self._pending_count
+            target = self.concurrency
+            if depth > self.concurrency * 2:
+                target = min(self.max_concurrency, self.concurrency * 2)
+            elif depth < self.concurrency // 2:
+                target = max(self.min_concurrency, self.concurrency // 2)
+            if target != self.concurrency:
+                logger.info(f"Queue depth {depth}: concurrency {self.concurrency} -> {target}")
+                self.concurrency = target
+
+    async def _reclaim(self):
+        while not self._stopping:
+            await asyncio.sleep(self.claim_idle_ms / 1000)
+            try:
+                claimed = await db_manager.claim_stale_tasks(
+                    self.consumer, self.claim_idle_ms, self.batch_size
+                )
+            except Exception as e:
+                logger.warning(f"Reclaim failed: {e}")
+                continue
+            if not claimed:
+                continue
+            try:
+                # XAUTOCLAIM вже збільшив лічильник: це кількість видач з урахуванням поточної
+                deliveries = await db_manager.delivery_counts([entry_id for entry_id, _ in claimed])
+            except Exception as e:
+                logger.warning(f"Delivery count check failed: {e}")
+                deliveries = {}
+            poisoned = [entry for entry in claimed if deliveries.get(entry[0], 0) > self.max_deliveries]
+            if poisoned:
+                await self._dead_letter(poisoned, f"Failed after {self.max_deliveries} deliveries")
+                claimed = [entry for entry in claimed if deliveries.get(entry[0], 0) <= self.max_deliveries]
+            if claimed:
+                logger.info(f"Reclaimed {len(claimed)} stale tasks")
+                self._spawn(claimed)
+
+    async def _dead_letter(self, entries, reason: str):
+        try:
+            self.dead_lettered += await db_manager.dead_letter_tasks(entries, reason)
+        except Exception as e:
+            # Лишаються в PEL: наступний _reclaim спробує ще раз
+            logger.warning(f"Failed to dead-letter {len(entries)} tasks: {e}")
+
+    async def _report(self):
+        while not self._stopping:
+            await asyncio.sleep(self.stats_interval)
+            logger.info(self.stats_line())
+
+    def stats_line(self) -> str:
+        line = (f"processed={self.processed} failed={self.failed} dead_lettered={self.dead_lettered} "
+                f"in_flight={len(self._in_flight)} concurrency={self.concurrency}")
+        if self.limiter is not None:
+            line += f" pending={self._pending_count} throttled={self.throttled} retried_429={self.retried}"
+        for label, samples in (('handler', self._handler_ms), ('end_to_end', self._end_to_end_ms)):
+            if samples:
+                ordered = sorted(samples)
+                p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+                line += f" {label}_p50={statistics.median(ordered):.1f}ms {label}_p99={p99:.1f}ms"
+        return line
+
+    async def run(self, exit_when_empty: bool = False):
+        jobs = [self._autoscale(), self._reclaim(), self._report()]
+        dispatcher = None
+        if self.limiter is not None:
+            self._wakeup = asyncio.Event()
+            jobs.append(self._keep_pending())
+            dispatcher = asyncio.create_task(self._dispatch())
+        background = [asyncio.create_task(coro) for coro in jobs]
+        try:
+            while not self._stopping:
+                if self.limiter is not None:
+                    # Читаємо наперед: розклад має бачити завдання багатьох чатів, щоб переставляти їх
+                    free = self.max_pending - self._pending_count
+                else:
+                    free = self.concurrency - len(self._in_flight)
+                if free <= 0:
+                    if self.limiter is not None:
+                        await asyncio.sleep(self.block_ms / 1000)
+                    else:
+                        await asyncio.wait(self._in_flight, return_when=asyncio.FIRST_COMPLETED)
+                    continue
+                entries = await db_manager.read_tasks(
+                    self.consumer, min(free, self.batch_size), self.block_ms
+                )
+                if entries:
+                    self._spawn(entries)
+                elif exit_when_empty and not self._in_flight and not self._pending_count:
+                    break
+            if dispatcher is not None:
+                # Відкладені завдання лишаються в PEL: їх забере claim_stale_tasks
+                dispatcher.cancel()
+            if self._in_flight:
+                await asyncio.wait(self._in_flight)
+        finally:
+            self._stopping = True
+            for job in background:
+                job.cancel()
+            if dispatcher is not None:
+                dispatcher.cancel()
+            logger.info(self.stats_line())
+
+
+class SanctionScheduler:
+    """Знімає строкові санкції за розкладом у Redis ZSET і ставить у чергу завдання unmute.
+
+    Кожні interval секунд забирає до batch_size прострочених записів; кожні
+    sync_interval секунд підтягує мути, записані ботом напряму (sync_sanctions).
+    Розклад відновлюється з active_sanctions при старті.
+    """
+
+    def __init__(self, interval: float = 1.0, batch_size: int = 500,
+                 sync_interval: float = 60.0, sync_days: int = 30):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.sync_interval = sync_interval
+        self.sync_days = sync_days
+        self.expired = 0
+        self._stopping = False
+
+    def stop(self):
+        self._stopping = True
+
+    async def tick(self) -> int:
+        total = 0
+        while True:
+            tasks = await db_manager.expire_due_sanctions(self.batch_size)
+            total += len(tasks)
+            # Повний пакет — можливо, прострочених більше; добираємо без очікування
+            if len(tasks) < self.batch_size:
+                break
+        self.expired += total
+        return total
+
+    async def _sync(self):
+        while not self._stopping:
+            await asyncio.sleep(self.sync_interval)
+            try:
+                synced = await db_manager.sync_sanctions(self.sync_days)
+                if synced:
+                    logger.info(f"Synced {synced} mutes written outside the panel")
+            except Exception as e:
+                logger.warning(f"Sanction sync failed: {e}")
+
+    async def run(self):
+        try:
+            scheduled = await db_manager.rebuild_expiry_schedule()
+            logger.info(f"Sanction scheduler started, {scheduled} expiries scheduled")
+        except Exception as e:
+            logger.warning(f"Could not rebuild expiry schedule: {e}")
+        sync = asyncio.create_task(self._sync())
+        try:
+            while not self._stopping:
+                try:
+                    expired = await self.tick()
+                    if expired:
+                        logger.info(f"Expired {expired} sanctions")
+                except Exception as e:
+                    logger.warning(f"Sanction expiry tick failed: {e}")
+                await asyncio.sleep(self.interval)
+        finally:
+            sync.cancel()
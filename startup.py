@@ -6,5 +6,5 @@ async def init_database():
     return
 
 async def shutdown_database():
-    # Опційно викликайте це у lifespan/shutdown, щоб закрити всі пулі
+    # Викликається з ASGI lifespan (asgi.py) і AsyncRuntime.shutdown: закриває пули поточного loop
     await db_manager.close_all()
\ No newline at end of file